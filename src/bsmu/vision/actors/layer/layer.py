@@ -4,8 +4,8 @@ import warnings
 from typing import TYPE_CHECKING, Generic, TypeVar
 
 import numpy as np
-from PySide6.QtCore import Qt, Signal, QRectF
-from PySide6.QtGui import QPixmap, QImage, QTransform
+from PySide6.QtCore import Qt, Signal, QPoint, QRect, QRectF
+from PySide6.QtGui import QPainter, QPixmap, QImage, QTransform
 from PySide6.QtWidgets import QGraphicsItem, QGraphicsPixmapItem
 
 import bsmu.vision.core.converters.image as image_converter
@@ -14,12 +14,12 @@ from bsmu.vision.actors.shape.registry import create_shape_actor
 from bsmu.vision.core.data.raster import Raster
 from bsmu.vision.core.image import FlatImage
 from bsmu.vision.core.layers import Layer, RasterLayer, VectorLayer
+from bsmu.vision.core.statistics import IntensityStatisticsStorage
 
 if TYPE_CHECKING:
     from pathlib import Path
 
     from PySide6.QtCore import QObject
-    from PySide6.QtGui import QPainter
     from PySide6.QtWidgets import QStyleOptionGraphicsItem, QWidget
 
     from bsmu.vision.actors.shape import VectorShapeActor
@@ -27,6 +27,7 @@ if TYPE_CHECKING:
     from bsmu.vision.core.data import Data
     from bsmu.vision.core.data.vector.shapes import VectorShape
     from bsmu.vision.core.palette import Palette
+    from bsmu.vision.core.statistics import IntensityStatistics
 
 LayerT = TypeVar('LayerT', bound=Layer)
 
@@ -161,14 +162,18 @@ class RasterLayerActor(LayerActor[RasterLayer, QGraphicsPixmapItem]):
         # Store numpy array, because QImage uses it's data without copying,
         # and QImage will crash if it's data buffer will be deleted.
         self._displayed_pixels = None
-        # Bounding boxes of modified regions, which we have to update in the `_displayed_pixels`.
-        # This field is not currently in use (full `_displayed_pixels` is recalculated). But later can be used for optimization.
-        self._modified_bboxes = []
+        # QImage created from the `_displayed_pixels`. It is used to repaint modified regions of the pixmap
+        self._display_qimage: QImage | None = None
 
         self._display_slice: Raster | None = None
 
         self.slice_number: int | None = None
 
+        # Statistics of the whole raster are shared between all actors (e.g. viewers of different volume planes),
+        # so the default intensity window is the same for all slices
+        self._intensity_statistics_storage = IntensityStatisticsStorage.instance()
+        self._intensity_statistics_storage.statistics_calculated.connect(self._on_intensity_statistics_calculated)
+
         super().__init__(model, parent)
 
     def _create_graphics_item(self) -> QGraphicsPixmapItem:
@@ -211,7 +216,9 @@ class RasterLayerActor(LayerActor[RasterLayer, QGraphicsPixmapItem]):
             current_slice = self.current_slice
             if current_slice is not None and current_slice.n_channels == 1 and not current_slice.is_indexed:
                 # Apply intensity windowing -> must NOT modify original slice.pixels
-                windowed_pixels = IntensityWindowing(current_slice.pixels).windowing_applied()
+                window_width, window_level = self.default_intensity_window()
+                windowed_pixels = IntensityWindowing(
+                    current_slice.pixels, window_width, window_level).windowing_applied()
                 self._display_slice = current_slice.with_new_pixels(windowed_pixels)
             else:
                 self._display_slice = current_slice
@@ -220,6 +227,19 @@ class RasterLayerActor(LayerActor[RasterLayer, QGraphicsPixmapItem]):
 
         return self._display_slice
 
+    def default_intensity_window(self) -> tuple[float | None, float | None]:
+        """
+        Return (window_width, window_level) based on statistics of the whole raster.
+        While the statistics are being calculated, return (None, None) to use min/max of the current slice.
+        """
+        statistics = self._intensity_statistics_storage.statistics(self.raster)
+        return (None, None) if statistics is None else statistics.default_window()
+
+    def _on_intensity_statistics_calculated(self, raster: Raster, statistics: IntensityStatistics) -> None:
+        if raster is self.raster and self._display_slice is not None and not self._display_slice.is_indexed:
+            self._display_slice = None
+            self._update_graphics_item()
+
     @property
     def current_slice(self) -> Raster | None:
         """
@@ -254,64 +274,134 @@ class RasterLayerActor(LayerActor[RasterLayer, QGraphicsPixmapItem]):
             self.scene_bounding_rect_changed.emit()
 
     def _create_display_qimage(self) -> QImage:
-        if self.display_slice.is_indexed:
-            self._displayed_pixels = self.display_slice.pixels
-            display_qimage_format = QImage.Format.Format_Indexed8
-        else:
-            # self._displayed_pixels = image_converter.converted_to_normalized_uint8(self.image.array)
-            # self._displayed_pixels = image_converter.converted_to_rgba(self._displayed_pixels)
-
-            # Conversion to RGBA will consume additional memory,
-            # but the QPainter can draw QImage.Format_RGBA8888_Premultiplied faster
-            # (when multiple layers is drawn with semi-transparency), unlike QImage.Format_RGB888.
-            # See: https://doc.qt.io/qt-6/qimage.html#Format-enum
-            self._displayed_pixels = image_converter.converted_to_rgba(self.display_slice.pixels)
-            display_qimage_format = (
-                QImage.Format.Format_RGBA8888_Premultiplied
-                if self._displayed_pixels.itemsize == 1
-                else QImage.Format.Format_RGBA64_Premultiplied
-            )
-
-        if not self._displayed_pixels.flags['C_CONTIGUOUS']:
-            self._displayed_pixels = np.ascontiguousarray(self._displayed_pixels)
+        self._displayed_pixels, display_qimage = create_display_qimage(
+            self.display_slice.pixels, self.display_slice.palette)
+        self._display_qimage = display_qimage
+        return display_qimage
 
-        display_qimage = image_converter.numpy_array_to_qimage(self._displayed_pixels, display_qimage_format)
-        if self.display_slice.is_indexed:
-            display_qimage.setColorTable(self.display_slice.palette.argb_quadruplets)
+    def show_display_qimage(self, display_qimage: QImage) -> None:
+        """
+        Show already rendered QImage (e.g. prepared in a worker thread) instead of the `display_slice`.
+        The next modification of pixels will update the graphics item from the `display_slice` again.
+        """
+        self._display_slice = None
+        self._displayed_pixels = None
+        self._display_qimage = None
+        self.graphics_item.setPixmap(QPixmap.fromImage(display_qimage))
 
-        self._modified_bboxes = []
-        return display_qimage
+    def release_display_buffers(self) -> None:
+        """
+        Release references to the raster pixels, which are kept to update the graphics item,
+        e.g. before compression of the raster pixels. The shown pixmap is kept.
+        """
+        self._display_slice = None
+        self._displayed_pixels = None
+        self._display_qimage = None
 
     def _on_layer_data_changed(self, data: Raster | None) -> None:
         self.image_changed.emit(data)
         self._on_image_pixels_modified()
 
     def _on_image_pixels_modified(self, bbox: BBox = None) -> None:  # TODO: rename the method
-        if bbox is not None:
-            self._modified_bboxes.append(bbox)
+        if bbox is not None and self._update_graphics_item_region(bbox):
+            return
 
         self._display_slice = None
 
         self._update_graphics_item()
 
+    def _update_graphics_item_region(self, bbox: BBox) -> bool:
+        """
+        Repaint only the `bbox` region of the pixmap.
+        Returns False, if the whole graphics item has to be updated instead.
+        Only indexed slices are updated partially, because the intensity windowing
+        of other slices depends on all the pixels and can change after any modification.
+        """
+        display_slice = self._display_slice
+        if display_slice is None or not display_slice.is_indexed or self._display_qimage is None \
+                or display_slice.pixels.shape != self._displayed_pixels.shape:
+            return False
+
+        bbox = bbox.clipped_to_shape(self._displayed_pixels.shape)
+        if bbox.empty:
+            return True
+
+        if self._displayed_pixels is not display_slice.pixels:
+            # `_displayed_pixels` is a contiguous copy of the slice pixels
+            bbox.pixels(self._displayed_pixels)[...] = bbox.pixels(display_slice.pixels)
+
+        pixmap = self.graphics_item.pixmap()
+        # Release the pixmap of the graphics item, so the painter will not detach (copy) the whole pixmap
+        self.graphics_item.setPixmap(QPixmap())
+        painter = QPainter(pixmap)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        painter.drawImage(
+            QPoint(bbox.left, bbox.top), self._display_qimage, QRect(bbox.left, bbox.top, bbox.width, bbox.height))
+        painter.end()
+        self.graphics_item.setPixmap(pixmap)
+        return True
+
+
+def create_display_qimage(display_pixels: np.ndarray, palette: Palette | None) -> tuple[np.ndarray, QImage]:
+    """
+    Create QImage from display-ready pixels (e.g. after intensity windowing).
+    Returns also the pixels used by the QImage without copying, so keep them alive while the QImage is used.
+    """
+    if palette is not None:
+        displayed_pixels = display_pixels
+        display_qimage_format = QImage.Format.Format_Indexed8
+    else:
+        # displayed_pixels = image_converter.converted_to_normalized_uint8(self.image.array)
+        # displayed_pixels = image_converter.converted_to_rgba(displayed_pixels)
+
+        # Conversion to RGBA will consume additional memory,
+        # but the QPainter can draw QImage.Format_RGBA8888_Premultiplied faster
+        # (when multiple layers is drawn with semi-transparency), unlike QImage.Format_RGB888.
+        # See: https://doc.qt.io/qt-6/qimage.html#Format-enum
+        displayed_pixels = image_converter.converted_to_rgba(display_pixels)
+        display_qimage_format = (
+            QImage.Format.Format_RGBA8888_Premultiplied
+            if displayed_pixels.itemsize == 1
+            else QImage.Format.Format_RGBA64_Premultiplied
+        )
+
+    if not displayed_pixels.flags['C_CONTIGUOUS']:
+        displayed_pixels = np.ascontiguousarray(displayed_pixels)
+
+    display_qimage = image_converter.numpy_array_to_qimage(displayed_pixels, display_qimage_format)
+    if palette is not None:
+        display_qimage.setColorTable(palette.argb_quadruplets)
+    return displayed_pixels, display_qimage
+
 
 class IntensityWindowing:
     def __init__(self, pixels: np.ndarray, window_width: float | None = None, window_level: float | None = None):
         self.pixels = pixels
-        # Use explicit conversion from numpy type (e.g. np.uint8) to int, to prevent possible overflow
-        pixels_min = int(pixels.min())
-        pixels_max = int(pixels.max())
+        if window_width is None or window_level is None:
+            # Use explicit conversion from numpy type (e.g. np.uint8) to int, to prevent possible overflow
+            pixels_min = int(pixels.min())
+            pixels_max = int(pixels.max())
         self.window_width = window_width if window_width is not None else \
             pixels_max - pixels_min + 1
         self.window_level = window_level if window_level is not None else \
             (pixels_max + pixels_min + 1) / 2
 
     def windowing_applied(self) -> np.ndarray:
+        if np.issubdtype(self.pixels.dtype, np.integer) and self.pixels.dtype.itemsize <= 2:
+            # Look-up table of all possible values is much faster than the piecewise calculation for every pixel
+            type_info = np.iinfo(self.pixels.dtype)
+            lut = self._windowed(np.arange(type_info.min, type_info.max + 1, dtype=np.int32))
+            if type_info.min == 0:
+                return lut[self.pixels]
+            return lut[self.pixels.astype(np.int32) - type_info.min]
+        return self._windowed(self.pixels)
+
+    def _windowed(self, pixels: np.ndarray) -> np.ndarray:
         #  https://github.com/dicompyler/dicompyler-core/blob/master/dicompylercore/dicomparser.py
         windowed_pixels = np.piecewise(
-            self.pixels,
-            [self.pixels <= (self.window_level - 0.5 - (self.window_width - 1) / 2),
-             self.pixels > (self.window_level - 0.5 + (self.window_width - 1) / 2)],
+            pixels,
+            [pixels <= (self.window_level - 0.5 - (self.window_width - 1) / 2),
+             pixels > (self.window_level - 0.5 + (self.window_width - 1) / 2)],
             [0, 255, lambda pixels:
                 ((pixels - (self.window_level - 0.5)) / (self.window_width - 1) + 0.5) * (255 - 0)])
         windowed_pixels = windowed_pixels.astype(np.uint8, copy=False)
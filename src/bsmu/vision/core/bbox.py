@@ -187,3 +187,72 @@ class BBox:
                     other.bottom - self.bottom)
         pads.max(0)
         return pads
+
+
+class VolumeBBox:
+    """
+    Axis-aligned box of a volume (3D raster).
+    Ranges along each axis are half-open: |starts| are included, |stops| are excluded.
+    """
+
+    def __init__(self, starts: Sequence[int], stops: Sequence[int]):
+        self.starts = tuple(int(start) for start in starts)
+        self.stops = tuple(int(stop) for stop in stops)
+
+    @classmethod
+    def from_slice_bbox(cls, bbox: BBox, plane_axis: int, slice_number: int) -> VolumeBBox:
+        """
+        Create volume bbox from |bbox| of a slice.
+        Rows and columns of the slice go along the remaining volume axes in increasing order.
+        """
+        row_axis, col_axis = (axis for axis in range(3) if axis != plane_axis)
+        starts = [0] * 3
+        stops = [0] * 3
+        starts[plane_axis], stops[plane_axis] = slice_number, slice_number + 1
+        starts[row_axis], stops[row_axis] = bbox.top, bbox.bottom
+        starts[col_axis], stops[col_axis] = bbox.left, bbox.right
+        return cls(starts, stops)
+
+    @classmethod
+    def from_slice(cls, volume_shape: Sequence[int], plane_axis: int, slice_number: int) -> VolumeBBox:
+        """Create volume bbox of the whole slice."""
+        starts = [0] * 3
+        stops = list(volume_shape[:3])
+        starts[plane_axis], stops[plane_axis] = slice_number, slice_number + 1
+        return cls(starts, stops)
+
+    def __str__(self):
+        ranges = ', '.join(f'{start}:{stop}' for start, stop in zip(self.starts, self.stops))
+        return f'{self.__class__.__name__} {hex(id(self))}: [{ranges}]'
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return tuple(stop - start for start, stop in zip(self.starts, self.stops))
+
+    @property
+    def empty(self) -> bool:
+        return any(stop <= start for start, stop in zip(self.starts, self.stops))
+
+    def intersects_slices(self, plane_axis: int, start: int, stop: int) -> bool:
+        """Check if the bbox intersects slices [|start|, |stop|) along the |plane_axis|."""
+        return self.starts[plane_axis] < stop and start < self.stops[plane_axis]
+
+    def contains_slice(self, plane_axis: int, slice_number: int) -> bool:
+        return self.intersects_slices(plane_axis, slice_number, slice_number + 1)
+
+    def slice_bbox(self, plane_axis: int) -> BBox:
+        """Return 2D bbox of the intersection with any slice along the |plane_axis|."""
+        row_axis, col_axis = (axis for axis in range(3) if axis != plane_axis)
+        return BBox(self.starts[col_axis], self.stops[col_axis], self.starts[row_axis], self.stops[row_axis])
+
+    def unite_with(self, other: VolumeBBox):
+        self.starts = tuple(map(min, self.starts, other.starts))
+        self.stops = tuple(map(max, self.stops, other.stops))
+
+    def united_with(self, other: VolumeBBox) -> VolumeBBox:
+        united_bbox = copy.copy(self)
+        united_bbox.unite_with(other)
+        return united_bbox
+
+    def pixels(self, array: np.ndarray) -> np.ndarray:
+        return array[tuple(slice(start, stop) for start, stop in zip(self.starts, self.stops))]
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import numpy as np
+
+_UINT8_VALUE_COUNT = 256
+
+
+def kmeans_uint8(samples: np.ndarray, cluster_count: int) -> tuple[np.ndarray, np.ndarray] | None:
+    """
+    Exact (globally optimal) k-means clustering of scalar 8-bit samples.
+    Minimizes the within-cluster sum of squared distances over the 256-bin histogram using dynamic programming
+    with prefix sums (as multi-Otsu thresholding does) in O(n + k * 256^2), which is much faster than iterative
+    k-means with several attempts. In one dimension optimal clusters are intervals of sorted values,
+    so clusters are numbered in order of brightness.
+    :return: (labels of samples, cluster centers) or None,
+    if the samples contain fewer distinct values than `cluster_count`
+    """
+    histogram = np.bincount(samples.ravel(), minlength=_UINT8_VALUE_COUNT)
+    values = np.flatnonzero(histogram)
+    value_count = len(values)
+    if value_count < cluster_count:
+        return None
+
+    counts = histogram[values].astype(np.float64)
+    # Prefix sums of counts, values and squared values of distinct sample values
+    count_prefix_sums = np.concatenate(([0], np.cumsum(counts)))
+    sum_prefix_sums = np.concatenate(([0], np.cumsum(counts * values)))
+    square_sum_prefix_sums = np.concatenate(([0], np.cumsum(counts * values.astype(np.float64) ** 2)))
+
+    # segment_costs[i, j] is the sum of squared distances to the mean of values[i:j]
+    starts = np.arange(value_count + 1)[:, np.newaxis]
+    stops = np.arange(value_count + 1)[np.newaxis, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        segment_counts = count_prefix_sums[stops] - count_prefix_sums[starts]
+        segment_sums = sum_prefix_sums[stops] - sum_prefix_sums[starts]
+        segment_costs = (square_sum_prefix_sums[stops] - square_sum_prefix_sums[starts]
+                         - segment_sums ** 2 / segment_counts)
+    segment_costs[starts >= stops] = np.inf
+
+    # costs[j] is the minimal cost of clustering of values[:j] into the current number of clusters
+    costs = segment_costs[0]
+    segment_starts_by_cluster = []
+    for _ in range(1, cluster_count):
+        total_costs = costs[:, np.newaxis] + segment_costs
+        segment_starts = np.argmin(total_costs, axis=0)
+        costs = total_costs[segment_starts, np.arange(value_count + 1)]
+        segment_starts_by_cluster.append(segment_starts)
+
+    # Backtrack boundaries of clusters
+    boundaries = [value_count]
+    for segment_starts in reversed(segment_starts_by_cluster):
+        boundaries.append(segment_starts[boundaries[-1]])
+    boundaries.append(0)
+    boundaries.reverse()
+
+    label_by_value = np.zeros(_UINT8_VALUE_COUNT, dtype=np.int32)
+    centers = np.empty(cluster_count, dtype=np.float32)
+    for cluster, (start, stop) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+        label_by_value[values[start:stop]] = cluster
+        centers[cluster] = (sum_prefix_sums[stop] - sum_prefix_sums[start]) \
+            / (count_prefix_sums[stop] - count_prefix_sums[start])
+    return label_by_value[samples], centers
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import cv2
+import numpy as np
+
+if TYPE_CHECKING:
+    from typing import Sequence
+
+    import numpy.typing as npt
+
+
+class SeededComponentFiller:
+    """
+    Extracts connected components of pixels with some value, which contain seed pixels, using flood fill.
+    Unlike labeling of all components of an image (e.g. skimage.measure.label), it visits only pixels
+    of the filled components. The mask buffer is reused between calls,
+    so an instance must not be used by several threads at the same time.
+    """
+
+    def __init__(self, connectivity: int = 8):
+        """:param connectivity: 4 or 8 (as skimage.measure.label with default connectivity of 2D images)"""
+        self._flags = connectivity | cv2.FLOODFILL_MASK_ONLY | (1 << 8)
+        self._buffer = np.empty(0, dtype=np.uint8)
+
+    def fill(
+            self,
+            image: npt.NDArray[np.uint8],
+            value: int,
+            seed_rows: Sequence[int] | np.ndarray,
+            seed_cols: Sequence[int] | np.ndarray,
+    ) -> npt.NDArray[bool]:
+        """
+        :param image: 2D image, which is not modified
+        :param value: pixels of components have to be equal to the `value`. Seeds with other values are skipped
+        :return: boolean mask of pixels of the filled components, which is valid until the next call
+        """
+        image = np.ascontiguousarray(image)
+        height, width = image.shape
+        # OpenCV requires the mask to be 2 pixels wider and taller than the image
+        mask_size = (height + 2) * (width + 2)
+        if self._buffer.size < mask_size:
+            self._buffer = np.empty(mask_size, dtype=np.uint8)
+        # Use the beginning of the flat buffer, so the mask is contiguous, and OpenCV modifies it in place
+        mask = self._buffer[:mask_size].reshape(height + 2, width + 2)
+        mask.fill(0)
+        filled_pixels = mask[1:-1, 1:-1]
+
+        for row, col in zip(seed_rows, seed_cols):
+            if image[row, col] == value and not filled_pixels[row, col]:
+                cv2.floodFill(image, mask, (int(col), int(row)), 0, 0, 0, self._flags)
+        return filled_pixels.view(bool)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import math
 import warnings
+from dataclasses import dataclass
 from enum import Enum
 from typing import TYPE_CHECKING
 
@@ -11,12 +12,14 @@ from PySide6.QtCore import Signal
 
 from bsmu.vision.core.bbox import BBox
 from bsmu.vision.core.data import Data
+from bsmu.vision.core.rle import decode_rle_by_zlib, encode_rle_by_zlib
 
 if TYPE_CHECKING:
     from pathlib import Path
 
     from PySide6.QtCore import QObject
 
+    from bsmu.vision.core.bbox import VolumeBBox
     from bsmu.vision.core.constants import PlaneAxis
     from bsmu.vision.core.palette import Palette
 
@@ -40,10 +43,34 @@ class SpatialAttrs:
         return cls(origin, spacing, direction)
 
 
+@dataclass(frozen=True)
+class CompressedPixels:
+    """Pixels compressed by zlib with RLE strategy. Masks with few classes are compressed tens of times."""
+
+    data: bytes
+    shape: tuple
+    dtype: np.dtype
+
+    @classmethod
+    def compress(cls, pixels: np.ndarray) -> CompressedPixels:
+        return cls(encode_rle_by_zlib(np.ascontiguousarray(pixels)), pixels.shape, pixels.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data)
+
+    def decompress(self) -> np.ndarray:
+        pixels = np.empty(self.shape, self.dtype)
+        decode_rle_by_zlib(self.data, out=pixels)
+        return pixels
+
+
 class Raster(Data):
     n_dims = 2  # Number of dimensions excluding channel dimension (2 for FlatImage, 3 for VolumeImage)
 
-    pixels_modified = Signal(BBox)
+    # bbox: BBox | None for 2D rasters, VolumeBBox | None for volumes (e.g. modified regions of their slices).
+    # Subscribers, which expect BBox, have to check `n_dims` of the raster
+    pixels_modified = Signal(object)
     shape_changed = Signal(object, object)  # old_shape: tuple[int] | None, new_shape: tuple[int] | None
 
     def __init__(
@@ -58,10 +85,16 @@ class Raster(Data):
 
         assert palette is None or array.dtype == np.uint8, 'Indexed images (with palette) have to be of np.uint8 type'
 
-        self.array = array
+        self._array = array
+        # Compressed form of the pixels, when the `_array` is released to decrease memory usage
+        self._compressed_pixels: CompressedPixels | None = None
         self._palette = palette
         self.spatial = spatial or SpatialAttrs.default_for_ndim(self.n_dims)
 
+        # Is increased on every modification of pixels.
+        # Compare it with a stored value to check, if pixels were modified since some moment (e.g. since the last save)
+        self._modification_generation = 0
+
         self._check_array_palette_matching()
 
     @classmethod
@@ -86,6 +119,57 @@ class Raster(Data):
             parent=self.parent(),
         )
 
+    def snapshot(self) -> Raster:
+        """
+        Return an instance with a copy of the pixels and the same modification generation,
+        e.g. to save the pixels in the background, while the original pixels are being modified.
+        """
+        # The snapshot has no parent, so it is not owned by the parent of the original,
+        # and can be released in any thread, when it is written
+        snapshot = type(self)(
+            array=self.pixels.copy(),
+            palette=self.palette,
+            path=self.path,
+            spatial=self.spatial,
+        )
+        snapshot._modification_generation = self._modification_generation
+        return snapshot
+
+    @property
+    def array(self) -> np.ndarray:
+        if self._array is None and self._compressed_pixels is not None:
+            # Decompress on the first access
+            self._array = self._compressed_pixels.decompress()
+            self._compressed_pixels = None
+        return self._array
+
+    @array.setter
+    def array(self, value: np.ndarray):
+        self._array = value
+        self._compressed_pixels = None
+
+    @property
+    def is_pixels_compressed(self) -> bool:
+        return self._compressed_pixels is not None
+
+    def compress_pixels(self, compressed_pixels: CompressedPixels | None = None) -> bool:
+        """
+        Release the pixels array and keep only its compressed form, until the pixels are accessed again.
+        The `compressed_pixels` can be prepared in advance (e.g. in a worker thread) from the current pixels.
+        All other references to the array (e.g. views of the array) have to be released too to free the memory.
+        Return True if the pixels were compressed.
+        """
+        if self._array is None:
+            return False
+
+        if compressed_pixels is None:
+            compressed_pixels = CompressedPixels.compress(self._array)
+        assert compressed_pixels.shape == self._array.shape and compressed_pixels.dtype == self._array.dtype, \
+            'Compressed pixels have to match the current pixels'
+        self._compressed_pixels = compressed_pixels
+        self._array = None
+        return True
+
     @property
     def pixels(self) -> np.ndarray:
         return self.array
@@ -95,6 +179,7 @@ class Raster(Data):
         if self.array is not value:
             old_shape = self.shape_or_none
             self.array = value
+            self._modification_generation += 1
 
             new_shape = self.shape_or_none
             if old_shape != new_shape:
@@ -102,15 +187,22 @@ class Raster(Data):
 
     @property
     def is_pixels_valid(self) -> bool:
-        return self.pixels is not None
+        return self._array is not None or self._compressed_pixels is not None
 
     @property
     def shape(self) -> tuple:
-        return self.array.shape
+        return self._compressed_pixels.shape if self._compressed_pixels is not None else self._array.shape
 
     @property
     def shape_or_none(self) -> tuple | None:
-        return None if self.array is None else self.shape
+        return self.shape if self.is_pixels_valid else None
+
+    @property
+    def pixels_nbytes(self) -> int:
+        """Return the number of bytes, which the pixels take in memory (in compressed form, if they are compressed)."""
+        if self._compressed_pixels is not None:
+            return self._compressed_pixels.nbytes
+        return 0 if self._array is None else self._array.nbytes
 
     def zeros(self, palette: Palette = None) -> Raster:
         return self.zeros_like(self, palette=palette)
@@ -118,8 +210,13 @@ class Raster(Data):
     def zeros_mask(self, palette: Palette = None) -> Raster:
         return self.zeros_mask_like(self, palette=palette)
 
-    def emit_pixels_modified(self, bbox: BBox = None):
+    @property
+    def modification_generation(self) -> int:
+        return self._modification_generation
+
+    def emit_pixels_modified(self, bbox: BBox | VolumeBBox = None):
         if bbox is None or not bbox.empty:
+            self._modification_generation += 1
             self.pixels_modified.emit(bbox)
 
     def map_spatial_to_pixel_coords(self, spatial_pos: np.ndarray) -> np.ndarray:
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import math
+import threading
+from enum import Enum
+from typing import TYPE_CHECKING
+
+import cv2
+import numpy as np
+import skimage.color
+
+from bsmu.vision.core.image.tile_cache import LevelTileCache
+
+if TYPE_CHECKING:
+    import numpy.typing as npt
+
+    from bsmu.vision.core.bbox import BBox
+
+
+class ImageFeature(Enum):
+    HEMATOXYLIN = 1  # Hematoxylin stain concentration after color deconvolution of H&E image
+    EOSIN = 2        # Eosin stain concentration after color deconvolution of H&E image
+    LIGHTNESS = 3    # L channel of the Lab color space
+    SATURATION = 4   # S channel of the HSV color space
+
+
+_STAIN_CHANNEL_BY_FEATURE = {
+    ImageFeature.HEMATOXYLIN: 0,
+    ImageFeature.EOSIN: 1,
+}
+# Maximal number of image pixels, which are sampled to estimate the range of stain concentrations
+_STAIN_RANGE_SAMPLE_SIZE = 1_000_000
+_STAIN_RANGE_PERCENTILE = 99.5
+
+
+def calculate_image_feature(
+        rgb_image: np.ndarray, feature: ImageFeature, stain_max: float | None = None) -> npt.NDArray[np.uint8]:
+    """
+    Calculate single-channel 8-bit `feature` of the RGB(A) image.
+    :param stain_max: stain concentration, which is mapped to 255 (is required for stain features)
+    """
+    rgb_image = np.ascontiguousarray(rgb_image[..., :3])
+    match feature:
+        case ImageFeature.HEMATOXYLIN | ImageFeature.EOSIN:
+            stain = skimage.color.rgb2hed(rgb_image)[..., _STAIN_CHANNEL_BY_FEATURE[feature]]
+            return np.clip(stain * (255 / stain_max), 0, 255).round().astype(np.uint8)
+        case ImageFeature.LIGHTNESS:
+            return cv2.cvtColor(rgb_image, cv2.COLOR_RGB2LAB)[..., 0]
+        case ImageFeature.SATURATION:
+            return cv2.cvtColor(rgb_image, cv2.COLOR_RGB2HSV)[..., 1]
+    raise ValueError(f'Unknown image feature: {feature}')
+
+
+def estimate_stain_max(rgb_image: np.ndarray, feature: ImageFeature) -> float:
+    """Estimate high percentile of the stain concentration using evenly strided pixels of the image."""
+    step = max(1, math.ceil(math.sqrt(rgb_image.shape[0] * rgb_image.shape[1] / _STAIN_RANGE_SAMPLE_SIZE)))
+    sampled_pixels = np.ascontiguousarray(rgb_image[::step, ::step, :3])
+    stain = skimage.color.rgb2hed(sampled_pixels)[..., _STAIN_CHANNEL_BY_FEATURE[feature]]
+    return max(float(np.percentile(stain, _STAIN_RANGE_PERCENTILE)), np.finfo(np.float32).eps)
+
+
+class ImageFeatureTileCache(LevelTileCache[np.ndarray]):
+    """
+    Calculates the 8-bit `feature` of an RGB image by tiles at scale levels.
+    So regions of the image (e.g. under a brush) are processed only once and later are only gathered from tiles.
+    """
+
+    def __init__(self, image_pixels: np.ndarray, feature: ImageFeature, size_limit: int):
+        super().__init__(image_pixels, size_limit)
+
+        self._feature = feature
+        self._stain_max: float | None = None
+        self._stain_max_lock = threading.Lock()
+
+    @property
+    def feature(self) -> ImageFeature:
+        return self._feature
+
+    def features(self, bbox: BBox, level: int) -> npt.NDArray[np.uint8]:
+        """
+        Return features of the image region at the scale `level`.
+        :param bbox: region of the image (in pixels of the image)
+        :return: features of the level region, which covers the `bbox`
+        """
+        level_bbox = self.level_bbox(bbox, level)
+        features = np.empty(level_bbox.shape, dtype=np.uint8)
+        for bbox_in_level_bbox, bbox_in_tile, tile in self.iter_tiles(level_bbox, level):
+            bbox_in_level_bbox.pixels(features)[...] = bbox_in_tile.pixels(tile)
+        return features
+
+    def _calculate_tile(self, level: int, tile_bbox: BBox) -> npt.NDArray[np.uint8]:
+        if self._feature in _STAIN_CHANNEL_BY_FEATURE:
+            with self._stain_max_lock:
+                if self._stain_max is None:
+                    self._stain_max = estimate_stain_max(self._image_pixels, self._feature)
+        return calculate_image_feature(self._level_image_tile(level, tile_bbox), self._feature, self._stain_max)
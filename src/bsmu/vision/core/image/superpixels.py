@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+import skimage.segmentation
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.image.tile_cache import LevelTileCache
+
+if TYPE_CHECKING:
+    import numpy.typing as npt
+
+    from bsmu.vision.core.image.features import ImageFeatureTileCache
+
+
+@dataclass
+class SuperpixelTile:
+    labels: npt.NDArray[np.int32]  # Superpixel labels (from 0) of tile pixels
+    descriptors: np.ndarray  # Mean value of the descriptor channel for every superpixel
+
+    @property
+    def nbytes(self) -> int:
+        return self.labels.nbytes + self.descriptors.nbytes
+
+
+class SuperpixelTileCache(LevelTileCache[SuperpixelTile]):
+    """
+    Segments an image into SLIC superpixels by tiles at scale levels, and describes every superpixel
+    by the mean value of the first image channel (or of the image feature, if `feature_tile_cache` is given).
+    Superpixels do not cross tile borders.
+    """
+
+    TILE_PIXEL_NBYTES = 4
+
+    def __init__(
+            self,
+            image_pixels: np.ndarray,
+            size_limit: int,
+            superpixel_size: float,
+            compactness: float,
+            feature_tile_cache: ImageFeatureTileCache | None = None,
+    ):
+        """
+        :param superpixel_size: average side of superpixels (in pixels of a level)
+        :param compactness: SLIC compactness. Higher values give more regular superpixels
+        """
+        super().__init__(image_pixels, size_limit)
+
+        self._superpixel_size = superpixel_size
+        self._compactness = compactness
+        self._feature_tile_cache = feature_tile_cache
+
+    @property
+    def superpixel_size(self) -> float:
+        return self._superpixel_size
+
+    @property
+    def compactness(self) -> float:
+        return self._compactness
+
+    @property
+    def feature_tile_cache(self) -> ImageFeatureTileCache | None:
+        return self._feature_tile_cache
+
+    def superpixels(self, bbox: BBox, level: int) -> tuple[npt.NDArray[np.int32], np.ndarray]:
+        """
+        Return superpixels of the image region at the scale `level`.
+        :param bbox: region of the image (in pixels of the image)
+        :return: (superpixel labels of the level region, which covers the `bbox`, descriptors of the labels)
+        """
+        level_bbox = self.level_bbox(bbox, level)
+        labels = np.empty(level_bbox.shape, dtype=np.int32)
+        tile_descriptors = []
+        label_offset = 0
+        for bbox_in_level_bbox, bbox_in_tile, tile in self.iter_tiles(level_bbox, level):
+            # Make labels of different tiles different
+            bbox_in_level_bbox.pixels(labels)[...] = bbox_in_tile.pixels(tile.labels) + label_offset
+            tile_descriptors.append(tile.descriptors)
+            label_offset += len(tile.descriptors)
+        return labels, np.concatenate(tile_descriptors)
+
+    def _calculate_tile(self, level: int, tile_bbox: BBox) -> SuperpixelTile:
+        image_tile = self._level_image_tile(level, tile_bbox)
+        is_multichannel = image_tile.ndim == 3
+        segment_count = max(1, round(tile_bbox.element_count / self._superpixel_size ** 2))
+        labels = skimage.segmentation.slic(
+            image_tile[..., :3] if is_multichannel else image_tile,
+            n_segments=segment_count,
+            compactness=self._compactness,
+            start_label=0,
+            channel_axis=-1 if is_multichannel else None,
+        ).astype(np.int32)
+
+        if self._feature_tile_cache is None:
+            descriptor_channel = image_tile[..., 0] if is_multichannel else image_tile
+        else:
+            level_factor = 2 ** level
+            image_tile_bbox = BBox(
+                tile_bbox.left * level_factor, tile_bbox.right * level_factor,
+                tile_bbox.top * level_factor, tile_bbox.bottom * level_factor)
+            descriptor_channel = self._feature_tile_cache.features(image_tile_bbox, level)
+
+        flat_labels = labels.ravel()
+        pixel_counts = np.bincount(flat_labels)
+        descriptor_sums = np.bincount(flat_labels, weights=descriptor_channel.ravel())
+        descriptors = descriptor_sums / np.maximum(pixel_counts, 1)
+        if np.issubdtype(descriptor_channel.dtype, np.integer):
+            descriptors = descriptors.round()
+        return SuperpixelTile(labels, descriptors.astype(descriptor_channel.dtype))
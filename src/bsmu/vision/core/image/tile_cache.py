@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import math
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Generic, TypeVar
+
+import cv2
+
+from bsmu.vision.core.bbox import BBox
+
+if TYPE_CHECKING:
+    from typing import Iterator
+
+    import numpy as np
+
+
+# Type of tiles. They have to provide `nbytes` attribute (as numpy arrays)
+TileT = TypeVar('TileT')
+
+
+class LevelTileCache(Generic[TileT]):
+    """
+    Base class of caches of data, which are calculated lazily by tiles of an image at scale levels
+    (level L is downscaled by 2^L). Least recently used tiles are kept within the size limit.
+    Tiles can be requested from worker threads.
+    """
+
+    TILE_SIZE = 256
+    # Approximate size of tile data per pixel, which is used to estimate sizes of not calculated tiles
+    TILE_PIXEL_NBYTES = 1
+
+    def __init__(self, image_pixels: np.ndarray, size_limit: int):
+        """
+        :param image_pixels: the image has to be not modified, else create a new cache
+        :param size_limit: maximal size of cached tiles in bytes
+        """
+        self._image_pixels = image_pixels
+        self._size_limit = size_limit
+
+        self._tile_by_key: OrderedDict[tuple[int, int, int], TileT] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def image_pixels(self) -> np.ndarray:
+        return self._image_pixels
+
+    @property
+    def size_limit(self) -> int:
+        return self._size_limit
+
+    @staticmethod
+    def scale_level(scale: float) -> int:
+        """Return the coarsest scale level, which resolution is not less than the `scale` (in (0; 1])."""
+        return max(0, math.floor(math.log2(1 / scale) + 1e-9))
+
+    def level_shape(self, level: int) -> tuple[int, int]:
+        level_factor = 2 ** level
+        return -(-self._image_pixels.shape[0] // level_factor), -(-self._image_pixels.shape[1] // level_factor)
+
+    def level_bbox(self, bbox: BBox, level: int) -> BBox:
+        """Return the region of the `level`, which covers the `bbox` of the image."""
+        level_factor = 2 ** level
+        return BBox(
+            bbox.left // level_factor, -(-bbox.right // level_factor),
+            bbox.top // level_factor, -(-bbox.bottom // level_factor),
+        ).clipped_to_shape(self.level_shape(level))
+
+    def iter_tiles(self, level_bbox: BBox, level: int) -> Iterator[tuple[BBox, BBox, TileT]]:
+        """
+        Yield (intersection bbox in coordinates of the `level_bbox`, intersection bbox in coordinates of the tile,
+        tile) for all tiles, which intersect the `level_bbox`. Missed tiles are calculated.
+        """
+        for tile_row in range(level_bbox.top // self.TILE_SIZE, -(-level_bbox.bottom // self.TILE_SIZE)):
+            for tile_col in range(level_bbox.left // self.TILE_SIZE, -(-level_bbox.right // self.TILE_SIZE)):
+                tile_bbox = self._tile_bbox(level, tile_row, tile_col)
+                intersection_bbox = BBox(
+                    max(tile_bbox.left, level_bbox.left), min(tile_bbox.right, level_bbox.right),
+                    max(tile_bbox.top, level_bbox.top), min(tile_bbox.bottom, level_bbox.bottom))
+                tile = self._tile(level, tile_row, tile_col, tile_bbox)
+                yield intersection_bbox.mapped_to_bbox(level_bbox), intersection_bbox.mapped_to_bbox(tile_bbox), tile
+
+    def precalculate_tiles(self, bbox: BBox, level: int):
+        """
+        Calculate missed tiles, which intersect the `bbox` of the image (e.g. visible region) in the background.
+        Stops, when the size limit is reached, so cached tiles are not evicted.
+        """
+        level_bbox = self.level_bbox(bbox, level)
+        for tile_row in range(level_bbox.top // self.TILE_SIZE, -(-level_bbox.bottom // self.TILE_SIZE)):
+            for tile_col in range(level_bbox.left // self.TILE_SIZE, -(-level_bbox.right // self.TILE_SIZE)):
+                with self._lock:
+                    if (level, tile_row, tile_col) in self._tile_by_key:
+                        continue
+                    if self._size + self.TILE_SIZE * self.TILE_SIZE * self.TILE_PIXEL_NBYTES > self._size_limit:
+                        return
+                self._tile(level, tile_row, tile_col, self._tile_bbox(level, tile_row, tile_col))
+
+    def _tile_bbox(self, level: int, tile_row: int, tile_col: int) -> BBox:
+        level_height, level_width = self.level_shape(level)
+        tile_top = tile_row * self.TILE_SIZE
+        tile_left = tile_col * self.TILE_SIZE
+        return BBox(
+            tile_left, min(tile_left + self.TILE_SIZE, level_width),
+            tile_top, min(tile_top + self.TILE_SIZE, level_height))
+
+    def _tile(self, level: int, tile_row: int, tile_col: int, tile_bbox: BBox) -> TileT:
+        key = (level, tile_row, tile_col)
+        with self._lock:
+            tile = self._tile_by_key.get(key)
+            if tile is not None:
+                self._tile_by_key.move_to_end(key)
+                return tile
+
+        # Calculate the tile without the lock, so other threads are not blocked
+        tile = self._calculate_tile(level, tile_bbox)
+
+        with self._lock:
+            if key not in self._tile_by_key:
+                self._tile_by_key[key] = tile
+                self._size += tile.nbytes
+                while self._size > self._size_limit and len(self._tile_by_key) > 1:
+                    _, evicted_tile = self._tile_by_key.popitem(last=False)
+                    self._size -= evicted_tile.nbytes
+        return tile
+
+    def _level_image_tile(self, level: int, tile_bbox: BBox) -> np.ndarray:
+        """Return pixels of the image region of the tile, downscaled to the tile size."""
+        level_factor = 2 ** level
+        image_tile_bbox = BBox(
+            tile_bbox.left * level_factor, tile_bbox.right * level_factor,
+            tile_bbox.top * level_factor, tile_bbox.bottom * level_factor,
+        ).clipped_to_shape(self._image_pixels.shape)
+        image_tile = image_tile_bbox.pixels(self._image_pixels)
+        if level > 0:
+            image_tile = cv2.resize(image_tile, tile_bbox.size, interpolation=cv2.INTER_AREA)
+        return image_tile
+
+    def _calculate_tile(self, level: int, tile_bbox: BBox) -> TileT:
+        raise NotImplementedError
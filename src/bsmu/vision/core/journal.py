@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.concurrent import ThreadPool
+from bsmu.vision.core.rle import encode_rle_by_zlib
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from typing import Callable
+
+    from bsmu.vision.core.task import Task
+
+
+_MAGIC = b'BSMUMJ01'
+# Magic, mask height, mask width
+_HEADER_STRUCT = struct.Struct('<8sII')
+# Mask modification generation, bbox (left, right, top, bottom), payload size, payload CRC32
+_RECORD_HEADER_STRUCT = struct.Struct('<QiiiiII')
+_GENERATION_STRUCT = struct.Struct('<Q')
+
+
+@dataclass
+class MaskJournalRecord:
+    offset: int  # Offset of the record in the journal file
+    generation: int
+    bbox: BBox
+    payload: bytes | None = None  # zlib-RLE compressed pixels of the bbox
+
+    def bbox_pixels(self) -> np.ndarray:
+        return np.frombuffer(zlib.decompress(self.payload), dtype=np.uint8).reshape(self.bbox.shape)
+
+
+class MaskJournal:
+    """
+    Append-only journal of modifications of a 2D mask, which protects unsaved changes between mask savings.
+
+    Every record contains the modification generation of the mask, the modified bbox
+    and compressed pixels of the bbox after the modification. The records contain final pixel values,
+    so their replaying onto the last saved mask (or even onto a newer one) restores the latest journaled pixels.
+    Pixels of records are copied, compressed and written in the background, one batch of operations at a time,
+    so they keep their order.
+    Records of saved generations are dropped by the `truncate` method.
+    A torn record at the end of the file (e.g. after a crash) is ignored.
+    """
+
+    SUFFIX = '.journal'
+
+    def __init__(self, path: Path, mask_shape: tuple[int, int]):
+        self._path = path
+        self._mask_shape = mask_shape
+
+        self._pending_operations: list[Callable] = []
+        self._flush_task: Task | None = None
+
+        # Records without payloads. Are accessed only by the operations in the flush task
+        self._records: list[MaskJournalRecord] = []
+        self._file_size = 0
+        if self._path.exists():
+            read_mask_shape, self._records, self._file_size = self.read_records(self._path, read_payloads=False)
+            if read_mask_shape != self._mask_shape:
+                raise ValueError(f'Mask journal {self._path} is written for other mask shape: {read_mask_shape}')
+
+    @staticmethod
+    def path_for_mask(mask_path: Path) -> Path:
+        return mask_path.with_name(mask_path.name + MaskJournal.SUFFIX)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def is_flushing(self) -> bool:
+        return self._flush_task is not None
+
+    @staticmethod
+    def read_records(
+            path: Path, read_payloads: bool = True) -> tuple[tuple[int, int] | None, list[MaskJournalRecord], int]:
+        """
+        Return (mask shape, records, size of the valid part of the file).
+        Reading stops at the first incomplete or corrupted record.
+        """
+        data = path.read_bytes()
+        if len(data) < _HEADER_STRUCT.size:
+            return None, [], 0
+
+        magic, height, width = _HEADER_STRUCT.unpack_from(data)
+        if magic != _MAGIC:
+            return None, [], 0
+
+        records = []
+        offset = _HEADER_STRUCT.size
+        while offset + _RECORD_HEADER_STRUCT.size <= len(data):
+            generation, left, right, top, bottom, payload_size, payload_crc = \
+                _RECORD_HEADER_STRUCT.unpack_from(data, offset)
+            payload_start = offset + _RECORD_HEADER_STRUCT.size
+            payload = data[payload_start:payload_start + payload_size]
+            if len(payload) != payload_size or zlib.crc32(payload) != payload_crc:
+                logging.warning(f'Mask journal {path} has a torn record at offset {offset}')
+                break
+
+            records.append(
+                MaskJournalRecord(offset, generation, BBox(left, right, top, bottom), payload if read_payloads else None))
+            offset = payload_start + payload_size
+        return (height, width), records, offset
+
+    @classmethod
+    def replay(cls, path: Path, pixels: np.ndarray) -> int:
+        """Apply records of the journal to the `pixels`. Return the number of applied records."""
+        mask_shape, records, _ = cls.read_records(path)
+        if mask_shape != pixels.shape:
+            raise ValueError(f'Mask journal {path} is written for other mask shape: {mask_shape}')
+
+        for record in records:
+            record.bbox.pixels(pixels)[...] = record.bbox_pixels()
+        return len(records)
+
+    def append(self, generation: int, bbox: BBox, pixels: np.ndarray):
+        """
+        :param pixels: all mask pixels after the modification. Pixels of the `bbox` are copied in the background,
+        so they can contain newer modifications too. It is fine, because newer modifications are journaled
+        by next records, which are replayed later.
+        """
+        self._schedule(partial(self._write_record, generation, bbox, pixels))
+
+    def truncate(self, saved_generation: int):
+        """Drop records of generations, which are not newer than the `saved_generation`."""
+        self._schedule(partial(self._drop_records, saved_generation))
+
+    def discard(self):
+        """Remove the journal file after the scheduled operations, e.g. when the mask is moved to another path."""
+        self._schedule(self._remove_file)
+
+    def reset_generations(self, generation: int):
+        """Set the `generation` to all written records, e.g. after the replay in a new session of the mask."""
+        self._schedule(partial(self._write_generations, generation))
+
+    def _schedule(self, operation: Callable):
+        self._pending_operations.append(operation)
+        if not self.is_flushing:
+            self._start_flush()
+
+    def _start_flush(self):
+        operations = self._pending_operations
+        self._pending_operations = []
+        self._flush_task = ThreadPool.call_async(self._run_operations, operations)
+        self._flush_task.on_finished = self._on_flush_finished
+
+    def _on_flush_finished(self, _result):
+        self._flush_task = None
+        if self._pending_operations:
+            self._start_flush()
+
+    def _run_operations(self, operations: list[Callable]):
+        for operation in operations:
+            try:
+                operation()
+            except OSError as e:
+                logging.error(f'Cannot write mask journal {self._path}: {e}')
+            except Exception:
+                # Else the flush task is not finished, and next operations are never run
+                logging.exception(f'Cannot run operation of mask journal {self._path}')
+
+    def _write_record(self, generation: int, bbox: BBox, pixels: np.ndarray):
+        payload = encode_rle_by_zlib(np.ascontiguousarray(bbox.pixels(pixels)))
+        record_header = _RECORD_HEADER_STRUCT.pack(
+            generation, bbox.left, bbox.right, bbox.top, bbox.bottom, len(payload), zlib.crc32(payload))
+        with open(self._path, 'r+b' if self._file_size > 0 else 'wb') as file:
+            if self._file_size == 0:
+                file.write(_HEADER_STRUCT.pack(_MAGIC, *self._mask_shape))
+                self._file_size = _HEADER_STRUCT.size
+            # Overwrite a possible torn record at the end of the file
+            file.seek(self._file_size)
+            file.write(record_header)
+            file.write(payload)
+            file.truncate()
+        self._records.append(MaskJournalRecord(self._file_size, generation, bbox))
+        self._file_size += len(record_header) + len(payload)
+
+    def _drop_records(self, saved_generation: int):
+        kept_records = [record for record in self._records if record.generation > saved_generation]
+        if not kept_records:
+            self._remove_file()
+            return
+
+        if len(kept_records) == len(self._records):
+            return
+
+        # Records are appended in order of generations, so the kept records are at the end of the file
+        kept_start = kept_records[0].offset
+        with open(self._path, 'rb') as file:
+            file.seek(kept_start)
+            kept_data = file.read(self._file_size - kept_start)
+        # Replace the file atomically, so the kept records are not lost, if the writing is interrupted
+        temp_path = self._path.with_name(self._path.name + '.tmp')
+        with open(temp_path, 'wb') as file:
+            file.write(_HEADER_STRUCT.pack(_MAGIC, *self._mask_shape))
+            file.write(kept_data)
+        os.replace(temp_path, self._path)
+
+        offset_shift = kept_start - _HEADER_STRUCT.size
+        for record in kept_records:
+            record.offset -= offset_shift
+        self._records = kept_records
+        self._file_size = _HEADER_STRUCT.size + len(kept_data)
+
+    def _remove_file(self):
+        self._path.unlink(missing_ok=True)
+        self._records = []
+        self._file_size = 0
+
+    def _write_generations(self, generation: int):
+        if not self._records:
+            return
+
+        packed_generation = _GENERATION_STRUCT.pack(generation)
+        with open(self._path, 'r+b') as file:
+            for record in self._records:
+                file.seek(record.offset)
+                file.write(packed_generation)
+                record.generation = generation
@@ -6,7 +6,6 @@ from typing import Generic, TypeVar, TYPE_CHECKING
 
 from PySide6.QtCore import QObject, Signal
 
-from bsmu.vision.core.bbox import BBox
 from bsmu.vision.core.data import Data
 from bsmu.vision.core.data.raster import Raster
 from bsmu.vision.core.data.vector import Vector
@@ -173,7 +172,8 @@ class Layer(QObject, Generic[DataT]):
 
 class RasterLayer(Layer[Raster]):
     image_shape_changed = Signal(object, object)  # TODO: rename into raster_shape_changed
-    image_pixels_modified = Signal(BBox)  # TODO: rename into raster_pixels_modified
+    # bbox: BBox | VolumeBBox | None, see the `Raster.pixels_modified` signal
+    image_pixels_modified = Signal(object)  # TODO: rename into raster_pixels_modified
 
     def __init__(
             self,
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from bsmu.vision.core.data.raster import Raster, SpatialAttrs
+
+if TYPE_CHECKING:
+    from typing import Sequence
+
+    from bsmu.vision.core.bbox import BBox
+
+
+class ObliquePlane:
+    """
+    Plane in spatial (physical, e.g. mm) coordinates of a volume.
+    It is defined by the `center` point and two orthogonal unit vectors:
+    `row_axis` (direction of increasing rows of the resampled image)
+    and `col_axis` (direction of increasing columns).
+    """
+
+    def __init__(self, center: Sequence[float], row_axis: Sequence[float], col_axis: Sequence[float]):
+        self.center = np.asarray(center, dtype=np.float64)
+        self.row_axis = self._normalized(row_axis)
+        self.col_axis = self._normalized(col_axis)
+
+    @classmethod
+    def from_normal(
+            cls,
+            center: Sequence[float],
+            normal: Sequence[float],
+            up: Sequence[float] = (1, 0, 0),
+    ) -> ObliquePlane:
+        """Create a plane from its normal. The `up` vector is projected onto the plane to get the row axis."""
+        normal = cls._normalized(normal)
+        up = np.asarray(up, dtype=np.float64)
+        row_axis = up - np.dot(up, normal) * normal
+        if np.linalg.norm(row_axis) < 1e-6:
+            # `up` is parallel to the normal, so take any other axis
+            up = np.roll(up, 1)
+            row_axis = up - np.dot(up, normal) * normal
+        row_axis = cls._normalized(row_axis)
+        col_axis = np.cross(normal, row_axis)
+        return cls(center, row_axis, col_axis)
+
+    @property
+    def normal(self) -> np.ndarray:
+        return np.cross(self.row_axis, self.col_axis)
+
+    def moved(self, distance: float) -> ObliquePlane:
+        """Return the parallel plane shifted by `distance` along the normal."""
+        return ObliquePlane(self.center + distance * self.normal, self.row_axis, self.col_axis)
+
+    @staticmethod
+    def _normalized(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float64)
+        return vector / np.linalg.norm(vector)
+
+
+class MprResampler:
+    """
+    Multiplanar reformatting (MPR): resamples arbitrary oblique planes of a volume
+    using vectorized trilinear interpolation.
+
+    Sample coordinates depend only on the plane orientation, so they are cached per orientation,
+    and moving the plane along its normal costs only one vector addition.
+    All intermediate and output arrays are preallocated and reused between calls.
+    """
+
+    COORDS_CACHE_SIZE = 8
+
+    def __init__(
+            self,
+            volume: Raster,
+            output_shape: Sequence[int],
+            output_spacing: Sequence[float] | None = None,
+            fill_value: float = 0,
+    ):
+        """
+        :param volume: raster with 3 spatial dimensions: (D, H, W) or (D, H, W, C)
+        :param output_shape: (rows, cols) of the full resampled plane
+        :param output_spacing: spatial size of output pixel (row, col).
+        If None, then the minimal volume spacing is used for both axes
+        """
+        self._volume = volume
+        # Flat gathering requires contiguous pixels. The copy is done once per resampler.
+        self._pixels = np.ascontiguousarray(volume.pixels)
+        self._spatial_shape = np.array(self._pixels.shape[:3])
+        self._channel_count = 1 if self._pixels.ndim == 3 else self._pixels.shape[3]
+        self._flat_pixels = self._pixels.reshape(-1, self._channel_count)
+        self._flat_strides = np.array([self._spatial_shape[1] * self._spatial_shape[2], self._spatial_shape[2], 1])
+
+        self.output_shape = tuple(output_shape)
+        self.output_spacing = np.array(
+            output_spacing if output_spacing is not None else [np.min(volume.spatial.spacing)] * 2, dtype=np.float64)
+        self.fill_value = fill_value
+
+        # Matrix and offset to convert spatial coordinates into continuous pixel coordinates:
+        # pixel = inv(direction) @ (spatial - origin) / spacing
+        spatial = volume.spatial
+        self._spatial_to_pixel_matrix = (
+                np.linalg.inv(np.asarray(spatial.direction, dtype=np.float64))
+                / np.asarray(spatial.spacing, dtype=np.float64)[:, np.newaxis])
+        self._origin = np.asarray(spatial.origin, dtype=np.float64)
+
+        self._coords_cache: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self._buffers_by_shape: dict[tuple, _ResampleBuffers] = {}
+
+    @property
+    def volume(self) -> Raster:
+        return self._volume
+
+    def map_spatial_to_pixel_coords(self, spatial_pos: np.ndarray) -> np.ndarray:
+        return self._spatial_to_pixel_matrix @ (np.asarray(spatial_pos, dtype=np.float64) - self._origin)
+
+    def resample(
+            self,
+            plane: ObliquePlane,
+            region: BBox | None = None,
+            step: int = 1,
+            out: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """
+        Resample the `plane`.
+        :param region: part of the output plane (e.g. visible region of a viewer) to resample.
+        If None, then the full `output_shape` is resampled
+        :param step: take every `step`-th output pixel. Use values > 1 to get a fast preview while interacting
+        :param out: optional array to write the result to
+        :return: array of (region rows / step, region cols / step) or (..., C) shape with volume pixels type.
+        The returned array is reused by the next call with the same region shape, if `out` is not passed
+        """
+        relative_coords = self._relative_coords(plane, region, step)
+        result_shape = relative_coords.shape[1:]
+        buffers = self._buffers(result_shape)
+
+        base_pixel_coords = self.map_spatial_to_pixel_coords(plane.center)
+        coords = buffers.coords
+        np.add(relative_coords, base_pixel_coords.astype(np.float32)[:, np.newaxis, np.newaxis], out=coords)
+
+        # Mark samples outside the volume
+        valid = buffers.valid
+        valid.fill(True)
+        for axis in range(3):
+            valid &= coords[axis] >= 0
+            valid &= coords[axis] <= self._spatial_shape[axis] - 1
+
+        # Lower corner indexes are clipped to [0, dim - 2], so upper corner is always inside the volume.
+        # Fractions are calculated after the clipping, so samples on the last pixel get fraction equal to 1
+        lower = buffers.lower
+        fractions = buffers.fractions
+        flat_index = buffers.flat_index
+        flat_index.fill(0)
+        for axis in range(3):
+            np.floor(coords[axis], out=fractions[axis])
+            np.clip(fractions[axis], 0, max(self._spatial_shape[axis] - 2, 0), out=fractions[axis])
+            lower[axis] = fractions[axis]
+            np.subtract(coords[axis], fractions[axis], out=fractions[axis])
+            flat_index += lower[axis] * self._flat_strides[axis]
+
+        # Step to the upper corner along each axis (0 for degenerate axes of size 1)
+        corner_steps = np.where(self._spatial_shape > 1, self._flat_strides, 0)
+
+        result = buffers.accumulator
+        result.fill(0)
+        corner_index = buffers.corner_index
+        corner_weight = buffers.corner_weight
+        corner_values = buffers.corner_values
+        weighted_values = buffers.weighted_values
+        for corner in np.ndindex(2, 2, 2):
+            np.add(flat_index, int(np.dot(corner, corner_steps)), out=corner_index)
+            corner_weight.fill(1)
+            for axis, is_upper in enumerate(corner):
+                if is_upper:
+                    corner_weight *= fractions[axis]
+                else:
+                    corner_weight *= 1 - fractions[axis]
+            np.take(self._flat_pixels, corner_index, axis=0, out=corner_values)
+            np.multiply(corner_values, corner_weight[..., np.newaxis], out=weighted_values, casting='unsafe')
+            result += weighted_values
+
+        result[~valid] = self.fill_value
+
+        if out is None:
+            out = buffers.output
+        if np.issubdtype(out.dtype, np.integer):
+            np.rint(result, out=result)
+            dtype_info = np.iinfo(out.dtype)
+            np.clip(result, dtype_info.min, dtype_info.max, out=result)
+        out_view = out if out.ndim == 3 else out[..., np.newaxis]
+        out_view[...] = result
+        return out
+
+    def resample_raster(
+            self, plane: ObliquePlane, region: BBox | None = None, step: int = 1) -> Raster:
+        """Resample the `plane` into a new 2D raster with spacing of the resampled plane."""
+        pixels = self.resample(plane, region, step).copy()
+        spatial = SpatialAttrs(
+            origin=np.zeros(2),
+            spacing=self.output_spacing * step,
+            direction=np.identity(2),
+        )
+        return Raster(pixels, self._volume.palette, spatial=spatial)
+
+    def _relative_coords(self, plane: ObliquePlane, region: BBox | None, step: int) -> np.ndarray:
+        """
+        Return (3, rows, cols) array of pixel coordinates relative to the plane center.
+        They depend only on the plane orientation, so are cached.
+        """
+        if region is None:
+            rows_range = (0, self.output_shape[0])
+            cols_range = (0, self.output_shape[1])
+        else:
+            rows_range = (region.top, region.bottom)
+            cols_range = (region.left, region.right)
+
+        key = (
+            tuple(np.round(plane.row_axis, 9)),
+            tuple(np.round(plane.col_axis, 9)),
+            rows_range,
+            cols_range,
+            step,
+        )
+        coords = self._coords_cache.get(key)
+        if coords is not None:
+            self._coords_cache.move_to_end(key)
+            return coords
+
+        center_row = (self.output_shape[0] - 1) / 2
+        center_col = (self.output_shape[1] - 1) / 2
+        rows = (np.arange(*rows_range, step) - center_row) * self.output_spacing[0]
+        cols = (np.arange(*cols_range, step) - center_col) * self.output_spacing[1]
+        row_step = self._spatial_to_pixel_matrix @ plane.row_axis
+        col_step = self._spatial_to_pixel_matrix @ plane.col_axis
+        coords = (row_step[:, np.newaxis, np.newaxis] * rows[np.newaxis, :, np.newaxis]
+                  + col_step[:, np.newaxis, np.newaxis] * cols[np.newaxis, np.newaxis, :])
+        coords = coords.astype(np.float32)
+
+        self._coords_cache[key] = coords
+        if len(self._coords_cache) > self.COORDS_CACHE_SIZE:
+            self._coords_cache.popitem(last=False)
+        return coords
+
+    def _buffers(self, shape: tuple[int, int]) -> _ResampleBuffers:
+        buffers = self._buffers_by_shape.get(shape)
+        if buffers is None:
+            buffers = _ResampleBuffers(shape, self._channel_count, self._pixels.dtype)
+            self._buffers_by_shape[shape] = buffers
+        return buffers
+
+
+class _ResampleBuffers:
+    def __init__(self, shape: tuple[int, int], channel_count: int, dtype: np.dtype):
+        self.coords = np.empty((3, *shape), dtype=np.float32)
+        self.fractions = np.empty((3, *shape), dtype=np.float32)
+        self.lower = np.empty((3, *shape), dtype=np.int64)
+        self.valid = np.empty(shape, dtype=bool)
+        self.flat_index = np.empty(shape, dtype=np.int64)
+        self.corner_index = np.empty(shape, dtype=np.int64)
+        self.corner_weight = np.empty(shape, dtype=np.float32)
+        self.corner_values = np.empty((*shape, channel_count), dtype=dtype)
+        self.weighted_values = np.empty((*shape, channel_count), dtype=np.float32)
+        self.accumulator = np.empty((*shape, channel_count), dtype=np.float32)
+        self.output = np.empty(shape if channel_count == 1 else (*shape, channel_count), dtype=dtype)
@@ -170,3 +170,10 @@ class Palette:
         if not isinstance(row_index, int):
             raise KeyError(f'`{name}` not found in the dictionary and no valid default integer value provided.')
         return row_index
+
+    def row_name(self, row_index: int, default: str | None = None) -> str | None:
+        if self._row_index_by_name:
+            for name, named_row_index in self._row_index_by_name.items():
+                if named_row_index == row_index:
+                    return name
+        return default
@@ -0,0 +1,93 @@
+"""
+Minimal PNG chunk manipulations to convert between 8-bit grayscale and 8-bit palette PNGs.
+Both formats have the same image data (one byte per pixel), so only the header and palette chunks differ.
+It allows to encode and decode indexed masks using OpenCV, which has no palette PNG support.
+"""
+
+from __future__ import annotations
+
+import struct
+import zlib
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from bsmu.vision.core.palette import Palette
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+_IHDR_DATA_LEN = 13
+_IHDR_BIT_DEPTH_OFFSET = 8
+_IHDR_COLOR_TYPE_OFFSET = 9
+
+_GRAY_COLOR_TYPE = 0
+_PALETTE_COLOR_TYPE = 3
+
+
+def _chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def _split_chunks(png: bytes) -> list[tuple[bytes, bytes]] | None:
+    """Return list of (chunk type, chunk data) or None, if `png` is not a PNG."""
+    if not png.startswith(PNG_SIGNATURE):
+        return None
+
+    chunks = []
+    offset = len(PNG_SIGNATURE)
+    while offset + 8 <= len(png):
+        data_len, chunk_type = struct.unpack_from('>I4s', png, offset)
+        data_start = offset + 8
+        chunks.append((chunk_type, png[data_start:data_start + data_len]))
+        offset = data_start + data_len + 4  # Skip the CRC
+    return chunks
+
+
+def _joined_chunks(chunks: list[tuple[bytes, bytes]]) -> bytes:
+    return PNG_SIGNATURE + b''.join(_chunk(chunk_type, data) for chunk_type, data in chunks)
+
+
+def gray_png_to_palette_png(png: bytes, palette: Palette) -> bytes:
+    """Convert 8-bit grayscale PNG into 8-bit palette PNG, where gray values are palette indices."""
+    chunks = _split_chunks(png)
+    ihdr_type, ihdr = chunks[0]
+    assert ihdr_type == b'IHDR' and len(ihdr) == _IHDR_DATA_LEN \
+        and ihdr[_IHDR_BIT_DEPTH_OFFSET] == 8 and ihdr[_IHDR_COLOR_TYPE_OFFSET] == _GRAY_COLOR_TYPE, \
+        'PNG has to be 8-bit grayscale'
+
+    ihdr = bytearray(ihdr)
+    ihdr[_IHDR_COLOR_TYPE_OFFSET] = _PALETTE_COLOR_TYPE
+
+    palette_array = np.asarray(palette.array, dtype=np.uint8)
+    palette_chunks = [(b'PLTE', palette_array[:, :3].tobytes())]
+    alphas = palette_array[:, 3]
+    if (alphas != 255).any():
+        # tRNS chunk can omit trailing opaque entries
+        last_transparent_index = np.flatnonzero(alphas != 255)[-1]
+        palette_chunks.append((b'tRNS', alphas[:last_transparent_index + 1].tobytes()))
+
+    return _joined_chunks([(b'IHDR', bytes(ihdr)), *palette_chunks, *chunks[1:]])
+
+
+def palette_png_to_gray_png(png: bytes) -> bytes | None:
+    """
+    Convert 8-bit palette PNG into 8-bit grayscale PNG, where gray values are palette indices.
+    Return None, if `png` is not an 8-bit palette PNG.
+    """
+    chunks = _split_chunks(png)
+    if not chunks:
+        return None
+
+    ihdr_type, ihdr = chunks[0]
+    if ihdr_type != b'IHDR' or len(ihdr) != _IHDR_DATA_LEN \
+            or ihdr[_IHDR_BIT_DEPTH_OFFSET] != 8 or ihdr[_IHDR_COLOR_TYPE_OFFSET] != _PALETTE_COLOR_TYPE:
+        return None
+
+    ihdr = bytearray(ihdr)
+    ihdr[_IHDR_COLOR_TYPE_OFFSET] = _GRAY_COLOR_TYPE
+    # Palette related chunks are not allowed (PLTE) or have different meaning (tRNS, bKGD) in grayscale PNG
+    gray_chunks = [(chunk_type, data) for chunk_type, data in chunks[1:]
+                   if chunk_type not in (b'PLTE', b'tRNS', b'bKGD', b'hIST', b'sPLT')]
+    return _joined_chunks([(b'IHDR', bytes(ihdr)), *gray_chunks])
@@ -1,26 +1,31 @@
 from __future__ import annotations
 
+import math
 import zlib
 from typing import TYPE_CHECKING
 
 import numpy as np
 
 if TYPE_CHECKING:
-    from typing import Sequence
+    from typing import Callable, Sequence
+
+
+_DECOMPRESSION_CHUNK_SIZE = 1 << 24
 
 
 def encode_rle(array: np.ndarray) -> tuple[np.ndarray | None, np.ndarray | None]:
     """
     From: https://stackoverflow.com/a/32681075
-    :param array: one dimensional array
+    :param array: array of any dimensions. Multidimensional arrays are encoded in C order
     :return: tuple of (values, run lengths)
     """
+    array = array.ravel()
     n = len(array)
     if n == 0:
         return None, None
 
     y = array[1:] != array[:-1]  # pairwise unequal (string safe)
-    i = np.append(np.where(y), n - 1)  # must include last element position
+    i = np.append(np.flatnonzero(y), n - 1)  # must include last element position
     run_lengths = np.diff(np.append(-1, i))
     return array[i], run_lengths
 
@@ -31,21 +36,191 @@ def encode_rle_by_zlib(array: np.ndarray) -> bytes:
 
 
 def decode_rle(
-        values: np.ndarray | Sequence[int],
-        run_lengths: np.ndarray | Sequence[int],
-        dtype=np.uint8
+        values: np.ndarray | Sequence[int] | None,
+        run_lengths: np.ndarray | Sequence[int] | None,
+        dtype=np.uint8,
+        shape: tuple | None = None,
 ) -> np.ndarray:
-    # return np.repeat(values, run_lengths)  # It's do the work, but for our use cases it's slow
+    """
+    :param shape: shape of the decoded array. If None, one dimensional array is returned
+    """
+    if values is None:
+        array = np.empty(0, dtype)
+    else:
+        # np.repeat is as fast as filling of long runs in a Python loop, and tens of times faster for many short runs
+        array = np.repeat(np.asarray(values, dtype=dtype), run_lengths)
+    return array if shape is None else array.reshape(shape)
+
+
+def decode_rle_by_zlib(compressed_data: bytes, dtype=np.uint8, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    :param out: contiguous array to decompress into. Its dtype is used instead of the `dtype`.
+    Decompressed data is written into it chunk by chunk, so large data is not kept twice in memory.
+    """
+    if out is None:
+        data = zlib.decompress(compressed_data)
+        return np.frombuffer(data, dtype=dtype)
+
+    out_bytes = out.reshape(-1).view(np.uint8)
+    decompressor = zlib.decompressobj()
+    offset = 0
+    data = compressed_data
+    while data:
+        chunk = decompressor.decompress(data, _DECOMPRESSION_CHUNK_SIZE)
+        out_bytes[offset:offset + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+        offset += len(chunk)
+        data = decompressor.unconsumed_tail
+    chunk = decompressor.flush()
+    out_bytes[offset:offset + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+    offset += len(chunk)
+    assert offset == out_bytes.size, 'Decompressed data size has to be equal to the `out` size'
+    return out
+
+
+class RowRuns:
+    """
+    Set of mask pixels stored as row-wise runs: half-open column ranges [start, stop) in rows of the mask.
+    Runs do not cross row boundaries. Rows of 3D masks are numbered through all slices.
+    Runs are sorted by (row, start), do not overlap and do not touch each other.
+    Union, intersection and difference are calculated directly on the runs without expanding the masks.
+    """
+
+    def __init__(self, shape: tuple, rows: np.ndarray, starts: np.ndarray, stops: np.ndarray):
+        self.shape = tuple(shape)
+        self.rows = rows
+        self.starts = starts
+        self.stops = stops
+
+    @classmethod
+    def empty(cls, shape: tuple) -> RowRuns:
+        empty_indices = np.empty(0, dtype=np.int64)
+        return cls(shape, empty_indices, empty_indices, empty_indices)
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray, value: int | None = None) -> RowRuns:
+        """
+        Encode pixels of the 2D or 3D `mask`, which are equal to the `value`.
+        If `value` is None, all nonzero pixels are encoded.
+        """
+        row_len = mask.shape[-1]
+        selected = (mask != 0) if value is None else (mask == value)
+        selected = selected.reshape(-1, row_len)
+        # Run boundaries: [i] is True, if the selection changes between pixels (i - 1) and i of a row.
+        # Pixels outside the row are unselected, so every run has both boundaries in its row
+        boundaries = np.empty((selected.shape[0], row_len + 1), dtype=bool)
+        boundaries[:, 0] = selected[:, 0]
+        boundaries[:, -1] = selected[:, -1]
+        np.not_equal(selected[:, 1:], selected[:, :-1], out=boundaries[:, 1:-1])
+        boundary_rows, boundary_columns = np.divmod(np.flatnonzero(boundaries), row_len + 1)
+        # Run starts and stops alternate in every row
+        start_rows = boundary_rows[::2]
+        starts = boundary_columns[::2]
+        stops = boundary_columns[1::2]
+        return cls(mask.shape, start_rows, starts, stops)
+
+    @property
+    def row_len(self) -> int:
+        return self.shape[-1]
+
+    @property
+    def run_count(self) -> int:
+        return len(self.starts)
+
+    @property
+    def pixel_count(self) -> int:
+        return int((self.stops - self.starts).sum())
+
+    def to_mask(self, value: int = 1, dtype=np.uint8, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Fill the run pixels with the `value`.
+        :param out: mask to draw the runs onto. If None, a new mask with zero background is created
+        """
+        if out is None:
+            return self._decoded_alternating_runs(np.zeros((), dtype=dtype), np.asarray(value, dtype=dtype))
+
+        assert out.shape == self.shape and out.flags.c_contiguous, \
+            '`out` has to be contiguous and of the same shape as the runs'
+
+        flat_out = out.reshape(-1)
+        run_lengths = self.stops - self.starts
+        pixel_count = int(run_lengths.sum())
+        if pixel_count < flat_out.size // 8:
+            # Indices of all run pixels take less memory than the coverage of the whole mask
+            run_offsets = np.repeat(self._flat_positions(self.starts) - (np.cumsum(run_lengths) - run_lengths),
+                                    run_lengths)
+            flat_out[run_offsets + np.arange(pixel_count)] = value
+        else:
+            out[self._decoded_alternating_runs(np.False_, np.True_)] = value
+        return out
+
+    def union(self, other: RowRuns) -> RowRuns:
+        return self._combined(other, np.logical_or)
+
+    def intersection(self, other: RowRuns) -> RowRuns:
+        return self._combined(other, np.logical_and)
+
+    def difference(self, other: RowRuns) -> RowRuns:
+        return self._combined(other, lambda self_coverage, other_coverage: self_coverage & ~other_coverage)
+
+    def __or__(self, other: RowRuns) -> RowRuns:
+        return self.union(other)
+
+    def __and__(self, other: RowRuns) -> RowRuns:
+        return self.intersection(other)
+
+    def __sub__(self, other: RowRuns) -> RowRuns:
+        return self.difference(other)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, RowRuns):
+            return NotImplemented
+        # Runs are normalized (sorted, not touching), so equal pixel sets have equal runs
+        return self.shape == other.shape and np.array_equal(self.rows, other.rows) \
+            and np.array_equal(self.starts, other.starts) and np.array_equal(self.stops, other.stops)
+
+    __hash__ = None
+
+    def _decoded_alternating_runs(self, background_value: np.generic, run_value: np.generic) -> np.ndarray:
+        """Decode the mask as alternating runs of background and run pixels."""
+        boundaries = np.empty(2 * self.run_count + 2, dtype=np.int64)
+        boundaries[0] = 0
+        boundaries[1:-1:2] = self._flat_positions(self.starts)
+        boundaries[2:-1:2] = self._flat_positions(self.stops)
+        boundaries[-1] = math.prod(self.shape)
+        values = np.full(2 * self.run_count + 1, background_value)
+        values[1::2] = run_value
+        return np.repeat(values, np.diff(boundaries)).reshape(self.shape)
+
+    def _flat_positions(self, columns: np.ndarray) -> np.ndarray:
+        return self.rows.astype(np.int64) * self.row_len + columns
+
+    def _combined(self, other: RowRuns, operation: Callable[[np.ndarray, np.ndarray], np.ndarray]) -> RowRuns:
+        """
+        Sweep over sorted run boundaries of both run sets and keep ranges, where the `operation`
+        on coverages of the run sets is True.
+        """
+        assert self.shape == other.shape, 'Runs have to be of the same shape'
 
-    run_start_positions = np.cumsum(np.append(0, run_lengths)[:-1])
-    run_end_positions = run_start_positions + run_lengths
-    size = run_end_positions[-1]
-    array = np.empty(size, dtype)
-    for run_start_pos, run_end_pos, value in zip(run_start_positions, run_end_positions, values):
-        array[run_start_pos:run_end_pos].fill(value)
-    return array
+        # Leave a gap between rows, so runs ending at the end of a row are not merged with runs of the next row
+        stride = self.row_len + 1
+        positions = np.concatenate((
+            self.rows * stride + self.starts, self.rows * stride + self.stops,
+            other.rows * stride + other.starts, other.rows * stride + other.stops,
+        ))
+        self_deltas = np.zeros(len(positions), dtype=np.int64)
+        self_deltas[:self.run_count] = 1
+        self_deltas[self.run_count:2 * self.run_count] = -1
+        other_deltas = np.zeros(len(positions), dtype=np.int64)
+        other_deltas[2 * self.run_count:2 * self.run_count + other.run_count] = 1
+        other_deltas[2 * self.run_count + other.run_count:] = -1
 
+        boundary_positions, boundary_indices = np.unique(positions, return_inverse=True)
+        self_coverage = np.cumsum(np.bincount(boundary_indices, self_deltas, len(boundary_positions))) > 0
+        other_coverage = np.cumsum(np.bincount(boundary_indices, other_deltas, len(boundary_positions))) > 0
+        covered = operation(self_coverage, other_coverage)
 
-def decode_rle_by_zlib(compressed_data: bytes, dtype=np.uint8) -> np.ndarray:
-    data = zlib.decompress(compressed_data)
-    return np.frombuffer(data, dtype=dtype)
+        # Coverage is constant between boundaries and is False after the last one
+        changes = np.diff(covered.astype(np.int8), prepend=0)
+        rows, starts = np.divmod(boundary_positions[changes == 1], stride)
+        stops = boundary_positions[changes == -1] - rows * stride
+        return RowRuns(self.shape, rows, starts, stops)
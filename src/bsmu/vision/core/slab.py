@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+from collections import deque
+from enum import Enum
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from typing import Callable
+
+    from bsmu.vision.core.constants import PlaneAxis
+    from bsmu.vision.core.data.raster import Raster
+
+
+class SlabMode(Enum):
+    MAX = 'max'  # Maximum intensity projection (MIP)
+    MIN = 'min'  # Minimum intensity projection (MinIP)
+    MEAN = 'mean'  # Average intensity projection
+
+
+class SlabProjector:
+    """
+    Projects a thick slab (several consecutive slices along the `plane_axis`) of a volume.
+
+    When the slab moves, only the entered and left slices are processed:
+    mean is updated using a running sum, max and min use a sliding window queue
+    based on two stacks, which gives amortized O(1) slice operations per step.
+    A change of the moving direction or a jump rebuilds the window from scratch.
+    """
+
+    def __init__(self, volume: Raster, plane_axis: PlaneAxis, thickness: int, mode: SlabMode = SlabMode.MAX):
+        self._volume = volume
+        self._plane_axis = plane_axis
+        self._thickness = max(1, thickness)
+        self._mode = mode
+
+        self._window: _SlidingWindow | None = None
+        # Half-open range [start, stop) of slices in the current window
+        self._start = 0
+        self._stop = 0
+
+        self._result: np.ndarray | None = None
+
+    @property
+    def thickness(self) -> int:
+        return self._thickness
+
+    @thickness.setter
+    def thickness(self, value: int):
+        value = max(1, value)
+        if self._thickness != value:
+            self._thickness = value
+            self.reset()
+
+    @property
+    def mode(self) -> SlabMode:
+        return self._mode
+
+    @mode.setter
+    def mode(self, value: SlabMode):
+        if self._mode != value:
+            self._mode = value
+            self.reset()
+
+    def reset(self):
+        """Drop the cached window. Call it when pixels of the volume are modified."""
+        self._window = None
+        self._start = self._stop = 0
+
+    def slab_range(self, slice_number: int) -> tuple[int, int]:
+        """Return half-open range of slices of the slab centered at the `slice_number`."""
+        slice_count = self._volume.array.shape[self._plane_axis]
+        start = max(0, slice_number - self._thickness // 2)
+        stop = min(slice_count, start + self._thickness)
+        return start, stop
+
+    def project(self, slice_number: int) -> np.ndarray:
+        """
+        Return projection of the slab centered at the `slice_number`.
+        The returned array is reused by the next calls, so copy it if it has to be kept.
+        """
+        start, stop = self.slab_range(slice_number)
+        if (start, stop) != (self._start, self._stop) or self._window is None:
+            self._move_window(start, stop)
+            self._start, self._stop = start, stop
+            self._result = None
+
+        if self._result is None:
+            self._result = self._window.aggregate()
+            if self._mode is SlabMode.MEAN:
+                self._result = (self._result / (stop - start)).astype(np.float32)
+        return self._result
+
+    def _slice(self, slice_number: int) -> np.ndarray:
+        # Do not use np.take, because that will copy data
+        plane_slice_indexing = [slice(None)] * 3
+        plane_slice_indexing[self._plane_axis] = slice_number
+        return self._volume.array[tuple(plane_slice_indexing)]
+
+    def _move_window(self, start: int, stop: int):
+        window = self._window
+        moves_forward = start >= self._start and stop >= self._stop
+        moves_backward = start <= self._start and stop <= self._stop
+        overlaps = start < self._stop and self._start < stop
+        if window is None or not overlaps or not (moves_forward or moves_backward):
+            self._rebuild_window(start, stop, forward=True)
+            return
+
+        if window.forward != moves_forward:
+            # Slices enter the two-stack queue only from one side, so rebuild it with opposite orientation
+            self._rebuild_window(self._start, self._stop, forward=moves_forward)
+            window = self._window
+
+        if moves_forward:
+            for _ in range(start - self._start):
+                window.pop()
+            for slice_number in range(self._stop, stop):
+                window.push(self._slice(slice_number))
+        else:
+            for _ in range(self._stop - stop):
+                window.pop()
+            for slice_number in range(self._start - 1, start - 1, -1):
+                window.push(self._slice(slice_number))
+
+    def _rebuild_window(self, start: int, stop: int, forward: bool):
+        self._window = _RunningSumWindow(forward) if self._mode is SlabMode.MEAN \
+            else _TwoStackWindow(np.maximum if self._mode is SlabMode.MAX else np.minimum, forward)
+        slice_numbers = range(start, stop) if forward else range(stop - 1, start - 1, -1)
+        for slice_number in slice_numbers:
+            self._window.push(self._slice(slice_number))
+
+
+class _SlidingWindow:
+    def __init__(self, forward: bool):
+        # Side of the volume, from which new slices enter the window
+        self.forward = forward
+
+    def push(self, pixels: np.ndarray):
+        raise NotImplementedError
+
+    def pop(self):
+        raise NotImplementedError
+
+    def aggregate(self) -> np.ndarray:
+        raise NotImplementedError
+
+
+class _RunningSumWindow(_SlidingWindow):
+    def __init__(self, forward: bool):
+        super().__init__(forward)
+
+        self._slices: deque[np.ndarray] = deque()
+        self._sum: np.ndarray | None = None
+
+    def push(self, pixels: np.ndarray):
+        if self._sum is None:
+            # Integer sums are exact, so subtraction of left slices does not accumulate errors
+            sum_type = np.int64 if np.issubdtype(pixels.dtype, np.integer) else np.float64
+            self._sum = pixels.astype(sum_type)
+        else:
+            self._sum += pixels
+        self._slices.append(pixels)
+
+    def pop(self):
+        self._sum -= self._slices.popleft()
+
+    def aggregate(self) -> np.ndarray:
+        return self._sum
+
+
+class _TwoStackWindow(_SlidingWindow):
+    """
+    Sliding window queue with aggregation by associative and idempotent operation (np.maximum or np.minimum).
+    Slices are pushed into the back stack, where only their running aggregate is kept.
+    When the front stack becomes empty, the back slices are moved into it as suffix aggregates.
+    """
+
+    def __init__(self, operation: Callable, forward: bool):
+        super().__init__(forward)
+
+        self._operation = operation
+
+        # Suffix aggregates: the leftmost element is the aggregate of all front slices
+        self._front: deque[np.ndarray] = deque()
+        self._back: list[np.ndarray] = []
+        self._back_aggregate: np.ndarray | None = None
+
+        # Arrays of popped suffix aggregates to reuse them without new allocations
+        self._free_buffers: list[np.ndarray] = []
+
+    def push(self, pixels: np.ndarray):
+        self._back.append(pixels)
+        if self._back_aggregate is None:
+            self._back_aggregate = self._buffer(pixels)
+            self._back_aggregate[...] = pixels
+        else:
+            self._operation(self._back_aggregate, pixels, out=self._back_aggregate)
+
+    def pop(self):
+        if not self._front:
+            self._move_back_to_front()
+        self._free_buffers.append(self._front.popleft())
+
+    def aggregate(self) -> np.ndarray:
+        if not self._front:
+            return self._back_aggregate
+        if self._back_aggregate is None:
+            return self._front[0]
+        return self._operation(self._front[0], self._back_aggregate)
+
+    def _move_back_to_front(self):
+        suffix_aggregate = None
+        for pixels in reversed(self._back):
+            buffer = self._buffer(pixels)
+            if suffix_aggregate is None:
+                buffer[...] = pixels
+            else:
+                self._operation(suffix_aggregate, pixels, out=buffer)
+            self._front.appendleft(buffer)
+            suffix_aggregate = buffer
+        self._back.clear()
+        if self._back_aggregate is not None:
+            self._free_buffers.append(self._back_aggregate)
+            self._back_aggregate = None
+
+    def _buffer(self, pixels: np.ndarray) -> np.ndarray:
+        return self._free_buffers.pop() if self._free_buffers else np.empty_like(pixels)
@@ -0,0 +1,367 @@
+from __future__ import annotations
+
+import weakref
+from typing import TYPE_CHECKING
+
+import numpy as np
+from PySide6.QtCore import QObject, Signal
+
+from bsmu.vision.core.concurrent import ThreadPool
+from bsmu.vision.core.data.raster import Raster
+from bsmu.vision.core.task import Task
+
+if TYPE_CHECKING:
+    from bsmu.vision.core.bbox import BBox
+
+
+class IntensityStatistics:
+    """
+    Histogram of raster intensities.
+    Integer pixels with a value range up to `MAX_EXACT_BIN_COUNT` get a bin for every value, so percentiles are exact.
+    """
+
+    MAX_EXACT_BIN_COUNT = 1 << 16
+    FLOAT_BIN_COUNT = 4096
+
+    DEFAULT_WINDOW_PERCENTILES = (0.5, 99.5)
+
+    def __init__(self, histogram: np.ndarray, min_value: float, max_value: float, bin_width: float):
+        self.histogram = histogram
+        self.min_value = min_value
+        self.max_value = max_value
+        self.bin_width = bin_width
+
+        self._cumulative_histogram = np.cumsum(histogram)
+
+    @property
+    def pixel_count(self) -> int:
+        return int(self._cumulative_histogram[-1]) if self._cumulative_histogram.size else 0
+
+    def percentile(self, q: float) -> float:
+        """Return the lowest value, which is not less than `q` percent of the pixels."""
+        if self.pixel_count == 0:
+            return self.min_value
+        rank = max(1, int(np.ceil(q / 100 * self.pixel_count)))
+        bin_index = int(np.searchsorted(self._cumulative_histogram, rank))
+        return min(self.min_value + bin_index * self.bin_width, self.max_value)
+
+    def window(self, lower_percentile: float, upper_percentile: float) -> tuple[float, float]:
+        """Return (window_width, window_level) to display values between the percentiles."""
+        lower = self.percentile(lower_percentile)
+        upper = self.percentile(upper_percentile)
+        return upper - lower + 1, (upper + lower + 1) / 2
+
+    def default_window(self) -> tuple[float, float]:
+        return self.window(*self.DEFAULT_WINDOW_PERCENTILES)
+
+
+class IntensityStatisticsTask(Task):
+    """Calculates `IntensityStatistics` in chunks along the first axis to report progress and limit memory usage."""
+
+    CHUNK_ELEMENT_COUNT = 1 << 22
+
+    def __init__(self, pixels: np.ndarray, name: str = ''):
+        super().__init__(name)
+
+        self._pixels = pixels
+
+    def _run(self) -> IntensityStatistics:
+        pixels = self._pixels
+        first_axis_len = max(pixels.shape[0], 1)
+        chunk_len = max(1, self.CHUNK_ELEMENT_COUNT * first_axis_len // max(pixels.size, 1))
+        chunk_starts = range(0, first_axis_len, chunk_len)
+        # Two passes over the chunks: the first finds the value range, the second fills the histogram
+        step_count = 2 * len(chunk_starts)
+
+        min_value = None
+        max_value = None
+        for step, chunk_start in enumerate(chunk_starts):
+            chunk = pixels[chunk_start:chunk_start + chunk_len]
+            chunk_min = chunk.min()
+            chunk_max = chunk.max()
+            min_value = chunk_min if min_value is None else min(min_value, chunk_min)
+            max_value = chunk_max if max_value is None else max(max_value, chunk_max)
+            self._change_step_progress(step + 1, step_count)
+
+        is_integer = np.issubdtype(pixels.dtype, np.integer)
+        # Use explicit conversion from numpy type (e.g. np.uint8) to Python number, to prevent possible overflow
+        min_value = int(min_value) if is_integer else float(min_value)
+        max_value = int(max_value) if is_integer else float(max_value)
+        value_range = max_value - min_value
+        # Float pixels always use the fixed bin count, even if their bin width happens to be 1
+        has_exact_bins = is_integer and value_range < IntensityStatistics.MAX_EXACT_BIN_COUNT
+        if has_exact_bins:
+            bin_count = value_range + 1
+            bin_width = 1
+        else:
+            bin_count = IntensityStatistics.FLOAT_BIN_COUNT
+            bin_width = value_range / bin_count if value_range > 0 else 1
+
+        histogram = np.zeros(bin_count, dtype=np.int64)
+        for step, chunk_start in enumerate(chunk_starts, start=len(chunk_starts)):
+            chunk = pixels[chunk_start:chunk_start + chunk_len].ravel()
+            if has_exact_bins:
+                bin_indices = chunk.astype(np.int64) - min_value
+            else:
+                bin_indices = ((chunk - min_value) / bin_width).astype(np.int64)
+                np.clip(bin_indices, 0, bin_count - 1, out=bin_indices)
+            histogram += np.bincount(bin_indices, minlength=bin_count)
+            self._change_step_progress(step + 1, step_count)
+
+        return IntensityStatistics(histogram, min_value, max_value, bin_width)
+
+
+class IntensityStatisticsStorage(QObject):
+    """
+    Shares intensity statistics of rasters between all viewers.
+    The statistics are calculated once per raster in a background task and dropped, when the raster pixels are modified.
+    """
+
+    statistics_calculated = Signal(Raster, object)  # raster: Raster, statistics: IntensityStatistics
+
+    _instance = None
+
+    def __init__(self):
+        super().__init__()
+
+        self._statistics_by_raster: weakref.WeakKeyDictionary[Raster, IntensityStatistics] = \
+            weakref.WeakKeyDictionary()
+        self._task_by_raster: weakref.WeakKeyDictionary[Raster, IntensityStatisticsTask] = \
+            weakref.WeakKeyDictionary()
+        self._tracked_rasters: weakref.WeakSet[Raster] = weakref.WeakSet()
+
+    @classmethod
+    def instance(cls) -> IntensityStatisticsStorage:
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def statistics(self, raster: Raster) -> IntensityStatistics | None:
+        """
+        Return calculated statistics of the `raster`.
+        If they are not calculated yet, return None and start the calculation,
+        `statistics_calculated` signal will be emitted, when it finishes.
+        """
+        statistics = self._statistics_by_raster.get(raster)
+        if statistics is None and raster not in self._task_by_raster:
+            self._start_calculation(raster)
+        return statistics
+
+    def _start_calculation(self, raster: Raster):
+        task = IntensityStatisticsTask(raster.pixels, f'Intensity Statistics [{raster.path_name}]')
+        self._task_by_raster[raster] = task
+        if raster not in self._tracked_rasters:
+            self._tracked_rasters.add(raster)
+            raster.pixels_modified.connect(self._on_raster_pixels_modified)
+        raster_ref = weakref.ref(raster)
+        task.on_finished = lambda statistics: self._on_calculation_finished(raster_ref(), task, statistics)
+        ThreadPool.run_async_task(task)
+
+    def _on_calculation_finished(
+            self, raster: Raster | None, task: IntensityStatisticsTask, statistics: IntensityStatistics):
+        if raster is None or self._task_by_raster.get(raster) is not task:
+            # The raster was deleted or modified during the calculation
+            return
+
+        del self._task_by_raster[raster]
+        self._statistics_by_raster[raster] = statistics
+        self.statistics_calculated.emit(raster, statistics)
+
+    def _on_raster_pixels_modified(self, bbox: BBox):
+        raster = self.sender()
+        self._statistics_by_raster.pop(raster, None)
+        self._task_by_raster.pop(raster, None)
+
+
+class ClassPixelCounts:
+    """
+    Pixel counts of every class (palette index) of a 2D mask.
+    Counts are kept for every tile of the mask, so a modification recounts only the tiles of the modified bbox.
+    """
+
+    TILE_SIZE = 256
+    CLASS_COUNT = 256
+
+    def __init__(self, mask_shape: tuple[int, int]):
+        self._mask_shape = mask_shape
+        tile_grid_shape = (-(-mask_shape[0] // self.TILE_SIZE), -(-mask_shape[1] // self.TILE_SIZE))
+        # Tile pixel counts fit into int32, since a tile contains at most TILE_SIZE ** 2 pixels
+        self._tile_counts = np.zeros((*tile_grid_shape, self.CLASS_COUNT), dtype=np.int32)
+        self._counts = np.zeros(self.CLASS_COUNT, dtype=np.int64)
+
+        # Offsets, which are added to pixel values, to count them in one np.bincount call for a row of tiles
+        self._column_offsets = (np.arange(mask_shape[1]) // self.TILE_SIZE * self.CLASS_COUNT).astype(np.int32)
+
+    @property
+    def mask_shape(self) -> tuple[int, int]:
+        return self._mask_shape
+
+    @property
+    def counts(self) -> np.ndarray:
+        return self._counts
+
+    def areas(self, spacing: np.ndarray) -> np.ndarray:
+        """Return physical areas of the classes, e.g. in mm^2, if the `spacing` is in mm."""
+        return self._counts * float(np.prod(spacing))
+
+    @property
+    def tile_row_count(self) -> int:
+        return self._tile_counts.shape[0]
+
+    def recount(self, pixels: np.ndarray, bbox: BBox | None = None):
+        """Recount tiles, which intersect the `bbox`, or all tiles, if `bbox` is None."""
+        if bbox is None:
+            tile_rows = range(self.tile_row_count)
+            tile_col_start, tile_col_stop = 0, self._tile_counts.shape[1]
+        else:
+            bbox = bbox.clipped_to_shape(self._mask_shape)
+            if bbox.empty:
+                return
+            tile_rows = range(bbox.top // self.TILE_SIZE, -(-bbox.bottom // self.TILE_SIZE))
+            tile_col_start, tile_col_stop = bbox.left // self.TILE_SIZE, -(-bbox.right // self.TILE_SIZE)
+        for tile_row in tile_rows:
+            self.recount_tile_row(pixels, tile_row, tile_col_start, tile_col_stop)
+
+    def recount_tile_row(self, pixels: np.ndarray, tile_row: int, tile_col_start: int = 0, tile_col_stop: int = None):
+        if tile_col_stop is None:
+            tile_col_stop = self._tile_counts.shape[1]
+
+        left = tile_col_start * self.TILE_SIZE
+        right = min(tile_col_stop * self.TILE_SIZE, self._mask_shape[1])
+        band = pixels[tile_row * self.TILE_SIZE:(tile_row + 1) * self.TILE_SIZE, left:right]
+        keys = band + self._column_offsets[left:right]
+        first_key = tile_col_start * self.CLASS_COUNT
+        new_tile_counts = np.bincount(
+            (keys - first_key).ravel(), minlength=(tile_col_stop - tile_col_start) * self.CLASS_COUNT,
+        ).reshape(tile_col_stop - tile_col_start, self.CLASS_COUNT)
+
+        old_tile_counts = self._tile_counts[tile_row, tile_col_start:tile_col_stop]
+        self._counts += new_tile_counts.sum(axis=0) - old_tile_counts.sum(axis=0)
+        old_tile_counts[...] = new_tile_counts
+
+
+class ClassPixelCountsTask(Task):
+    """Counts class pixels of the whole mask row of tiles by row of tiles to report progress."""
+
+    def __init__(self, pixels: np.ndarray, name: str = ''):
+        super().__init__(name)
+
+        self._pixels = pixels
+
+    def _run(self) -> ClassPixelCounts:
+        class_pixel_counts = ClassPixelCounts(self._pixels.shape[:2])
+        tile_row_count = class_pixel_counts.tile_row_count
+        for tile_row in range(tile_row_count):
+            class_pixel_counts.recount_tile_row(self._pixels, tile_row)
+            self._change_step_progress(tile_row + 1, tile_row_count)
+        return class_pixel_counts
+
+
+class ClassPixelCountsStorage(QObject):
+    """
+    Keeps class pixel counts of 2D masks up to date.
+    The counts are calculated once per mask in a background task, then only tiles of modified bboxes are recounted,
+    so the counts stay current during brushing even on whole slide image masks.
+    """
+
+    counts_changed = Signal(Raster, object)  # mask: Raster, counts: ClassPixelCounts
+
+    _instance = None
+
+    def __init__(self):
+        super().__init__()
+
+        self._counts_by_mask: weakref.WeakKeyDictionary[Raster, ClassPixelCounts] = weakref.WeakKeyDictionary()
+        # Modification generation of the mask, which the counts correspond to
+        self._counts_generation_by_mask: weakref.WeakKeyDictionary[Raster, int] = weakref.WeakKeyDictionary()
+        self._task_by_mask: weakref.WeakKeyDictionary[Raster, ClassPixelCountsTask] = weakref.WeakKeyDictionary()
+        # Bboxes modified during the calculation. They are recounted, when the calculation finishes
+        self._bboxes_modified_during_task_by_mask: weakref.WeakKeyDictionary[Raster, list[BBox]] = \
+            weakref.WeakKeyDictionary()
+        self._tracked_masks: weakref.WeakSet[Raster] = weakref.WeakSet()
+
+    @classmethod
+    def instance(cls) -> ClassPixelCountsStorage:
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def is_mask_supported(mask: Raster | None) -> bool:
+        return mask is not None and mask.is_indexed and mask.n_dims == 2 and mask.is_pixels_valid
+
+    def counts(self, mask: Raster) -> ClassPixelCounts | None:
+        """
+        Return current class pixel counts of the `mask`.
+        If they are not calculated yet, return None and start the calculation,
+        `counts_changed` signal will be emitted, when it finishes.
+        """
+        if not self.is_mask_supported(mask):
+            return None
+
+        counts = self._counts_by_mask.get(mask)
+        if counts is not None and (counts.mask_shape != mask.shape
+                                   or self._counts_generation_by_mask[mask] != mask.modification_generation):
+            # Pixels were replaced without the `pixels_modified` signal
+            counts = None
+            self._drop_counts(mask)
+        if counts is None and mask not in self._task_by_mask:
+            self._start_calculation(mask)
+        return counts
+
+    def _drop_counts(self, mask: Raster):
+        self._counts_by_mask.pop(mask, None)
+        self._counts_generation_by_mask.pop(mask, None)
+        self._task_by_mask.pop(mask, None)
+        self._bboxes_modified_during_task_by_mask.pop(mask, None)
+
+    def _start_calculation(self, mask: Raster):
+        task = ClassPixelCountsTask(mask.pixels, f'Class Pixel Counts [{mask.path_name}]')
+        self._task_by_mask[mask] = task
+        self._bboxes_modified_during_task_by_mask[mask] = []
+        if mask not in self._tracked_masks:
+            self._tracked_masks.add(mask)
+            mask.pixels_modified.connect(self._on_mask_pixels_modified)
+            mask.shape_changed.connect(self._on_mask_shape_changed)
+        mask_ref = weakref.ref(mask)
+        generation = mask.modification_generation
+        task.on_finished = lambda counts: self._on_calculation_finished(mask_ref(), task, generation, counts)
+        ThreadPool.run_async_task(task)
+
+    def _on_calculation_finished(
+            self, mask: Raster | None, task: ClassPixelCountsTask, generation: int, counts: ClassPixelCounts):
+        if mask is None or self._task_by_mask.get(mask) is not task:
+            # The mask was deleted or its pixels were replaced during the calculation
+            return
+
+        del self._task_by_mask[mask]
+        # Tiles of these bboxes could be counted before or in the middle of the modification
+        for bbox in self._bboxes_modified_during_task_by_mask.pop(mask):
+            counts.recount(mask.pixels, bbox)
+            generation += 1
+        self._counts_by_mask[mask] = counts
+        self._counts_generation_by_mask[mask] = generation
+        self.counts_changed.emit(mask, counts)
+
+    def _on_mask_pixels_modified(self, bbox: BBox | None):
+        mask = self.sender()
+        if bbox is None:
+            # The whole mask is modified, so recalculate the counts in the background
+            self._drop_counts(mask)
+            self._start_calculation(mask)
+            return
+
+        if mask in self._task_by_mask:
+            self._bboxes_modified_during_task_by_mask[mask].append(bbox)
+            return
+
+        counts = self._counts_by_mask.get(mask)
+        if counts is None:
+            return
+
+        counts.recount(mask.pixels, bbox)
+        self._counts_generation_by_mask[mask] += 1
+        self.counts_changed.emit(mask, counts)
+
+    def _on_mask_shape_changed(self, old_shape: tuple | None, new_shape: tuple | None):
+        self._drop_counts(self.sender())
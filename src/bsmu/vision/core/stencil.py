@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import math
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from bsmu.vision.core.bbox import BBox
+
+if TYPE_CHECKING:
+    from typing import Sequence
+
+    import numpy.typing as npt
+
+
+# Number of subpixel positions (and radius steps) per pixel, which get separate stencils
+SUBPIXEL_STEPS = 4
+_STENCIL_CACHE_SIZE = 64
+
+
+def ellipse_stencil(
+        center_row: float,
+        center_col: float,
+        row_radius: float,
+        col_radius: float,
+        shape: Sequence[int],
+) -> tuple[BBox, npt.NDArray[bool]]:
+    """
+    Return boolean stencil of the ellipse (same pixels as skimage.draw.ellipse) clipped to the `shape`.
+    Stencils are cached by radii (in pixels, so the spacing is taken into account) and subpixel offset of the center,
+    quantized to 1 / SUBPIXEL_STEPS of a pixel. So repeated dabs of a brush do not generate their stencils.
+    :return: (bbox of the stencil in an array with the `shape`, read-only stencil pixels of the bbox shape)
+    Use them as bbox-local masks: `bbox.pixels(array)[stencil] = value`
+    """
+    row_base, row_offset_steps = divmod(round(center_row * SUBPIXEL_STEPS), SUBPIXEL_STEPS)
+    col_base, col_offset_steps = divmod(round(center_col * SUBPIXEL_STEPS), SUBPIXEL_STEPS)
+    stencil, top, left = _cached_ellipse_stencil(
+        _quantized_radius_steps(row_radius), _quantized_radius_steps(col_radius), row_offset_steps, col_offset_steps)
+
+    height, width = stencil.shape
+    stencil_bbox = BBox(col_base + left, col_base + left + width, row_base + top, row_base + top + height)
+    clipped_stencil_bbox = stencil_bbox.clipped_to_shape(shape)
+    if clipped_stencil_bbox.empty:
+        return clipped_stencil_bbox, np.zeros(clipped_stencil_bbox.shape, dtype=bool)
+
+    return clipped_stencil_bbox, clipped_stencil_bbox.calculate_clip_bbox(stencil_bbox).pixels(stencil)
+
+
+def _quantized_radius_steps(radius: float) -> int:
+    return max(1, round(radius * SUBPIXEL_STEPS))
+
+
+@lru_cache(maxsize=_STENCIL_CACHE_SIZE)
+def _cached_ellipse_stencil(
+        row_radius_steps: int, col_radius_steps: int, row_offset_steps: int, col_offset_steps: int,
+) -> tuple[npt.NDArray[bool], int, int]:
+    """
+    :return: (stencil trimmed to the ellipse pixels, row and column of the stencil top left pixel
+    relative to the pixel, which contains the ellipse center)
+    """
+    row_radius = row_radius_steps / SUBPIXEL_STEPS
+    col_radius = col_radius_steps / SUBPIXEL_STEPS
+    row_offset = row_offset_steps / SUBPIXEL_STEPS
+    col_offset = col_offset_steps / SUBPIXEL_STEPS
+
+    top = math.floor(row_offset - row_radius)
+    left = math.floor(col_offset - col_radius)
+    rows = np.arange(top, math.ceil(row_offset + row_radius) + 1)[:, np.newaxis]
+    cols = np.arange(left, math.ceil(col_offset + col_radius) + 1)[np.newaxis, :]
+    stencil = ((rows - row_offset) / row_radius) ** 2 + ((cols - col_offset) / col_radius) ** 2 < 1
+
+    # Trim rows and columns without ellipse pixels
+    stencil_rows = np.flatnonzero(stencil.any(axis=1))
+    stencil_cols = np.flatnonzero(stencil.any(axis=0))
+    if stencil_rows.size == 0:
+        # Too small ellipse does not contain pixel centers
+        return np.zeros((0, 0), dtype=bool), 0, 0
+
+    stencil = stencil[stencil_rows[0]:stencil_rows[-1] + 1, stencil_cols[0]:stencil_cols[-1] + 1]
+    stencil.flags.writeable = False
+    return stencil, top + int(stencil_rows[0]), left + int(stencil_cols[0])
+
+
+def stencil_pixel_index(stencil: npt.NDArray[bool], row: int, col: int) -> int | None:
+    """
+    Return index of the (`row`, `col`) pixel among stencil pixels in row-major order
+    (i.e. index of its value in `array[stencil]`), or None, if the pixel is not in the stencil.
+    """
+    if not (0 <= row < stencil.shape[0] and 0 <= col < stencil.shape[1] and stencil[row, col]):
+        return None
+
+    return int(np.count_nonzero(stencil[:row]) + np.count_nonzero(stencil[row, :col]))
+
+
+def capsule_stencil(
+        start_row: float,
+        start_col: float,
+        end_row: float,
+        end_col: float,
+        row_radius: float,
+        col_radius: float,
+        shape: Sequence[int],
+) -> tuple[BBox, npt.NDArray[bool]]:
+    """
+    Return boolean stencil of the capsule, which is swept by the ellipse moved from the start to the end center,
+    clipped to the `shape`. Its ends are the same as the ellipse stencils (without quantization).
+    Capsules depend on the direction of the movement, so they are not cached.
+    :return: (bbox of the stencil in an array with the `shape`, stencil pixels of the bbox shape)
+    """
+    top = max(math.floor(min(start_row, end_row) - row_radius), 0)
+    bottom = max(min(math.ceil(max(start_row, end_row) + row_radius) + 1, shape[0]), top)
+    left = max(math.floor(min(start_col, end_col) - col_radius), 0)
+    right = max(min(math.ceil(max(start_col, end_col) + col_radius) + 1, shape[1]), left)
+    stencil_bbox = BBox(left, right, top, bottom)
+
+    # Use coordinates, where the ellipse is the unit circle
+    rows = ((np.arange(top, bottom) - start_row) / row_radius)[:, np.newaxis]
+    cols = ((np.arange(left, right) - start_col) / col_radius)[np.newaxis, :]
+    segment_row = (end_row - start_row) / row_radius
+    segment_col = (end_col - start_col) / col_radius
+    segment_squared_length = segment_row ** 2 + segment_col ** 2
+    if segment_squared_length == 0:
+        return stencil_bbox, rows ** 2 + cols ** 2 < 1
+
+    # Parameter of the nearest segment point for every pixel
+    t = np.clip((rows * segment_row + cols * segment_col) / segment_squared_length, 0, 1)
+    return stencil_bbox, (rows - t * segment_row) ** 2 + (cols - t * segment_col) ** 2 < 1
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QColor
+from PySide6.QtWidgets import QDockWidget, QTableWidget, QTableWidgetItem, QHeaderView
+
+from bsmu.vision.core.config import Config
+from bsmu.vision.core.layers import RasterLayer
+from bsmu.vision.core.plugins import Plugin
+from bsmu.vision.core.statistics import ClassPixelCountsStorage
+
+if TYPE_CHECKING:
+    from PySide6.QtWidgets import QMdiSubWindow, QWidget
+
+    from bsmu.vision.actors.layer import LayerActor
+    from bsmu.vision.core.data.raster import Raster
+    from bsmu.vision.core.statistics import ClassPixelCounts
+    from bsmu.vision.plugins.doc_interfaces.mdi import MdiPlugin, Mdi
+    from bsmu.vision.plugins.windows.main import MainWindowPlugin, MainWindow
+
+
+@dataclass
+class MaskStatisticsViewConfig(Config):
+    mask_layer_name: str = 'masks'
+    # Minimal interval (in seconds) between updates of the table, e.g. during brushing
+    update_interval: float = 0.1
+    # Unit of the mask spacing, which is shown in the area column header
+    spacing_unit: str = 'mm'
+
+
+class MaskStatisticsViewPlugin(Plugin):
+    _DEFAULT_DEPENDENCY_PLUGIN_FULL_NAME_BY_KEY = {
+        'main_window_plugin': 'bsmu.vision.plugins.windows.main.MainWindowPlugin',
+        'mdi_plugin': 'bsmu.vision.plugins.doc_interfaces.mdi.MdiPlugin',
+    }
+
+    def __init__(self, main_window_plugin: MainWindowPlugin, mdi_plugin: MdiPlugin):
+        super().__init__()
+
+        self._main_window_plugin = main_window_plugin
+        self._main_window: MainWindow | None = None
+
+        self._mdi_plugin = mdi_plugin
+        self._mdi: Mdi | None = None
+
+        self._mask_statistics_table: MaskStatisticsTableWidget | None = None
+        self._mask_statistics_dock_widget: QDockWidget | None = None
+
+    def _enable_gui(self):
+        self._main_window = self._main_window_plugin.main_window
+        self._mdi = self._mdi_plugin.mdi
+
+        config = MaskStatisticsViewConfig.from_dict(self.config.full_data)
+        self._mask_statistics_table = MaskStatisticsTableWidget(config)
+        self._mask_statistics_dock_widget = QDockWidget('Mask Statistics', self._main_window)
+        self._mask_statistics_dock_widget.setWidget(self._mask_statistics_table)
+        self._main_window.addDockWidget(Qt.RightDockWidgetArea, self._mask_statistics_dock_widget)
+
+        self._mdi.subWindowActivated.connect(self._on_sub_window_activated)
+        self._mask_statistics_table.show_sub_window_mask(self._mdi.activeSubWindow())
+
+    def _disable(self):
+        self._mdi.subWindowActivated.disconnect(self._on_sub_window_activated)
+        self._mask_statistics_table.show_sub_window_mask(None)
+
+        self._main_window.removeDockWidget(self._mask_statistics_dock_widget)
+
+        self._mask_statistics_dock_widget = None
+        self._mask_statistics_table = None
+
+        self._mdi = None
+        self._main_window = None
+
+    def _on_sub_window_activated(self, sub_window: QMdiSubWindow | None):
+        if sub_window is None and self._mdi.subWindowList():
+            # Application lost focus, the statistics of the last active sub-window are kept
+            return
+
+        self._mask_statistics_table.show_sub_window_mask(sub_window)
+
+
+class MaskStatisticsTableWidget(QTableWidget):
+    """Shows pixel counts and areas of mask classes of the active sub-window."""
+
+    CLASS_COLUMN = 0
+    PIXELS_COLUMN = 1
+    AREA_COLUMN = 2
+
+    def __init__(self, config: MaskStatisticsViewConfig, parent: QWidget = None):
+        super().__init__(0, 3, parent)
+
+        self._config = config
+
+        self._class_pixel_counts_storage = ClassPixelCountsStorage.instance()
+        self._class_pixel_counts_storage.counts_changed.connect(self._on_counts_changed)
+
+        self._viewer = None
+        self._mask_layer: RasterLayer | None = None
+        self._mask: Raster | None = None
+
+        # Counts change on every brush dab, so the table is updated not more often than the timer interval
+        self._update_timer = QTimer(self)
+        self._update_timer.setSingleShot(True)
+        self._update_timer.setInterval(round(self._config.update_interval * 1000))
+        self._update_timer.timeout.connect(self._update_table)
+
+        self.setHorizontalHeaderLabels(['Class', 'Pixels', f'Area ({self._config.spacing_unit}²)'])
+        self.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.verticalHeader().hide()
+        self.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+
+    def show_sub_window_mask(self, sub_window: QMdiSubWindow | None):
+        viewer = None if sub_window is None else getattr(sub_window, 'layered_data_viewer', None)
+        if self._viewer is not viewer:
+            if self._viewer is not None:
+                self._viewer.layer_actor_added.disconnect(self._on_viewer_layer_actor_added)
+            self._viewer = viewer
+            if self._viewer is not None:
+                self._viewer.layer_actor_added.connect(self._on_viewer_layer_actor_added)
+        self._set_mask_layer(None if viewer is None else viewer.layer_by_name(self._config.mask_layer_name))
+
+    def _on_viewer_layer_actor_added(self, layer_actor: LayerActor, index: int):
+        if self._mask_layer is None and layer_actor.layer.name == self._config.mask_layer_name:
+            self._set_mask_layer(layer_actor.layer)
+
+    def _set_mask_layer(self, layer: RasterLayer | None):
+        if not isinstance(layer, RasterLayer):
+            layer = None
+        if self._mask_layer is layer:
+            return
+
+        if self._mask_layer is not None:
+            self._mask_layer.data_changed.disconnect(self._set_mask)
+        self._mask_layer = layer
+        if self._mask_layer is not None:
+            self._mask_layer.data_changed.connect(self._set_mask)
+        self._set_mask(None if layer is None else layer.data)
+
+    def _set_mask(self, mask: Raster | None):
+        self._mask = mask
+        self._update_table()
+
+    def _on_counts_changed(self, mask: Raster, counts: ClassPixelCounts):
+        if mask is self._mask and not self._update_timer.isActive():
+            self._update_timer.start()
+
+    def _update_table(self):
+        self._update_timer.stop()
+
+        counts = None if self._mask is None else self._class_pixel_counts_storage.counts(self._mask)
+        if counts is None:
+            # The counts are being calculated, the table will be updated by the `counts_changed` signal
+            self.setRowCount(0)
+            return
+
+        class_indices = np.flatnonzero(counts.counts)
+        pixel_counts = counts.counts[class_indices]
+        areas = counts.areas(self._mask.spatial.spacing)[class_indices]
+        self.setRowCount(len(class_indices))
+        palette = self._mask.palette
+        for row, (class_index, pixel_count, area) in enumerate(zip(class_indices, pixel_counts, areas)):
+            class_item = QTableWidgetItem(palette.row_name(int(class_index), str(class_index)))
+            class_item.setData(Qt.ItemDataRole.DecorationRole, QColor(*palette.array[class_index][:3].tolist()))
+            self.setItem(row, self.CLASS_COLUMN, class_item)
+
+            pixels_item = QTableWidgetItem(f'{pixel_count:,}')
+            pixels_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            self.setItem(row, self.PIXELS_COLUMN, pixels_item)
+
+            area_item = QTableWidgetItem(f'{area:,.2f}')
+            area_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            self.setItem(row, self.AREA_COLUMN, area_item)
@@ -7,6 +7,7 @@ import cv2 as cv
 import numpy as np
 
 from bsmu.vision.core.image import FlatImage
+from bsmu.vision.core.png import palette_png_to_gray_png
 from bsmu.vision.plugins.readers.image import ImageFileReaderPlugin, ImageFileReader
 
 if TYPE_CHECKING:
@@ -35,7 +36,13 @@ class CommonImageFileReader(ImageFileReader):
 
         assert not as_gray, 'as_gray flag is unimplemented'
         # Use numpy.fromfile because it supports Unicode characters in file path
-        pixels = cv.imdecode(np.fromfile(path, dtype=np.uint8), cv.IMREAD_UNCHANGED)
+        encoded_image = np.fromfile(path, dtype=np.uint8)
+        if palette is not None and path.suffix.lower() == '.png':
+            # OpenCV converts palette PNG into color image, so read palette indices as grayscale values
+            gray_png = palette_png_to_gray_png(encoded_image.tobytes())
+            if gray_png is not None:
+                encoded_image = np.frombuffer(gray_png, dtype=np.uint8)
+        pixels = cv.imdecode(encoded_image, cv.IMREAD_UNCHANGED)
         channel_count = pixels.shape[-1] if pixels.ndim == 3 else 1
         match channel_count:
             case 3:
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import logging
+import weakref
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from PySide6.QtCore import QObject, QTimer
+
+from bsmu.vision.actors.layer.layer import RasterLayerActor
+from bsmu.vision.core.concurrent import ThreadPool
+from bsmu.vision.core.config import Config
+from bsmu.vision.core.data.raster import CompressedPixels
+from bsmu.vision.core.plugins import Plugin
+
+if TYPE_CHECKING:
+    from PySide6.QtWidgets import QMdiSubWindow
+
+    from bsmu.vision.core.data.raster import Raster
+    from bsmu.vision.core.task import Task
+    from bsmu.vision.plugins.doc_interfaces.mdi import MdiPlugin, Mdi
+
+
+_BYTES_IN_MB = 1 << 20
+
+
+@dataclass
+class InactiveMaskCompressorConfig(Config):
+    # Delay (in seconds) after the activation of another window, before masks of inactive windows are compressed
+    compression_delay: float = 10
+    # Masks of smaller size (in MB) are not compressed
+    min_mask_size: float = 4
+    # If uncompressed masks of inactive windows take more memory (in MB), they are compressed without the delay
+    max_inactive_masks_size: float = 1024
+
+
+class InactiveMaskCompressorPlugin(Plugin):
+    _DEFAULT_DEPENDENCY_PLUGIN_FULL_NAME_BY_KEY = {
+        'mdi_plugin': 'bsmu.vision.plugins.doc_interfaces.mdi.MdiPlugin',
+    }
+
+    def __init__(self, mdi_plugin: MdiPlugin):
+        super().__init__()
+
+        self._mdi_plugin = mdi_plugin
+        self._mdi: Mdi | None = None
+
+        self._inactive_mask_compressor: InactiveMaskCompressor | None = None
+
+    @property
+    def inactive_mask_compressor(self) -> InactiveMaskCompressor | None:
+        return self._inactive_mask_compressor
+
+    def _enable(self):
+        self._mdi = self._mdi_plugin.mdi
+
+        config = InactiveMaskCompressorConfig.from_dict(self.config.full_data)
+        self._inactive_mask_compressor = InactiveMaskCompressor(self._mdi, config)
+
+        self._mdi.subWindowActivated.connect(self._inactive_mask_compressor.on_sub_window_activated)
+
+    def _disable(self):
+        self._mdi.subWindowActivated.disconnect(self._inactive_mask_compressor.on_sub_window_activated)
+
+        self._inactive_mask_compressor = None
+
+
+class InactiveMaskCompressor(QObject):
+    """
+    Compresses pixels of masks (indexed rasters), which are shown only in inactive MDI sub-windows.
+    Masks usually contain few classes, so zlib-RLE compresses them tens of times.
+    Compression runs in a worker thread, and compressed masks are decompressed on the first access to their pixels.
+    """
+
+    def __init__(self, mdi: Mdi, config: InactiveMaskCompressorConfig):
+        super().__init__()
+
+        self._mdi = mdi
+        self._config = config
+
+        self._compression_timer = QTimer(self)
+        self._compression_timer.setSingleShot(True)
+        self._compression_timer.timeout.connect(self.compress_inactive_masks)
+
+        self._compression_task_by_mask: weakref.WeakKeyDictionary[Raster, Task] = weakref.WeakKeyDictionary()
+
+    def on_sub_window_activated(self, sub_window: QMdiSubWindow | None):
+        if sub_window is None:
+            # Application lost focus, all sub-windows are kept as is
+            return
+
+        inactive_masks_size = sum(mask.pixels_nbytes for mask in self._inactive_masks_to_compress())
+        if inactive_masks_size > self._config.max_inactive_masks_size * _BYTES_IN_MB:
+            self.compress_inactive_masks()
+        else:
+            self._compression_timer.start(round(self._config.compression_delay * 1000))
+
+    def compress_inactive_masks(self):
+        self._compression_timer.stop()
+        for mask in self._inactive_masks_to_compress():
+            self._compress_mask_async(mask)
+
+    def _layer_actors_by_mask(self) -> dict[Raster, list[RasterLayerActor]]:
+        actors_by_mask = {}
+        for sub_window in self._mdi.subWindowList():
+            viewer = getattr(sub_window, 'layered_data_viewer', None)
+            if viewer is None:
+                continue
+
+            for layer_actor in viewer.layer_actors:
+                if isinstance(layer_actor, RasterLayerActor) \
+                        and layer_actor.raster is not None and layer_actor.raster.is_indexed:
+                    actors_by_mask.setdefault(layer_actor.raster, []).append(layer_actor)
+        return actors_by_mask
+
+    def _active_masks(self) -> set[Raster]:
+        active_sub_window = self._mdi.activeSubWindow()
+        viewer = getattr(active_sub_window, 'layered_data_viewer', None)
+        if viewer is None:
+            return set()
+
+        return {layer_actor.raster for layer_actor in viewer.layer_actors
+                if isinstance(layer_actor, RasterLayerActor) and layer_actor.raster is not None}
+
+    def _inactive_masks_to_compress(self) -> list[Raster]:
+        # The same mask can be shown in active and inactive sub-windows (e.g. in viewers of different volume planes)
+        active_masks = self._active_masks()
+        min_mask_nbytes = self._config.min_mask_size * _BYTES_IN_MB
+        return [mask for mask in self._layer_actors_by_mask()
+                if mask not in active_masks
+                and not mask.is_pixels_compressed
+                and mask.is_pixels_valid
+                and mask.pixels_nbytes >= min_mask_nbytes]
+
+    def _compress_mask_async(self, mask: Raster):
+        if mask in self._compression_task_by_mask:
+            return
+
+        modification_generation = mask.modification_generation
+        task = ThreadPool.call_async(CompressedPixels.compress, mask.pixels)
+        self._compression_task_by_mask[mask] = task
+        mask_ref = weakref.ref(mask)
+        task.on_finished = lambda compressed_pixels: \
+            self._on_mask_compressed(mask_ref(), task, modification_generation, compressed_pixels)
+
+    def _on_mask_compressed(
+            self,
+            mask: Raster | None,
+            task: Task,
+            modification_generation: int,
+            compressed_pixels: CompressedPixels,
+    ):
+        if mask is None or self._compression_task_by_mask.get(mask) is not task:
+            return
+
+        del self._compression_task_by_mask[mask]
+        if mask.is_pixels_compressed or mask.modification_generation != modification_generation:
+            # The mask was modified during the compression
+            return
+
+        actors_by_mask = self._layer_actors_by_mask()
+        if mask not in actors_by_mask or mask in self._active_masks():
+            # The mask was closed or activated during the compression
+            return
+
+        for layer_actor in actors_by_mask[mask]:
+            layer_actor.release_display_buffers()
+        uncompressed_nbytes = mask.pixels_nbytes
+        mask.compress_pixels(compressed_pixels)
+        logging.info(f'Mask {mask.path_name} is compressed: '
+                     f'{uncompressed_nbytes / _BYTES_IN_MB:.1f} MB -> {mask.pixels_nbytes / _BYTES_IN_MB:.1f} MB')
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import logging
+import weakref
+from typing import TYPE_CHECKING
+
+from PySide6.QtCore import QObject
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.data.raster import Raster
+from bsmu.vision.core.journal import MaskJournal
+from bsmu.vision.core.layers import RasterLayer
+from bsmu.vision.core.plugins import Plugin
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from PySide6.QtWidgets import QMdiSubWindow
+
+    from bsmu.vision.actors.layer import LayerActor
+    from bsmu.vision.core.data import Data
+    from bsmu.vision.core.layers import Layer
+    from bsmu.vision.plugins.doc_interfaces.mdi import MdiPlugin, Mdi
+    from bsmu.vision.plugins.writers.queue import FileWriteQueuePlugin, FileWriteQueue
+
+
+class MaskJournalPlugin(Plugin):
+    _DEFAULT_DEPENDENCY_PLUGIN_FULL_NAME_BY_KEY = {
+        'mdi_plugin': 'bsmu.vision.plugins.doc_interfaces.mdi.MdiPlugin',
+        'file_write_queue_plugin': 'bsmu.vision.plugins.writers.queue.FileWriteQueuePlugin',
+    }
+
+    def __init__(self, mdi_plugin: MdiPlugin, file_write_queue_plugin: FileWriteQueuePlugin):
+        super().__init__()
+
+        self._mdi_plugin = mdi_plugin
+        self._mdi: Mdi | None = None
+
+        self._file_write_queue_plugin = file_write_queue_plugin
+        self._file_write_queue: FileWriteQueue | None = None
+
+        self._mask_journaling: MaskJournaling | None = None
+
+    def _enable(self):
+        self._mdi = self._mdi_plugin.mdi
+        self._file_write_queue = self._file_write_queue_plugin.file_write_queue
+
+        self._mask_journaling = MaskJournaling(self._file_write_queue)
+
+        self._mdi.sub_window_added.connect(self._mask_journaling.track_sub_window)
+        self._file_write_queue.file_written.connect(self._mask_journaling.on_file_written)
+        self._file_write_queue.file_writing_failed.connect(self._mask_journaling.on_file_writing_failed)
+
+    def _disable(self):
+        self._mdi.sub_window_added.disconnect(self._mask_journaling.track_sub_window)
+        self._file_write_queue.file_written.disconnect(self._mask_journaling.on_file_written)
+        self._file_write_queue.file_writing_failed.disconnect(self._mask_journaling.on_file_writing_failed)
+
+        self._mask_journaling = None
+
+
+class MaskJournaling(QObject):
+    """
+    Keeps a journal of modifications for every mask with a path, which is shown in MDI sub-windows.
+    When a mask is opened and its journal exists (e.g. after a crash), the journal is replayed onto the mask.
+    Records of saved modifications are dropped from the journal, when the mask is written by the file write queue.
+    If the mask is released before its queued save is written, the journal is kept until the save is written.
+    """
+
+    def __init__(self, file_write_queue: FileWriteQueue):
+        super().__init__()
+
+        self._file_write_queue = file_write_queue
+
+        self._tracked_layers: weakref.WeakSet[Layer] = weakref.WeakSet()
+        self._tracked_masks: weakref.WeakSet[Raster] = weakref.WeakSet()
+        self._journal_by_mask: weakref.WeakKeyDictionary[Raster, MaskJournal] = weakref.WeakKeyDictionary()
+        self._release_finalizer_by_mask: weakref.WeakKeyDictionary[Raster, weakref.finalize] = \
+            weakref.WeakKeyDictionary()
+        # Journals of released masks, which saves are queued
+        self._released_journals_by_mask_path: dict[Path, list[MaskJournal]] = {}
+
+    def track_sub_window(self, sub_window: QMdiSubWindow):
+        viewer = getattr(sub_window, 'layered_data_viewer', None)
+        if viewer is None:
+            return
+
+        viewer.layer_actor_added.connect(self._on_layer_actor_added)
+        for layer_actor in viewer.layer_actors:
+            self._track_layer(layer_actor.layer)
+
+    def on_file_written(self, path: Path, data: Data):
+        if not isinstance(data, Raster):
+            return
+
+        journal_path = MaskJournal.path_for_mask(path)
+        released_journals = self._released_journals_by_mask_path.get(path, [])
+        for journal in [*self._journal_by_mask.values(), *released_journals]:
+            if journal.path == journal_path:
+                # The written data is a snapshot, which keeps the modification generation of the mask
+                journal.truncate(data.modification_generation)
+        self._forget_released_journals_without_queued_saves(path)
+
+    def on_file_writing_failed(self, path: Path, data: Data, error_message: str):
+        # Journals of released masks are kept on disk, so the unsaved modifications are replayed at next opening
+        self._forget_released_journals_without_queued_saves(path)
+
+    def _forget_released_journals_without_queued_saves(self, path: Path):
+        if path in self._released_journals_by_mask_path and not self._file_write_queue.is_queued(path):
+            del self._released_journals_by_mask_path[path]
+
+    def _on_layer_actor_added(self, layer_actor: LayerActor, index: int):
+        self._track_layer(layer_actor.layer)
+
+    def _track_layer(self, layer: Layer | None):
+        if not isinstance(layer, RasterLayer) or layer in self._tracked_layers:
+            return
+
+        self._tracked_layers.add(layer)
+        layer.data_changed.connect(self._track_mask)
+        self._track_mask(layer.data)
+
+    def _track_mask(self, mask: Raster | None):
+        # Volume masks emit modified bboxes of slices, so they are not journaled
+        if mask is None or mask in self._tracked_masks or not mask.is_indexed or mask.n_dims != 2:
+            return
+
+        self._tracked_masks.add(mask)
+        self._open_journal(mask, replay=True)
+        mask.pixels_modified.connect(self._on_mask_pixels_modified)
+        mask.path_changed.connect(self._on_mask_path_changed)
+
+    def _open_journal(self, mask: Raster, replay: bool):
+        self._journal_by_mask.pop(mask, None)
+        if (release_finalizer := self._release_finalizer_by_mask.pop(mask, None)) is not None:
+            release_finalizer.detach()
+        if mask.path is None or not mask.is_pixels_valid:
+            return
+
+        journal_path = MaskJournal.path_for_mask(mask.path)
+        replayed_record_count = 0
+        if journal_path.exists():
+            if replay:
+                try:
+                    replayed_record_count = MaskJournal.replay(journal_path, mask.pixels)
+                except (OSError, ValueError) as e:
+                    logging.warning(f'Cannot replay mask journal: {e}')
+                    self._set_journal_aside(journal_path)
+            else:
+                # The journal belongs to the previous file at the path, which will be overwritten by the mask
+                journal_path.unlink()
+
+        try:
+            journal = MaskJournal(journal_path, mask.shape)
+        except (OSError, ValueError) as e:
+            logging.warning(f'Cannot open mask journal: {e}')
+            self._set_journal_aside(journal_path)
+            journal = MaskJournal(journal_path, mask.shape)
+        self._journal_by_mask[mask] = journal
+
+        release_finalizer = weakref.finalize(mask, self._on_mask_released, mask.path, journal)
+        # Keep journals of masks, which are not released at exit, to replay their unsaved modifications
+        release_finalizer.atexit = False
+        self._release_finalizer_by_mask[mask] = release_finalizer
+
+        if replayed_record_count > 0:
+            logging.info(f'Replayed {replayed_record_count} records of mask journal {journal_path}')
+            # Mark the mask as modified (e.g. for auto-save). The journal is not connected yet, so it is not written
+            mask.emit_pixels_modified()
+            journal.reset_generations(mask.modification_generation)
+
+    @staticmethod
+    def _set_journal_aside(journal_path: Path):
+        # Keep the file for manual recovery
+        journal_path.replace(journal_path.with_name(journal_path.name + '.orphaned'))
+
+    def _on_mask_path_changed(self, path: Path | None):
+        mask = self.sender()
+        if (old_journal := self._journal_by_mask.get(mask)) is not None:
+            # Modifications will be saved at the new path, so they must not be replayed onto the old file
+            old_journal.discard()
+        self._open_journal(mask, replay=False)
+
+    def _on_mask_released(self, mask_path: Path, journal: MaskJournal):
+        # If the save of the mask is not queued, the journal keeps its unsaved modifications to replay them later
+        if self._file_write_queue.is_queued(mask_path):
+            self._released_journals_by_mask_path.setdefault(mask_path, []).append(journal)
+
+    def _on_mask_pixels_modified(self, bbox: BBox | None):
+        mask = self.sender()
+        journal = self._journal_by_mask.get(mask)
+        if journal is None:
+            return
+
+        bbox = BBox(0, mask.shape[1], 0, mask.shape[0]) if bbox is None else bbox.clipped_to_shape(mask.shape)
+        if bbox.empty:
+            return
+
+        journal.append(mask.modification_generation, bbox, mask.pixels)
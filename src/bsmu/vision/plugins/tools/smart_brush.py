@@ -5,16 +5,18 @@ from typing import TYPE_CHECKING
 
 import cv2
 import numpy as np
-import skimage.draw
-import skimage.measure
 from PySide6.QtCore import QEvent, Qt
 
-from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.clustering import kmeans_uint8
+from bsmu.vision.core.components import SeededComponentFiller
 from bsmu.vision.core.palette import Palette
+from bsmu.vision.core.stencil import ellipse_stencil, stencil_pixel_index
 from bsmu.vision.plugins.tools import CursorConfig, ViewerToolPlugin, ViewerToolSettingsWidget
 from bsmu.vision.plugins.tools.layered import LayeredDataViewerTool, LayeredDataViewerToolSettings
+from bsmu.vision.undo.data.raster import ModifyRasterCommand
 
 if TYPE_CHECKING:
+    import numpy.typing as npt
     from PySide6.QtCore import QObject
 
     from bsmu.vision.core.config.united import UnitedConfig
@@ -66,6 +68,7 @@ class SmartBrushTool(LayeredDataViewerTool):
         self.paint_dark_cluster = False
 
         self.paint_connected_component = True
+        self._component_filler = SeededComponentFiller()
 
         layers_props = self.config.value('layers')
         self.mask_palette = Palette.from_config(layers_props['mask'].get('palette'))
@@ -80,11 +83,19 @@ class SmartBrushTool(LayeredDataViewerTool):
 
         self._brush_bbox = None
 
+        # Collects old pixels of the mask during a brush stroke (from mouse press to release)
+        self._modify_mask_command: ModifyRasterCommand | None = None
+
     def activate(self):
         super().activate()
 
         self.viewer.viewport.setMouseTracking(True)
 
+    def deactivate(self):
+        self._finish_stroke()
+
+        super().deactivate()
+
     def eventFilter(self, watched_obj: QObject, event: QEvent):
         if event.type() == QEvent.MouseButtonPress or event.type() == QEvent.MouseButtonRelease:
             self.draw_brush_event(event)
@@ -119,6 +130,16 @@ class SmartBrushTool(LayeredDataViewerTool):
         #     return
 
         self.update_mode(event)
+        if self.mode == Mode.SHOW:
+            self._finish_stroke()
+        else:
+            stroke_text = 'Smart Brush: Draw' if self.mode == Mode.DRAW else 'Smart Brush: Erase'
+            if self._modify_mask_command is not None and self._modify_mask_command.text() != stroke_text:
+                # Drawing and erasing during one press (e.g. using both mouse buttons) are separate strokes
+                self._finish_stroke()
+            if self._modify_mask_command is None:
+                self._modify_mask_command = ModifyRasterCommand(self.mask, stroke_text)
+
         image_pixel_coords = self.map_viewport_to_pixel_coords(event.position(), self.tool_mask_layer)
         self.draw_brush(*image_pixel_coords)
 
@@ -133,45 +154,43 @@ class SmartBrushTool(LayeredDataViewerTool):
 
         row_spatial_radius, col_spatial_radius = \
             self.tool_mask.map_spatial_vector_to_pixel_vector(np.array([self.radius, self.radius]))
-        rr, cc = skimage.draw.ellipse(  # we can use rounded row, col and radii,
-            # but float values give more precise resulting ellipse indexes
+        # Brush bbox is the bbox of the ellipse stencil
+        self._brush_bbox, stencil = ellipse_stencil(
             row_f, col_f, row_spatial_radius, col_spatial_radius, shape=self.tool_mask.shape)
-        self._brush_bbox = BBox(
-            int(round(col_f - col_spatial_radius)), int(round(col_f + col_spatial_radius)) + 1,
-            int(round(row_f - row_spatial_radius)), int(round(row_f + row_spatial_radius)) + 1)
-        self._brush_bbox.clip_to_shape(self.tool_mask.shape)
         if self._brush_bbox.empty:
             return
 
         if self.mode == Mode.ERASE:
-            self.erase_region(rr, cc)
+            self.erase_region(stencil)
             return
 
-        mask_circle_pixels = self.mask.array[rr, cc]
-        background_or_mask_class_indexes = \
-            (mask_circle_pixels == self.mask_background_class) | (mask_circle_pixels == self.mask_foreground_class)
+        mask_in_brush_bbox = self.mask.bboxed_pixels(self._brush_bbox)
         # Do not use pixels, which already painted to another mask class
-        rr = rr[background_or_mask_class_indexes]
-        cc = cc[background_or_mask_class_indexes]
+        sampled_pixels = stencil & (
+            (mask_in_brush_bbox == self.mask_background_class) | (mask_in_brush_bbox == self.mask_foreground_class))
 
-        samples = self.image.array[rr, cc]
+        samples = self.image.bboxed_pixels(self._brush_bbox)[sampled_pixels]
         if len(samples.shape) == 2:  # if there is an axis with channels (multichannel image)
             samples = samples[:, 0]  # use only the first channel
-        samples = samples.astype(np.float32)
         number_of_clusters = 2
         if number_of_clusters > samples.size:
             return
 
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-        ret, label, centers = cv2.kmeans(samples, number_of_clusters, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
-        label = label.ravel()  # 2D array (one column) to 1D array without copy
-        centers = centers.ravel()
+        # Exact histogram-based clustering of 8-bit samples is much faster than cv2.kmeans
+        clustering = kmeans_uint8(samples, number_of_clusters) if samples.dtype == np.uint8 else None
+        if clustering is None:
+            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+            ret, label, centers = cv2.kmeans(
+                samples.astype(np.float32), number_of_clusters, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+            label = label.ravel()  # 2D array (one column) to 1D array without copy
+            centers = centers.ravel()
+        else:
+            label, centers = clustering
 
         if self.paint_central_pixel_cluster:
-            center_pixel_indexes = np.where((rr == row) & (cc == col))[0]
-            if center_pixel_indexes.size != 1:  # there are situations, when the center pixel is out of image
+            center_pixel_index = stencil_pixel_index(sampled_pixels, *self._brush_bbox.map_rc_point((row, col)))
+            if center_pixel_index is None:  # there are situations, when the center pixel is out of image
                 return
-            center_pixel_index = center_pixel_indexes[0]
             painted_cluster_label = label[center_pixel_index]
         else:
             # Label of light cluster
@@ -180,34 +199,44 @@ class SmartBrushTool(LayeredDataViewerTool):
                 # Swapping 1 with 0 and 0 with 1
                 painted_cluster_label = 1 - painted_cluster_label
 
-        tool_mask_circle_pixels = self.tool_mask.array[rr, cc]
-        tool_mask_circle_pixels[label == painted_cluster_label] = self.tool_foreground_class
-        self.tool_mask.array[rr, cc] = tool_mask_circle_pixels
-
         tool_mask_in_brush_bbox = self.tool_mask.bboxed_pixels(self._brush_bbox)
+        painted_pixels = np.zeros_like(sampled_pixels)
+        painted_pixels[sampled_pixels] = label == painted_cluster_label
+        tool_mask_in_brush_bbox[painted_pixels] = self.tool_foreground_class
+
         if self.paint_central_pixel_cluster and self.paint_connected_component:
-            labeled_tool_mask_in_brush_bbox = skimage.measure.label(
-                tool_mask_in_brush_bbox, background=self.tool_background_class)
-            row_col_mapped_to_brush_bbox = self._brush_bbox.map_rc_point((row, col))
-            label_under_mouse = labeled_tool_mask_in_brush_bbox[row_col_mapped_to_brush_bbox]
+            row_mapped_to_brush_bbox, col_mapped_to_brush_bbox = self._brush_bbox.map_rc_point((row, col))
+            connected_component_pixels = self._component_filler.fill(
+                tool_mask_in_brush_bbox, self.tool_foreground_class,
+                (row_mapped_to_brush_bbox,), (col_mapped_to_brush_bbox,))
             tool_mask_in_brush_bbox[
                 (tool_mask_in_brush_bbox == self.tool_foreground_class) &
-                (labeled_tool_mask_in_brush_bbox != label_under_mouse)] = self.tool_unconnected_component_class
+                ~connected_component_pixels] = self.tool_unconnected_component_class
 
         if self.mode == Mode.DRAW:
-            mask_in_brush_bbox = self.mask.bboxed_pixels(self._brush_bbox)
+            self._modify_mask_command.save_pixels(self._brush_bbox)
             mask_in_brush_bbox[tool_mask_in_brush_bbox == self.tool_foreground_class] = self.mask_foreground_class
             self.mask.emit_pixels_modified(self._brush_bbox)
 
         self.tool_mask.emit_pixels_modified(self._brush_bbox)
 
-    def erase_region(self, rr, cc):
-        self.tool_mask.array[rr, cc] = self.tool_eraser_class
-        self.mask.array[rr, cc] = self.mask_background_class
+    def erase_region(self, stencil: npt.NDArray[bool]):
+        """Erase pixels of the `stencil` of the brush bbox."""
+        self.tool_mask.bboxed_pixels(self._brush_bbox)[stencil] = self.tool_eraser_class
+        self._modify_mask_command.save_pixels(self._brush_bbox)
+        self.mask.bboxed_pixels(self._brush_bbox)[stencil] = self.mask_background_class
 
         self.tool_mask.emit_pixels_modified(self._brush_bbox)
         self.mask.emit_pixels_modified(self._brush_bbox)
 
+    def _finish_stroke(self):
+        if self._modify_mask_command is None:
+            return
+
+        if not self._modify_mask_command.is_empty:
+            self._undo_manager.push(self._modify_mask_command)
+        self._modify_mask_command = None
+
 
 class SmartBrushImageViewerToolPlugin(ViewerToolPlugin):
     def __init__(
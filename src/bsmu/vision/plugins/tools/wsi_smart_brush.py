@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import copy
 import logging
+import weakref
 from dataclasses import dataclass
 from enum import Enum
 from functools import partial
@@ -8,20 +10,25 @@ from typing import TYPE_CHECKING, cast
 
 import cv2
 import numpy as np
-import skimage.draw
-import skimage.measure
 from PySide6.QtCore import Qt, Signal, QEvent
 from PySide6.QtGui import QCursor, QKeyEvent, QMouseEvent, QWheelEvent
-from PySide6.QtWidgets import QGroupBox, QFormLayout, QHBoxLayout, QRadioButton, QSpinBox, QVBoxLayout
+from PySide6.QtWidgets import QCheckBox, QGroupBox, QFormLayout, QHBoxLayout, QRadioButton, QSpinBox, QVBoxLayout
 
 from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.clustering import kmeans_uint8
+from bsmu.vision.core.components import SeededComponentFiller
+from bsmu.vision.core.concurrent import ThreadPool
 from bsmu.vision.core.config import Config
 from bsmu.vision.core.image import MASK_TYPE, MASK_MAX
+from bsmu.vision.core.image.features import ImageFeature, ImageFeatureTileCache
+from bsmu.vision.core.image.superpixels import SuperpixelTileCache
 from bsmu.vision.core.rle import encode_rle, decode_rle
+from bsmu.vision.core.stencil import capsule_stencil, ellipse_stencil, stencil_pixel_index
 from bsmu.vision.plugins.tools import CursorConfig, ViewerToolPlugin, ViewerToolSettingsWidget
 from bsmu.vision.plugins.tools.layered import LayeredDataViewerTool, LayeredDataViewerToolSettings
 from bsmu.vision.tools.viewer.radius_scaler import RadiusScaler
 from bsmu.vision.undo import UndoCommand
+from bsmu.vision.undo.data.raster import RASTER_TILE_SIZE, iter_tile_bboxes, united_tile_row_bboxes
 
 if TYPE_CHECKING:
     import numpy.typing as npt
@@ -31,12 +38,15 @@ if TYPE_CHECKING:
     from PySide6.QtWidgets import QWidget
 
     from bsmu.vision.core.config.united import UnitedConfig
+    from bsmu.vision.core.data.raster import Raster
     from bsmu.vision.core.image import FlatImage
+    from bsmu.vision.core.task import Task
     from bsmu.vision.plugins.doc_interfaces.mdi import MdiPlugin
     from bsmu.vision.plugins.palette.settings import PalettePackSettings, PalettePackSettingsPlugin
     from bsmu.vision.plugins.tools import ViewerTool, ViewerToolSettings
     from bsmu.vision.plugins.undo import UndoManager, UndoPlugin
     from bsmu.vision.plugins.windows.main import MainWindowPlugin
+    from bsmu.vision.undo.spill import SpillRecord, UndoSpillFile
     from bsmu.vision.widgets.viewers.layered import LayeredDataViewer
 
 
@@ -52,6 +62,7 @@ DEFAULT_RADIUS = 600
 DEFAULT_MIN_RADIUS = 2
 DEFAULT_MAX_RADIUS = 2200
 DEFAULT_MAX_RADIUS_WITHOUT_DOWNSCALE = 100
+DEFAULT_FEATURE_CACHE_SIZE = 256  # MB
 
 
 class RepaintingMode(Enum):
@@ -67,6 +78,14 @@ class RepaintingConfig(Config):
     custom_class: int = 1
 
 
+@dataclass
+class SuperpixelConfig(Config):
+    # Cluster superpixels instead of pixels, so painted regions snap to tissue edges
+    enabled: bool = False
+    size: float = 12  # Average superpixel side (in pixels at the brush working scale)
+    compactness: float = 10  # SLIC compactness. Higher values give more regular superpixels
+
+
 BRUSH_CURSOR_CONFIG = CursorConfig(
     icon_file_name=':/icons/brush-cursor.svg',
     hot_x=0.323,
@@ -77,6 +96,7 @@ BRUSH_CURSOR_CONFIG = CursorConfig(
 class WsiSmartBrushToolSettings(LayeredDataViewerToolSettings):
     radius_changed = Signal(float)
     smart_mode_enabled_changed = Signal(bool)
+    superpixels_enabled_changed = Signal(bool)
     repainting_enabled_changed = Signal(bool)
     repainting_mode_changed = Signal(RepaintingMode)
     repainted_class_changed = Signal(int)
@@ -97,6 +117,9 @@ class WsiSmartBrushToolSettings(LayeredDataViewerToolSettings):
             painted_cluster: str | int,
             paint_connected_component: bool,
             draw_on_mouse_move: bool,
+            image_feature: ImageFeature | None = None,
+            feature_cache_size: int = DEFAULT_FEATURE_CACHE_SIZE * 1024 * 1024,
+            superpixels: SuperpixelConfig | None = None,
             cursor_config: CursorConfig = BRUSH_CURSOR_CONFIG,
             action_icon_file_name: str = ':/icons/brush-action.svg',
     ):
@@ -113,6 +136,9 @@ class WsiSmartBrushToolSettings(LayeredDataViewerToolSettings):
         self._painted_cluster = painted_cluster
         self._paint_connected_component = paint_connected_component
         self._draw_on_mouse_move = draw_on_mouse_move
+        self._image_feature = image_feature
+        self._feature_cache_size = feature_cache_size
+        self._superpixels = SuperpixelConfig() if superpixels is None else superpixels
 
         self._painted_cluster_brightness_index: int | None = self._cluster_brightness_index()
 
@@ -234,6 +260,34 @@ class WsiSmartBrushToolSettings(LayeredDataViewerToolSettings):
     def draw_on_mouse_move(self) -> bool:
         return self._draw_on_mouse_move
 
+    @property
+    def image_feature(self) -> ImageFeature | None:
+        """Feature of the image, which is clustered instead of raw pixels, or None to cluster raw pixels."""
+        return self._image_feature
+
+    @property
+    def feature_cache_size(self) -> int:
+        """Maximal size (in bytes) of cached image feature and superpixel tiles, which is shared by both caches."""
+        return self._feature_cache_size
+
+    @property
+    def superpixels_enabled(self) -> bool:
+        return self._superpixels.enabled
+
+    @superpixels_enabled.setter
+    def superpixels_enabled(self, value: bool):
+        if self._superpixels.enabled != value:
+            self._superpixels.enabled = value
+            self.superpixels_enabled_changed.emit(self._superpixels.enabled)
+
+    @property
+    def superpixel_size(self) -> float:
+        return self._superpixels.size
+
+    @property
+    def superpixel_compactness(self) -> float:
+        return self._superpixels.compactness
+
     @property
     def mask_background_class(self) -> int:
         return self._mask_background_class
@@ -292,8 +346,22 @@ class WsiSmartBrushToolSettings(LayeredDataViewerToolSettings):
             config.value('painted_cluster', 'central'),
             config.value('paint_connected_component', True),
             config.value('draw_on_mouse_move', True),
+            cls._image_feature_from_config_value(config.value('image_feature')),
+            round(config.value('feature_cache_size', DEFAULT_FEATURE_CACHE_SIZE) * 1024 * 1024),
+            SuperpixelConfig.from_dict(config.value('superpixels')),
         )
 
+    @staticmethod
+    def _image_feature_from_config_value(value: str | None) -> ImageFeature | None:
+        if value is None:
+            return None
+
+        try:
+            return ImageFeature[value.upper()]
+        except KeyError:
+            logging.warning(f'Invalid `image_feature` value: {value}. Raw image pixels are used instead.')
+            return None
+
 
 class WsiSmartBrushToolSettingsWidget(ViewerToolSettingsWidget):
     def __init__(self, tool_settings: WsiSmartBrushToolSettings, parent: QWidget = None):
@@ -314,6 +382,14 @@ class WsiSmartBrushToolSettingsWidget(ViewerToolSettingsWidget):
         tool_settings.mask_foreground_class_changed.connect(self._mask_foreground_class_spin_box.setValue)
         form_layout.addRow(self.tr('&Mask Foreground:'), self._mask_foreground_class_spin_box)
 
+        self._superpixels_check_box = QCheckBox(self.tr('Snap to Superpixels'))
+        self._superpixels_check_box.setChecked(tool_settings.superpixels_enabled)
+        self._superpixels_check_box.setToolTip(
+            self.tr('Cluster superpixels instead of pixels, so painted regions snap to tissue edges.'))
+        self._superpixels_check_box.toggled.connect(self._on_superpixels_check_box_toggled)
+        tool_settings.superpixels_enabled_changed.connect(self._superpixels_check_box.setChecked)
+        form_layout.addRow(self._superpixels_check_box)
+
         self._repainting_group_box = QGroupBox(self.tr('Enable Repainting'))
         self._repainting_group_box.setCheckable(True)
         self._repainting_group_box.setChecked(tool_settings.repainting_enabled)
@@ -363,6 +439,9 @@ class WsiSmartBrushToolSettingsWidget(ViewerToolSettingsWidget):
     def _on_mask_foreground_class_spin_box_value_changed(self, value: int):
         self.tool_settings.mask_foreground_class = value
 
+    def _on_superpixels_check_box_toggled(self, checked: bool):
+        self.tool_settings.superpixels_enabled = checked
+
     def _on_repainting_enabled_group_box_toggled(self, checked: bool):
         self.tool_settings.repainting_enabled = checked
 
@@ -386,7 +465,79 @@ class WsiSmartBrushToolSettingsWidget(ViewerToolSettingsWidget):
         self.tool_settings.repainted_class = value
 
 
+class MaskTileDelta:
+    """Old pixels of a mask tile and a boolean array with True on pixels of the tile, which were modified."""
+
+    def __init__(self, tile_bbox: BBox, old_pixels: npt.NDArray[MASK_TYPE], modified_pixels: npt.NDArray[bool]):
+        self.tile_bbox = tile_bbox
+        self._old_pixels = old_pixels
+        self._modified_pixels = modified_pixels
+
+        self._packed_modified_pixels = None
+        # Flat (one-dimensional) array with old values of modified pixels, compressed using RLE
+        # into tuple of (values, run_lengths)
+        self._rle_compressed_old_modified_pixels = None
+
+    @classmethod
+    def from_compressed_data(cls, tile_bbox: BBox, compressed_data: tuple) -> MaskTileDelta:
+        tile_delta = cls(tile_bbox, None, None)
+        tile_delta.set_compressed_data(compressed_data)
+        return tile_delta
+
+    @property
+    def is_compressed(self) -> bool:
+        return self._modified_pixels is None
+
+    @property
+    def compressed_data(self) -> tuple:
+        return self._packed_modified_pixels, self._rle_compressed_old_modified_pixels
+
+    @property
+    def nbytes(self) -> int:
+        if not self.is_compressed:
+            return self._old_pixels.nbytes + self._modified_pixels.nbytes
+
+        values, run_lengths = self._rle_compressed_old_modified_pixels
+        return self._packed_modified_pixels.nbytes + values.nbytes + run_lengths.nbytes
+
+    @property
+    def modified_pixels(self) -> npt.NDArray[bool]:
+        if not self.is_compressed:
+            return self._modified_pixels
+
+        modified_pixels = np.unpackbits(self._packed_modified_pixels, count=self.tile_bbox.element_count)
+        # Change np.uint8 type to bool type using |view| method. It's much faster than |astype|
+        return modified_pixels.reshape(self.tile_bbox.shape).view(bool)
+
+    def add_modified_pixels(self, modified_pixels: npt.NDArray[bool]):
+        # Use |= operator to keep True-values unchanged, else they could be replaced by False-values
+        self._modified_pixels |= modified_pixels
+
+    def old_modified_pixels(self) -> npt.NDArray[MASK_TYPE]:
+        if self.is_compressed:
+            return decode_rle(*self._rle_compressed_old_modified_pixels)
+        return self._old_pixels[self._modified_pixels]
+
+    def compressed(self) -> tuple:
+        """Return compressed data without modification of the tile delta, so it can be called in a worker thread."""
+        # Use boolean array indexing to get a copy of flat (one-dimensional) array with old pixels
+        return np.packbits(self._modified_pixels), encode_rle(self._old_pixels[self._modified_pixels])
+
+    def set_compressed_data(self, compressed_data: tuple):
+        self._packed_modified_pixels, self._rle_compressed_old_modified_pixels = compressed_data
+        self._old_pixels = None
+        self._modified_pixels = None
+
+
 class ModifyMaskCommand(UndoCommand):
+    """
+    Stores modifications of the mask as a sparse set of fixed-size tiles,
+    so merging of brush dabs costs proportionally to the tiles of the new dab,
+    and memory is proportional to the painted area (not to the bbox of the whole stroke).
+    """
+
+    TILE_SIZE = RASTER_TILE_SIZE
+
     def __init__(
             self,
             mask: FlatImage,
@@ -409,58 +560,126 @@ class ModifyMaskCommand(UndoCommand):
         super().__init__(text, parent)
 
         self._is_last_to_merge = is_last_to_merge
+        self._byte_size = 0
+        self._tile_delta_by_index = None
+        self._compression_task = None
+        self._mergeable = False
         if is_last_to_merge:
             # The last to merge command is a fake command and contains no useful data
             # It's just an indicator, that now previous command can be compressed
             return
 
         self._mask = mask
-        self._modified_bbox = modified_bbox
-        self._modified_bbox_pixels = modified_bbox_pixels
-        self._compressed_modified_bbox_pixels = None
+        # United bbox of all modified tiles. It is used only to notify about modified pixels
+        self._modified_bbox = copy.copy(modified_bbox)
         if not isinstance(new_modified_bbox_pixels, (int, MASK_TYPE)):
             raise NotImplementedError()
         self._new_modified_bbox_pixels = new_modified_bbox_pixels
-        self._rle_compressed_old_modified_bbox_pixels = None  # after command compression we get
-        # flat (one-dimensional) array with old values of modified pixels. Then it's compressed using RLE into
-        # tuple of (values, run_lengths) and stored into this property
-        self._old_bbox_pixels = mask.bboxed_pixels(modified_bbox).copy()
+        self._tile_delta_by_index: dict[tuple[int, int], MaskTileDelta] = \
+            self._create_tile_deltas(modified_bbox, modified_bbox_pixels)
+        # Size is updated on merging and compression, so it is not summed over all tiles on every request
+        self._byte_size = self._tile_deltas_byte_size()
+
+        # Tile deltas are compressed in a worker thread after the merging
+        self._compression_task: Task | None = None
+
+        # Compressed tile deltas can be moved into a spill file, then they are read back on undo/redo
+        self._spill_file: UndoSpillFile | None = None
+        self._spill_record: SpillRecord | None = None
 
         self._mergeable = True
 
+    def byte_size(self) -> int:
+        return self._byte_size
+
+    @property
+    def is_merging(self) -> bool:
+        # Data are compressed after the merging
+        return bool(self._mergeable)
+
     @property
-    def _is_compressed(self) -> bool:
-        return self._modified_bbox_pixels is None
+    def is_compressing(self) -> bool:
+        return self._compression_task is not None
+
+    def spill(self, spill_file: UndoSpillFile) -> bool:
+        if self._mergeable or self._compression_task is not None or self._tile_delta_by_index is None:
+            # Only compressed data are spilled
+            return False
+
+        self._spill_record = spill_file.write(
+            [(tile_index, (tile_delta.tile_bbox.left, tile_delta.tile_bbox.right,
+                           tile_delta.tile_bbox.top, tile_delta.tile_bbox.bottom), tile_delta.compressed_data)
+             for tile_index, tile_delta in self._tile_delta_by_index.items()])
+        self._spill_file = spill_file
+        self._tile_delta_by_index = None
+        self._byte_size = 0
+        return True
+
+    def release(self):
+        self._clean()
+
+    def _tile_deltas(self) -> list[MaskTileDelta]:
+        if self._spill_record is None:
+            return list(self._tile_delta_by_index.values())
+
+        # Tile deltas are not kept after the reading, so memory does not grow on deep undo
+        return [MaskTileDelta.from_compressed_data(BBox(*tile_bbox_coords), compressed_data)
+                for _, tile_bbox_coords, compressed_data in self._spill_file.read(self._spill_record)]
+
+    def _tile_deltas_byte_size(self) -> int:
+        return sum(tile_delta.nbytes for tile_delta in self._tile_delta_by_index.values())
+
+    def _create_tile_deltas(
+            self, modified_bbox: BBox, modified_bbox_pixels: npt.NDArray[bool]) -> dict[tuple[int, int], MaskTileDelta]:
+        """Copy old pixels of tiles, which contain modified pixels. Have to be called before the mask modification."""
+        tile_delta_by_index = {}
+        for tile_index, tile_bbox in iter_tile_bboxes(modified_bbox, self._mask.shape, self.TILE_SIZE):
+            # Part of the tile, which is covered by the modified bbox
+            covered_bbox = BBox(
+                max(tile_bbox.left, modified_bbox.left), min(tile_bbox.right, modified_bbox.right),
+                max(tile_bbox.top, modified_bbox.top), min(tile_bbox.bottom, modified_bbox.bottom))
+            covered_modified_pixels = covered_bbox.mapped_to_bbox(modified_bbox).pixels(modified_bbox_pixels)
+            if not covered_modified_pixels.any():
+                continue
+
+            tile_modified_pixels = np.zeros(tile_bbox.shape, dtype=bool)
+            covered_bbox.mapped_to_bbox(tile_bbox).pixels(tile_modified_pixels)[...] = covered_modified_pixels
+            tile_delta_by_index[tile_index] = MaskTileDelta(
+                tile_bbox, self._mask.bboxed_pixels(tile_bbox).copy(), tile_modified_pixels)
+        return tile_delta_by_index
 
     def _clean(self):
         self._is_last_to_merge = None
         self._mask = None
         self._modified_bbox = None
-        self._modified_bbox_pixels = None
-        self._compressed_modified_bbox_pixels = None
         self._new_modified_bbox_pixels = None
-        self._rle_compressed_old_modified_bbox_pixels = None
-        self._old_bbox_pixels = None
+        self._tile_delta_by_index = None
+        self._byte_size = 0
+        self._compression_task = None
+        self._spill_file = None
+        self._spill_record = None
         self._mergeable = None
 
     def id(self) -> int:
         return self.command_type_id()
 
     def redo(self):
-        modified_bbox_pixels = self._uncompressed_modified_bbox_pixels() \
-            if self._is_compressed \
-            else self._modified_bbox_pixels
-        self._mask.bboxed_pixels(self._modified_bbox)[modified_bbox_pixels] = self._new_modified_bbox_pixels
-        self._mask.emit_pixels_modified(self._modified_bbox)
+        tile_deltas = self._tile_deltas()
+        for tile_delta in tile_deltas:
+            self._mask.bboxed_pixels(tile_delta.tile_bbox)[tile_delta.modified_pixels] = \
+                self._new_modified_bbox_pixels
+        self._emit_tiles_modified(tile_deltas)
 
     def undo(self):
-        if self._is_compressed:
-            old_modified_bbox_pixels = decode_rle(*self._rle_compressed_old_modified_bbox_pixels)
-            self._mask.bboxed_pixels(self._modified_bbox)[self._uncompressed_modified_bbox_pixels()] = \
-                old_modified_bbox_pixels
-        else:
-            self._mask.modify_bboxed_pixels(self._modified_bbox, self._old_bbox_pixels)
-        self._mask.emit_pixels_modified(self._modified_bbox)
+        tile_deltas = self._tile_deltas()
+        for tile_delta in tile_deltas:
+            self._mask.bboxed_pixels(tile_delta.tile_bbox)[tile_delta.modified_pixels] = \
+                tile_delta.old_modified_pixels()
+        self._emit_tiles_modified(tile_deltas)
+
+    def _emit_tiles_modified(self, tile_deltas: list[MaskTileDelta]):
+        for modified_bbox in united_tile_row_bboxes(tile_delta.tile_bbox for tile_delta in tile_deltas):
+            self._mask.emit_pixels_modified(modified_bbox)
 
     def mergeWith(self, other: ModifyMaskCommand) -> bool:
         """
@@ -474,46 +693,21 @@ class ModifyMaskCommand(UndoCommand):
             self._compress_data()
             return True
 
-        if (isinstance(self._new_modified_bbox_pixels, int)
-                and self._new_modified_bbox_pixels != other._new_modified_bbox_pixels):
+        if self._new_modified_bbox_pixels != other._new_modified_bbox_pixels:
             logging.warning(f'You forgot to use {FinishModifyMaskCommand.__name__} to compress the command '
                             f'as early as possible')
             self._compress_data()
             return False
 
-        if bbox_contains_other := self._modified_bbox.contains(other._modified_bbox):
-            merged_modified_bbox = self._modified_bbox
-        else:
-            merged_modified_bbox = self._modified_bbox.united_with(other._modified_bbox)
-            # Add some reserve pads for the bbox to reduce number of mask copying.
-            # Else, e.g. during drawing by brush, we will have to copy bboxed mask every mouse move event,
-            # when |bbox_contains_other| is False.
-            # Reserve pads are proportional to the shift of |other._modified_bbox| relative to |self._modified_bbox|
-            reserve_pads = self._modified_bbox.pads_to_include(other._modified_bbox)
-            reserve_factor = 50
-            reserve_pads.resize(reserve_factor, reserve_factor)
-            merged_modified_bbox.add_bbox_pads(reserve_pads)
-            merged_modified_bbox.clip_to_shape(self._mask.shape)
-
-        other_modified_bbox_mapped_to_merged = other._modified_bbox.mapped_to_bbox(merged_modified_bbox)
-
-        if bbox_contains_other:
-            merged_modified_bbox_pixels = self._modified_bbox_pixels
-        else:
-            merged_modified_bbox_pixels = np.zeros(merged_modified_bbox.shape, dtype=self._modified_bbox_pixels.dtype)
-            modified_bbox_mapped_to_merged = self._modified_bbox.mapped_to_bbox(merged_modified_bbox)
-            modified_bbox_mapped_to_merged.pixels(merged_modified_bbox_pixels)[...] = self._modified_bbox_pixels
-
-            merged_old_bbox_pixels = self._mask.bboxed_pixels(merged_modified_bbox).copy()
-            other_modified_bbox_mapped_to_merged.pixels(merged_old_bbox_pixels)[...] = other._old_bbox_pixels
-            modified_bbox_mapped_to_merged.pixels(merged_old_bbox_pixels)[...] = self._old_bbox_pixels
-            self._old_bbox_pixels = merged_old_bbox_pixels
-
-        # Use |= operator to keep True-values unchanged, else they could be replaced by False-values
-        other_modified_bbox_mapped_to_merged.pixels(merged_modified_bbox_pixels)[...] |= other._modified_bbox_pixels
-
-        self._modified_bbox = merged_modified_bbox
-        self._modified_bbox_pixels = merged_modified_bbox_pixels
+        for tile_index, other_tile_delta in other._tile_delta_by_index.items():
+            tile_delta = self._tile_delta_by_index.get(tile_index)
+            if tile_delta is None:
+                self._tile_delta_by_index[tile_index] = other_tile_delta
+                self._byte_size += other_tile_delta.nbytes
+            else:
+                # Old pixels of the |self| tile were copied earlier, so they are kept
+                tile_delta.add_modified_pixels(other_tile_delta.modified_pixels)
+        self._modified_bbox.unite_with(other._modified_bbox)
 
         # Weird behaviour: |other| command is not deleted (Python __dell__ is not called),
         # when |mergeWith| method returns True. Looks like there are references to it somewhere.
@@ -527,24 +721,35 @@ class ModifyMaskCommand(UndoCommand):
         return True
 
     def _compress_data(self):
-        # Use boolean array indexing to get a copy of flat (one-dimensional) array with old pixels
-        # and compress them using RLE into tuple of (values, run_lengths)
-        self._rle_compressed_old_modified_bbox_pixels = self._old_bbox_pixels[self._modified_bbox_pixels]
-        self._rle_compressed_old_modified_bbox_pixels = encode_rle(self._rle_compressed_old_modified_bbox_pixels)
-        self._old_bbox_pixels = None
+        """
+        Compress tile deltas in a worker thread, so the end of a large brush stroke does not block the GUI.
+        Tile deltas are not modified after the merging, so until the compression finishes,
+        undo/redo use the uncompressed data and do not have to wait for the compression.
+        """
+        self._mergeable = False
 
-        self._compressed_modified_bbox_pixels = np.packbits(self._modified_bbox_pixels)
-        self._modified_bbox_pixels = None
+        tile_deltas = list(self._tile_delta_by_index.values())
+        self._compression_task = ThreadPool.call_async(self._compressed_tile_deltas_data, tile_deltas)
+        compression_task = self._compression_task
+        self._compression_task.on_finished = lambda compressed_data_list: \
+            self._on_tile_deltas_compressed(compression_task, tile_deltas, compressed_data_list)
 
-        self._mergeable = False
+    @staticmethod
+    def _compressed_tile_deltas_data(tile_deltas: list[MaskTileDelta]) -> list[tuple]:
+        return [tile_delta.compressed() for tile_delta in tile_deltas]
 
-    def _uncompressed_modified_bbox_pixels(self) -> np.ndarray:
-        modified_bbox_pixels = np.unpackbits(
-            self._compressed_modified_bbox_pixels, count=self._modified_bbox.element_count)
-        modified_bbox_pixels = modified_bbox_pixels.reshape(self._modified_bbox.shape)
-        # Change np.uint8 type to bool type using |view| method. It's much faster than |astype|
-        modified_bbox_pixels = modified_bbox_pixels.view(bool)
-        return modified_bbox_pixels
+    def _on_tile_deltas_compressed(
+            self, compression_task: Task, tile_deltas: list[MaskTileDelta], compressed_data_list: list[tuple]):
+        if self._compression_task is not compression_task:
+            # The command was released during the compression
+            return
+
+        self._compression_task = None
+        for tile_delta, compressed_data in zip(tile_deltas, compressed_data_list):
+            tile_delta.set_compressed_data(compressed_data)
+        self._byte_size = self._tile_deltas_byte_size()
+        # Now the command can be spilled, so undo memory limits have to be enforced again
+        self._notify_byte_size_changed()
 
 
 class FinishModifyMaskCommand(ModifyMaskCommand):
@@ -566,10 +771,62 @@ class FinishModifyMaskCommand(ModifyMaskCommand):
         pass
 
 
+@dataclass
+class SmartBrushDab:
+    """Snapshot of the tool state, which is required to compute a smart brush dab in a worker thread."""
+    generation: int
+    mode: Mode
+    stroke_id: int
+    pixel_coords: tuple[float, float]  # Brush center in the tool mask
+    brush_bbox: BBox
+    image_in_brush_bbox: np.ndarray
+    # Cache of image features, which are clustered instead of the image, or None
+    feature_tile_cache: ImageFeatureTileCache | None
+    # Cache of superpixels, which are clustered instead of pixels, or None
+    superpixel_tile_cache: SuperpixelTileCache | None
+    feature_scale_level: int
+    downscaled_brush_shape: np.ndarray
+    downscaled_brush_center: np.ndarray
+    # Start of the brush movement, if the brush is swept from the previous dab of the stroke,
+    # else it is equal to the brush center
+    downscaled_stroke_start: np.ndarray
+    stencil_bbox: BBox  # Bbox of the brush ellipse (or swept capsule) stencil in the downscaled brush bbox
+    stencil: npt.NDArray[bool]
+    painted_cluster_brightness_index: int | None
+    mask_class: int
+    repainted_mask_class: int | None  # None to repaint all classes
+
+
+@dataclass
+class SimpleBrushDab:
+    """Snapshot of the tool state, which is required to draw a simple brush dab after the computing smart dabs."""
+    mode: Mode
+    stroke_id: int
+    brush_bbox: BBox
+    downscaled_brush_shape: np.ndarray
+    stencil_bbox: BBox
+    stencil: npt.NDArray[bool]
+    mask_class: int
+    repainted_mask_class: int | None  # None to repaint all classes
+
+
+@dataclass
+class SmartBrushDabResult:
+    tool_mask_in_brush_bbox_without_foreground: npt.NDArray[MASK_TYPE]
+    tool_mask_foreground_pixels: npt.NDArray[bool]
+    # Brightness index of the cluster under the mouse pointer, which is found in the DRAW mode
+    central_cluster_brightness_index: int | None
+
+
 class WsiSmartBrushTool(LayeredDataViewerTool):
     # Store and increment stroke ID, when DRAW or ERASE mode is activated.
     # Use class attribute, because new instances of tool are created, when tool is activated/deactivated
     _STROKE_ID = 0
+    # Caches of image features with modification generations of the images, for which they are created
+    _feature_tile_cache_by_image: weakref.WeakKeyDictionary[Raster, tuple[int, ImageFeatureTileCache]] = \
+        weakref.WeakKeyDictionary()
+    _superpixel_tile_cache_by_image: weakref.WeakKeyDictionary[Raster, tuple[int, SuperpixelTileCache]] = \
+        weakref.WeakKeyDictionary()
 
     def __init__(
             self,
@@ -582,12 +839,27 @@ class WsiSmartBrushTool(LayeredDataViewerTool):
         self._mode = None
         self._brush_bbox = None
         self._is_stroke_finished = True
-        self._is_mask_modified_during_stroke = False
-        self._stroke_central_cluster_brightness_index: int | None = None  # Index of the central cluster
-        # (under mouse pointer) in the sorted array by brightness. Set at the start of a brush stroke
-        # and remains constant throughout the stroke.
+        # ID of the stroke, which modified the mask, but is not finished by the FinishModifyMaskCommand yet
+        self._modified_stroke_id: int | None = None
+        # (Stroke ID, index of the central cluster (under mouse pointer) in the sorted array by brightness).
+        # The index is found by the first drawn dab of a brush stroke and remains constant throughout the stroke.
+        self._stroke_central_cluster: tuple[int, int] | None = None
         self._stroke_repainted_mask_class: int | MASK_TYPE | None = None  # Mask class under the mouse pointer,
         # set at the start of a brush stroke and remains constant throughout the stroke.
+        # Position of the last drawn (or computing) dab of the stroke. Next dab sweeps the brush from it
+        self._stroke_last_pixel_coords: tuple[float, float] | None = None
+
+        # Smart dabs are computed one at a time in a worker thread, and pending dabs wait for the computing one.
+        # The latest requested dab replaces the last pending one, but dabs, which modify the mask, are not replaced
+        # by dabs of other modes or strokes. Simple dabs, which modify the mask, wait for the computing dab too,
+        # so the mask is modified in order of requests. Results of SHOW dabs with outdated generation are ignored
+        self._smart_dab_task: Task | None = None
+        self._pending_dabs: list[SmartBrushDab | SimpleBrushDab] = []
+        self._smart_dab_generation = 0
+        # Is used only by the single running dab computation
+        self._component_filler = SeededComponentFiller()
+
+        self._superpixel_precalculation_task: Task | None = None
 
         self._radius_scaler = RadiusScaler(
             self.settings.min_radius, self.settings.max_radius, self.settings.radius_zoom_factor)
@@ -617,8 +889,13 @@ class WsiSmartBrushTool(LayeredDataViewerTool):
         else:
             self.mode = Mode.HIDE
 
+        self._precalculate_visible_superpixels()
+
     def deactivate(self):
         self.mode = None
+        self._cancel_smart_dabs()
+        # Masks are removed, so pending dabs cannot be applied
+        self._pending_dabs.clear()
 
         self.viewer.viewport.setMouseTracking(False)
 
@@ -670,6 +947,7 @@ class WsiSmartBrushTool(LayeredDataViewerTool):
 
             case QEvent.Type.Enter:
                 self.mode = Mode.SHOW
+                self._precalculate_visible_superpixels()
                 self._handle_mode_event(event)
             case QEvent.Type.Leave:
                 self.mode = Mode.HIDE
@@ -681,12 +959,10 @@ class WsiSmartBrushTool(LayeredDataViewerTool):
         if self._mode is not Mode.PICK:
             self.mode = new_mode
 
-    @property
-    def _brush_stroke_text(self) -> str:
-        return f'Brush Stroke #{self._STROKE_ID}'
-
     def _process_wheel_event(self, wheel_event: QWheelEvent):
         self.settings.radius = self._radius_scaler.scale(self.settings.radius, wheel_event)
+        # Scale level of superpixels depends on the radius
+        self._precalculate_visible_superpixels()
 
     def _handle_mode_event(self, event: QEvent):
         """Handle the event based on current mode"""
@@ -694,13 +970,13 @@ class WsiSmartBrushTool(LayeredDataViewerTool):
         # if not self.viewer.has_image():
         #     return
 
-        # Erase old tool mask
-        self._erase_brush()
-
         match self._mode:
             case Mode.HIDE:
-                pass
+                self._cancel_smart_dabs()
+                self._erase_brush()
             case Mode.PICK:
+                self._cancel_smart_dabs()
+                self._erase_brush()
                 if isinstance(event, QMouseEvent) and event.buttons() == Qt.MouseButton.LeftButton:
                     self._pick_mask_class_in_pos(event.position().toPoint())
             case _:
@@ -737,219 +1013,536 @@ class WsiSmartBrushTool(LayeredDataViewerTool):
     def draw_brush(self, row_f: float, col_f: float):
         row_spatial_radius, col_spatial_radius = \
             self.tool_mask.map_spatial_vector_to_pixel_vector(np.array([self.settings.radius, self.settings.radius]))
-        not_clipped_brush_bbox = BBox(
-            int(round(col_f - col_spatial_radius)), int(round(col_f + col_spatial_radius)) + 1,
-            int(round(row_f - row_spatial_radius)), int(round(row_f + row_spatial_radius)) + 1)
-        self._brush_bbox = not_clipped_brush_bbox.clipped_to_shape(self.tool_mask.shape)
-        brush_clip_bbox = self._brush_bbox.calculate_clip_bbox(not_clipped_brush_bbox)
-        if self._brush_bbox.empty:
+        not_clipped_brush_bbox = self._not_clipped_dab_bbox(row_f, col_f, row_spatial_radius, col_spatial_radius)
+        brush_center_in_bbox = (np.array(not_clipped_brush_bbox.shape) - 1) / 2
+        # When the mouse moves fast, sweep the brush from the previous dab of the stroke,
+        # so the stroke has no gaps, and process the swept region at once
+        stroke_start_in_bbox = None
+        if (self._mode in (Mode.DRAW, Mode.ERASE) and self._stroke_last_pixel_coords is not None
+                and self._stroke_last_pixel_coords != (row_f, col_f)):
+            stroke_start_bbox = self._not_clipped_dab_bbox(
+                *self._stroke_last_pixel_coords, row_spatial_radius, col_spatial_radius)
+            swept_bbox = not_clipped_brush_bbox.united_with(stroke_start_bbox)
+            brush_center_in_bbox += (
+                not_clipped_brush_bbox.top - swept_bbox.top, not_clipped_brush_bbox.left - swept_bbox.left)
+            stroke_start_in_bbox = brush_center_in_bbox + np.subtract(self._stroke_last_pixel_coords, (row_f, col_f))
+            not_clipped_brush_bbox = swept_bbox
+        brush_bbox = not_clipped_brush_bbox.clipped_to_shape(self.tool_mask.shape)
+        brush_clip_bbox = brush_bbox.calculate_clip_bbox(not_clipped_brush_bbox)
+        # Smart dabs are computed in a worker thread, and the old brush is erased, when a new one is computed
+        is_smart_dab = self.settings.smart_mode_enabled and self._mode is not Mode.ERASE
+        if not is_smart_dab or brush_bbox.empty:
+            self._cancel_smart_dabs()
+            self._erase_brush()
+            self._brush_bbox = brush_bbox
+        if brush_bbox.empty:
             return
 
         # Downscale the image in brush region if radius is large.
         # Smaller analyzed region will improve performance of algorithms
-        # (skimage.draw.ellipse, cv2.kmeans, skimage.measure.label) at the expense of accuracy.
-        downscale_factor = min(1, self.settings.max_radius_without_downscale / self.settings.radius)
-        downscaled_brush_shape_f = \
-            (self._brush_bbox.height * downscale_factor, self._brush_bbox.width * downscale_factor)
+        # (clustering, connected component extraction) at the expense of accuracy.
+        downscale_factor = self._downscale_factor()
+        downscaled_brush_shape_f = (brush_bbox.height * downscale_factor, brush_bbox.width * downscale_factor)
         downscaled_brush_shape = np.rint(downscaled_brush_shape_f).astype(int) + 1
         if (downscaled_brush_shape == 0).any():
             return
 
-        not_clipped_brush_bbox_center = (np.array(not_clipped_brush_bbox.shape) - 1) / 2
-        brush_center = np.array(brush_clip_bbox.map_rc_point(not_clipped_brush_bbox_center))
+        brush_center = np.array(brush_clip_bbox.map_rc_point(brush_center_in_bbox))
         downscaled_brush_center_f = brush_center * downscale_factor
         downscaled_brush_center = np.rint(downscaled_brush_center_f).astype(int)
 
         row_downscaled_radius, col_downscaled_radius = \
             row_spatial_radius * downscale_factor, col_spatial_radius * downscale_factor
 
-        rr, cc = skimage.draw.ellipse(  # we can use rounded row, col and radii,
-            # but float values give more precise resulting ellipse indexes
-            *downscaled_brush_center_f, row_downscaled_radius, col_downscaled_radius,
-            shape=downscaled_brush_shape)  # try with downscaled_brush_shape_f
-
-        downscaled_tool_mask_in_brush_bbox = (
-            np.full(shape=downscaled_brush_shape, fill_value=self.settings.tool_background_class, dtype=MASK_TYPE))
+        if stroke_start_in_bbox is None:
+            downscaled_stroke_start = downscaled_brush_center_f
+            stencil_bbox, stencil = ellipse_stencil(
+                *downscaled_brush_center_f, row_downscaled_radius, col_downscaled_radius, shape=downscaled_brush_shape)
+        else:
+            downscaled_stroke_start = np.array(brush_clip_bbox.map_rc_point(stroke_start_in_bbox)) * downscale_factor
+            stencil_bbox, stencil = capsule_stencil(
+                *downscaled_stroke_start, *downscaled_brush_center_f, row_downscaled_radius, col_downscaled_radius,
+                shape=downscaled_brush_shape)
+
+        if not is_smart_dab:
+            simple_dab = SimpleBrushDab(
+                mode=self._mode,
+                stroke_id=self._STROKE_ID,
+                brush_bbox=brush_bbox,
+                downscaled_brush_shape=downscaled_brush_shape,
+                stencil_bbox=stencil_bbox,
+                stencil=stencil,
+                mask_class=self.settings.mask_foreground_class,
+                repainted_mask_class=self._repainted_mask_class(self._mode),
+            )
+            if self._mode in (Mode.DRAW, Mode.ERASE):
+                self._stroke_last_pixel_coords = (row_f, col_f)
+            self._request_simple_dab(simple_dab)
+            return
 
-        if not self.settings.smart_mode_enabled or self._mode is Mode.ERASE:
-            tool_class, mask_class = (
-                (self.settings.tool_eraser_class, self.settings.mask_background_class)
-                if self._mode is Mode.ERASE
-                else (self.settings.tool_fixed_class, self.settings.mask_foreground_class)
+        smart_dab = SmartBrushDab(
+            generation=self._smart_dab_generation,
+            mode=self._mode,
+            stroke_id=self._STROKE_ID,
+            pixel_coords=(row_f, col_f),
+            brush_bbox=brush_bbox,
+            # The image is not modified by the tool, so a view is enough
+            image_in_brush_bbox=self.image.bboxed_pixels(brush_bbox),
+            feature_tile_cache=self._feature_tile_cache(),
+            superpixel_tile_cache=self._superpixel_tile_cache() if self.settings.superpixels_enabled else None,
+            feature_scale_level=ImageFeatureTileCache.scale_level(downscale_factor),
+            downscaled_brush_shape=downscaled_brush_shape,
+            downscaled_brush_center=downscaled_brush_center,
+            downscaled_stroke_start=downscaled_stroke_start,
+            stencil_bbox=stencil_bbox,
+            stencil=stencil,
+            # The central cluster of the stroke is resolved, when the dab computation is started
+            painted_cluster_brightness_index=self.settings.painted_cluster_brightness_index,
+            mask_class=self.settings.mask_foreground_class,
+            repainted_mask_class=self._repainted_mask_class(self._mode),
+        )
+        self._request_smart_dab(smart_dab)
+
+    def _downscale_factor(self) -> float:
+        return min(1, self.settings.max_radius_without_downscale / self.settings.radius)
+
+    def _feature_tile_cache(self) -> ImageFeatureTileCache | None:
+        if self.settings.image_feature is None or self.image.n_channels < 3:
+            return None
+
+        # Superpixel cache gets the rest of the size, when superpixels are enabled
+        size_limit = (self.settings.feature_cache_size // 2 if self.settings.superpixels_enabled
+                      else self.settings.feature_cache_size)
+        generation, cache = self._feature_tile_cache_by_image.get(self.image, (None, None))
+        if (cache is None or generation != self.image.modification_generation
+                or cache.image_pixels is not self.image.pixels or cache.feature is not self.settings.image_feature
+                or cache.size_limit != size_limit):
+            cache = ImageFeatureTileCache(self.image.pixels, self.settings.image_feature, size_limit)
+            self._feature_tile_cache_by_image[self.image] = (self.image.modification_generation, cache)
+        return cache
+
+    def _superpixel_tile_cache(self) -> SuperpixelTileCache:
+        feature_tile_cache = self._feature_tile_cache()
+        size_limit = self.settings.feature_cache_size
+        if feature_tile_cache is not None:
+            size_limit -= feature_tile_cache.size_limit
+        generation, cache = self._superpixel_tile_cache_by_image.get(self.image, (None, None))
+        if (cache is None or generation != self.image.modification_generation
+                or cache.image_pixels is not self.image.pixels or cache.feature_tile_cache is not feature_tile_cache
+                or cache.size_limit != size_limit
+                or cache.superpixel_size != self.settings.superpixel_size
+                or cache.compactness != self.settings.superpixel_compactness):
+            cache = SuperpixelTileCache(
+                self.image.pixels,
+                size_limit,
+                self.settings.superpixel_size,
+                self.settings.superpixel_compactness,
+                feature_tile_cache,
             )
+            self._superpixel_tile_cache_by_image[self.image] = (self.image.modification_generation, cache)
+        return cache
 
-            downscaled_tool_mask_in_brush_bbox[rr, cc] = tool_class
-            tool_mask_in_brush_bbox, temp_tool_class = self.resize_indexed_binary_image(
-                downscaled_tool_mask_in_brush_bbox,
-                self._brush_bbox.size,
-                self.settings.tool_background_class,
-                tool_class)
-            pixels_under_brush = tool_mask_in_brush_bbox == temp_tool_class
+    def _precalculate_visible_superpixels(self):
+        """Calculate superpixels of the visible image region in the background, so dabs only gather them."""
+        if (not self.settings.superpixels_enabled or not self.settings.smart_mode_enabled
+                or self.image is None or self._superpixel_precalculation_task is not None):
+            return
 
-            if tool_class == temp_tool_class:
-                self.tool_mask.bboxed_pixels(self._brush_bbox)[...] = tool_mask_in_brush_bbox
-            else:
-                self.tool_mask.bboxed_pixels(self._brush_bbox)[pixels_under_brush] = tool_class
+        viewport_rect = self.viewer.viewport.rect()
+        top_left_row, top_left_col = self.map_viewport_to_pixel_indices(viewport_rect.topLeft(), self.tool_mask_layer)
+        bottom_right_row, bottom_right_col = self.map_viewport_to_pixel_indices(
+            viewport_rect.bottomRight(), self.tool_mask_layer)
+        visible_bbox = BBox(
+            int(top_left_col), int(bottom_right_col) + 1, int(top_left_row), int(bottom_right_row) + 1,
+        ).clipped_to_shape(self.image.shape)
+        if visible_bbox.empty:
+            return
 
-            modified_mask_pixels_under_brush = pixels_under_brush & self.modifiable_mask_pixels(mask_class)
-            if self._mode is Mode.SHOW:
-                self.tool_mask.bboxed_pixels(self._brush_bbox)[modified_mask_pixels_under_brush] = (
-                    self.settings.tool_foreground_class)
-            self.tool_mask.emit_pixels_modified(self._brush_bbox)
+        self._superpixel_precalculation_task = ThreadPool.call_async(
+            self._precalculate_superpixels,
+            self._superpixel_tile_cache(),
+            visible_bbox,
+            SuperpixelTileCache.scale_level(self._downscale_factor()),
+        )
+        self._superpixel_precalculation_task.on_finished = self._on_superpixel_precalculation_finished
 
-            if self._mode in [Mode.ERASE, Mode.DRAW] and modified_mask_pixels_under_brush.any():
-                command_text = (
-                    f'{self._brush_stroke_text}: Erase'
-                    if self._mode is Mode.ERASE
-                    else f'{self._brush_stroke_text}: Draw Class {mask_class}'
-                )
-                self._create_and_push_modify_mask_command(modified_mask_pixels_under_brush, mask_class, command_text)
+    @staticmethod
+    def _precalculate_superpixels(superpixel_tile_cache: SuperpixelTileCache, bbox: BBox, level: int):
+        try:
+            superpixel_tile_cache.precalculate_tiles(bbox, level)
+        except Exception:
+            # Else the task is not finished, and superpixels are not precalculated anymore
+            logging.exception('Cannot precalculate superpixels')
 
-            return
+    def _on_superpixel_precalculation_finished(self, _result):
+        self._superpixel_precalculation_task = None
 
-        image_in_brush_bbox = self.image.bboxed_pixels(self._brush_bbox)
-        downscaled_image_in_brush_bbox = cv2.resize(
-            image_in_brush_bbox, tuple(reversed(downscaled_brush_shape)), interpolation=cv2.INTER_AREA)
+    @staticmethod
+    def _not_clipped_dab_bbox(row_f: float, col_f: float, row_radius: float, col_radius: float) -> BBox:
+        return BBox(
+            int(round(col_f - col_radius)), int(round(col_f + col_radius)) + 1,
+            int(round(row_f - row_radius)), int(round(row_f + row_radius)) + 1)
+
+    def _draw_simple_brush(self, simple_dab: SimpleBrushDab):
+        tool_class, mask_class = (
+            (self.settings.tool_eraser_class, self.settings.mask_background_class)
+            if simple_dab.mode is Mode.ERASE
+            else (self.settings.tool_fixed_class, simple_dab.mask_class)
+        )
 
-        downscaled_image_in_brush_bbox = self._preprocess_downscaled_image_in_brush_bbox(downscaled_image_in_brush_bbox)
-        samples = downscaled_image_in_brush_bbox[rr, cc]
-        if len(samples.shape) == 2:  # if there is an axis with channels (multichannel image)
-            samples = samples[:, 0]  # use only the first channel
-        samples = samples.astype(np.float32)
-        if self.settings.number_of_clusters > samples.size:
-            return
+        self._erase_brush()
+        self._brush_bbox = simple_dab.brush_bbox
+
+        downscaled_tool_mask_in_brush_bbox = np.full(
+            shape=simple_dab.downscaled_brush_shape, fill_value=self.settings.tool_background_class, dtype=MASK_TYPE)
+        simple_dab.stencil_bbox.pixels(downscaled_tool_mask_in_brush_bbox)[simple_dab.stencil] = tool_class
+        tool_mask_in_brush_bbox, temp_tool_class = self.resize_indexed_binary_image(
+            downscaled_tool_mask_in_brush_bbox,
+            self._brush_bbox.size,
+            self.settings.tool_background_class,
+            tool_class)
+        pixels_under_brush = tool_mask_in_brush_bbox == temp_tool_class
+
+        if tool_class == temp_tool_class:
+            self.tool_mask.bboxed_pixels(self._brush_bbox)[...] = tool_mask_in_brush_bbox
+        else:
+            self.tool_mask.bboxed_pixels(self._brush_bbox)[pixels_under_brush] = tool_class
+
+        modified_mask_pixels_under_brush = pixels_under_brush & self._modifiable_mask_pixels_in_bbox(
+            self._brush_bbox, mask_class, simple_dab.repainted_mask_class)
+        if simple_dab.mode is Mode.SHOW:
+            self.tool_mask.bboxed_pixels(self._brush_bbox)[modified_mask_pixels_under_brush] = (
+                self.settings.tool_foreground_class)
+        self.tool_mask.emit_pixels_modified(self._brush_bbox)
+
+        if simple_dab.mode in [Mode.ERASE, Mode.DRAW] and modified_mask_pixels_under_brush.any():
+            command_text = (
+                f'Brush Stroke #{simple_dab.stroke_id}: Erase'
+                if simple_dab.mode is Mode.ERASE
+                else f'Brush Stroke #{simple_dab.stroke_id}: Draw Class {mask_class}'
+            )
+            self._create_and_push_modify_mask_command(
+                modified_mask_pixels_under_brush, mask_class, command_text, simple_dab.stroke_id)
+
+    def _request_simple_dab(self, simple_dab: SimpleBrushDab):
+        if simple_dab.mode in (Mode.DRAW, Mode.ERASE) and self._smart_dab_task is not None:
+            # Modify the mask after the computing (and pending) smart dabs
+            self._pending_dabs.append(simple_dab)
+        else:
+            self._draw_simple_brush(simple_dab)
+
+    def _request_smart_dab(self, smart_dab: SmartBrushDab):
+        if self._smart_dab_task is None:
+            self._start_smart_dab_computation(smart_dab)
+        elif self._pending_dabs and self._can_replace_pending_dab(self._pending_dabs[-1], smart_dab):
+            # Latest wins, so computations do not queue up behind the cursor
+            self._pending_dabs[-1] = smart_dab
+        else:
+            self._pending_dabs.append(smart_dab)
+
+    @staticmethod
+    def _can_replace_pending_dab(pending_dab: SmartBrushDab | SimpleBrushDab, smart_dab: SmartBrushDab) -> bool:
+        if pending_dab.mode is Mode.SHOW:
+            return True
+        # A new DRAW dab of the stroke is swept from the computing dab, so it covers the replaced one
+        return (isinstance(pending_dab, SmartBrushDab) and pending_dab.mode is Mode.DRAW
+                and smart_dab.mode is Mode.DRAW and smart_dab.stroke_id == pending_dab.stroke_id)
+
+    def _start_smart_dab_computation(self, smart_dab: SmartBrushDab):
+        if smart_dab.mode is Mode.DRAW:
+            if (smart_dab.painted_cluster_brightness_index is None and self._stroke_central_cluster is not None
+                    and self._stroke_central_cluster[0] == smart_dab.stroke_id):
+                # Previous dabs of the stroke are applied, so the central cluster is known, if it was found
+                smart_dab.painted_cluster_brightness_index = self._stroke_central_cluster[1]
+            if smart_dab.stroke_id == self._STROKE_ID and not self._is_stroke_finished:
+                # Next dabs are swept from this one. Pending dabs, which are replaced, do not leave gaps,
+                # because they are not started
+                self._stroke_last_pixel_coords = smart_dab.pixel_coords
+        self._smart_dab_task = ThreadPool.call_async(self._compute_smart_dab_or_none, smart_dab)
+        self._smart_dab_task.on_finished = partial(self._on_smart_dab_computed, smart_dab)
+
+    def _on_smart_dab_computed(self, smart_dab: SmartBrushDab, result: SmartBrushDabResult | None):
+        self._smart_dab_task = None
+        if smart_dab.mode is Mode.DRAW and result is not None and result.central_cluster_brightness_index is not None:
+            self._stroke_central_cluster = (smart_dab.stroke_id, result.central_cluster_brightness_index)
+
+        # Masks are removed, when the tool is deactivated
+        if self.tool_mask_layer is not None:
+            if smart_dab.generation == self._smart_dab_generation:
+                self._apply_smart_dab(smart_dab, result)
+            elif smart_dab.mode is Mode.DRAW:
+                # The brush is hidden or replaced, but the dab is still a part of the drawn stroke
+                self._modify_mask_by_smart_dab(smart_dab, result)
+
+        self._start_pending_dabs()
+
+    def _start_pending_dabs(self):
+        """Draw pending simple dabs until a pending smart dab, which computation is started."""
+        while self._pending_dabs:
+            pending_dab = self._pending_dabs.pop(0)
+            if isinstance(pending_dab, SmartBrushDab):
+                self._start_smart_dab_computation(pending_dab)
+                return
+
+            if self.tool_mask_layer is not None:
+                self._draw_simple_brush(pending_dab)
 
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-        ret, labels, centers = cv2.kmeans(
-            samples, self.settings.number_of_clusters, None, criteria, 10, cv2.KMEANS_PP_CENTERS)
-        labels = labels.ravel()  # 2D array (one column) to 1D array without copy
-        centers = centers.ravel()
+        if self._is_stroke_finished:
+            self._finish_modified_stroke()
+
+    def _cancel_smart_dabs(self):
+        # Results of the computing SHOW dab will be ignored. Other dabs modify the mask, so they are still applied
+        self._smart_dab_generation += 1
+        self._pending_dabs = [pending_dab for pending_dab in self._pending_dabs if pending_dab.mode is not Mode.SHOW]
+
+    def _compute_smart_dab_or_none(self, smart_dab: SmartBrushDab) -> SmartBrushDabResult | None:
+        try:
+            return self._compute_smart_dab(smart_dab)
+        except Exception:
+            # Else the task is not finished, and next dabs are not computed
+            logging.exception('Cannot compute the smart brush dab')
+            return None
+
+    def _compute_smart_dab(self, smart_dab: SmartBrushDab) -> SmartBrushDabResult | None:
+        """
+        Cluster and label the image under the brush. It is called in a worker thread,
+        so it uses only the `smart_dab` and constant settings, and does not modify the tool state.
+        :return: None, if nothing has to be drawn
+        """
+        settings = self.settings
+        brush_size = smart_dab.brush_bbox.size
+        stencil_bbox, stencil = smart_dab.stencil_bbox, smart_dab.stencil
 
-        if ((painted_cluster_brightness_index := self.settings.painted_cluster_brightness_index) is None
-                and self._mode is Mode.DRAW):
-            painted_cluster_brightness_index = self._stroke_central_cluster_brightness_index
-        downscaled_brush_center_row, downscaled_brush_center_col = downscaled_brush_center
+        if smart_dab.superpixel_tile_cache is None:
+            clustering = self._cluster_pixels(smart_dab)
+        else:
+            clustering = self._cluster_superpixels(smart_dab)
+        if clustering is None:
+            return None
+
+        labels, centers = clustering
+
+        painted_cluster_brightness_index = smart_dab.painted_cluster_brightness_index
+        central_cluster_brightness_index = None
         if painted_cluster_brightness_index is None:
             # Need to find the central (under mouse pointer) cluster brightness index
-            center_pixel_indexes = np.where(
-                (rr == downscaled_brush_center_row) & (cc == downscaled_brush_center_col))[0]
-            if center_pixel_indexes.size != 1:  # Handle cases where the center pixel is out of the image
-                return
-            center_pixel_index = center_pixel_indexes[0]
+            center_pixel_index = stencil_pixel_index(
+                stencil, *stencil_bbox.map_rc_point(smart_dab.downscaled_brush_center))
+            if center_pixel_index is None:  # Handle cases where the center pixel is out of the image
+                return None
             painted_cluster_label = labels[center_pixel_index]
 
-            if self._mode is Mode.DRAW:
+            if smart_dab.mode is Mode.DRAW:
                 # Sort clusters by brightness and find the index of the painted cluster in the sorted array
                 sorted_indices = np.argsort(centers, axis=0).ravel()
-                self._stroke_central_cluster_brightness_index = np.where(
-                    sorted_indices == painted_cluster_label)[0][0]
+                central_cluster_brightness_index = np.where(sorted_indices == painted_cluster_label)[0][0]
         else:
             # Sort clusters by brightness and get the sorted indices
             sorted_indices = np.argsort(centers, axis=0).ravel()
             # Find the original index of the cluster at the given brightness index
             painted_cluster_label = sorted_indices[painted_cluster_brightness_index]
 
-        tool_mask_circle_pixels = np.full_like(labels, fill_value=self.settings.tool_no_paint_class, dtype=MASK_TYPE)
-        tool_mask_circle_pixels[labels == painted_cluster_label] = self.settings.tool_foreground_class
-        downscaled_tool_mask_in_brush_bbox[rr, cc] = tool_mask_circle_pixels
-
-        if self.settings.paint_connected_component:
-            if (0 <= downscaled_brush_center_row < downscaled_tool_mask_in_brush_bbox.shape[0]
-                    and 0 <= downscaled_brush_center_col < downscaled_tool_mask_in_brush_bbox.shape[1]):
-
-                labeled_tool_mask_in_brush_bbox = skimage.measure.label(
-                    downscaled_tool_mask_in_brush_bbox, background=self.settings.tool_background_class)
-                label_under_mouse = labeled_tool_mask_in_brush_bbox[
-                    downscaled_brush_center_row, downscaled_brush_center_col]
-                downscaled_tool_mask_in_brush_bbox[
-                    (downscaled_tool_mask_in_brush_bbox == self.settings.tool_foreground_class) &
-                    (labeled_tool_mask_in_brush_bbox != label_under_mouse)
-                ] = self.settings.tool_unconnected_component_class
-            else:
-                downscaled_tool_mask_in_brush_bbox[
-                    downscaled_tool_mask_in_brush_bbox == self.settings.tool_foreground_class
-                ] = self.settings.tool_unconnected_component_class
+        downscaled_tool_mask_in_brush_bbox = np.full(
+            shape=smart_dab.downscaled_brush_shape, fill_value=settings.tool_background_class, dtype=MASK_TYPE)
+        tool_mask_circle_pixels = np.full_like(labels, fill_value=settings.tool_no_paint_class, dtype=MASK_TYPE)
+        tool_mask_circle_pixels[labels == painted_cluster_label] = settings.tool_foreground_class
+        stencil_bbox.pixels(downscaled_tool_mask_in_brush_bbox)[stencil] = tool_mask_circle_pixels
+
+        if settings.paint_connected_component:
+            # Paint components under the mouse pointer path (or under the mouse pointer for a single dab)
+            seed_rows, seed_cols = self._stroke_path_pixels(
+                smart_dab.downscaled_stroke_start, smart_dab.downscaled_brush_center,
+                downscaled_tool_mask_in_brush_bbox.shape)
+            connected_component_pixels = self._component_filler.fill(
+                downscaled_tool_mask_in_brush_bbox, settings.tool_foreground_class, seed_rows, seed_cols)
+            downscaled_tool_mask_in_brush_bbox[
+                (downscaled_tool_mask_in_brush_bbox == settings.tool_foreground_class) & ~connected_component_pixels
+            ] = settings.tool_unconnected_component_class
 
         # Downscaled tool mask contains multiple indexes.
         # Resize with INTER_LINEAR_EXACT cannot be used for indexed images with more than two indexes.
         # Therefore, we resize twice.
         # First quick resize: Remove the foreground class and use INTER_NEAREST to resize all other unimportant classes.
         downscaled_tool_mask_foreground_pixels = (
-                downscaled_tool_mask_in_brush_bbox == self.settings.tool_foreground_class)
+                downscaled_tool_mask_in_brush_bbox == settings.tool_foreground_class)
         downscaled_tool_mask_without_foreground = downscaled_tool_mask_in_brush_bbox.copy()
         downscaled_tool_mask_without_foreground[
-            downscaled_tool_mask_foreground_pixels] = self.settings.tool_no_paint_class
+            downscaled_tool_mask_foreground_pixels] = settings.tool_no_paint_class
         tool_mask_in_brush_bbox_without_foreground = cv2.resize(
             downscaled_tool_mask_without_foreground,
-            self._brush_bbox.size,
+            brush_size,
             interpolation=cv2.INTER_NEAREST)
 
         # Second resize: Use INTER_LINEAR_EXACT for accurate resizing of the foreground class.
         # Remove all values from the tool mask except background and foreground.
         downscaled_tool_mask_in_brush_bbox[
-            ~downscaled_tool_mask_foreground_pixels] = self.settings.tool_background_class
+            ~downscaled_tool_mask_foreground_pixels] = settings.tool_background_class
         tool_mask_in_brush_bbox, temp_tool_foreground_class = self.resize_indexed_binary_image(
             downscaled_tool_mask_in_brush_bbox,
-            self._brush_bbox.size,
-            self.settings.tool_background_class,
-            self.settings.tool_foreground_class)
-        tool_mask_temp_foreground_pixels = tool_mask_in_brush_bbox == temp_tool_foreground_class
+            brush_size,
+            settings.tool_background_class,
+            settings.tool_foreground_class)
+        tool_mask_foreground_pixels = tool_mask_in_brush_bbox == temp_tool_foreground_class
+        return SmartBrushDabResult(
+            tool_mask_in_brush_bbox_without_foreground, tool_mask_foreground_pixels, central_cluster_brightness_index)
+
+    def _cluster_pixels(self, smart_dab: SmartBrushDab) -> tuple[np.ndarray, np.ndarray] | None:
+        """:return: (cluster labels of stencil pixels, cluster centers) or None"""
+        if smart_dab.feature_tile_cache is None:
+            image_in_brush_bbox = smart_dab.image_in_brush_bbox
+        else:
+            # Gather cached features at the scale level, which is close to the downscaled brush scale
+            image_in_brush_bbox = smart_dab.feature_tile_cache.features(
+                smart_dab.brush_bbox, smart_dab.feature_scale_level)
+        downscaled_image_in_brush_bbox = cv2.resize(
+            image_in_brush_bbox, tuple(reversed(smart_dab.downscaled_brush_shape)), interpolation=cv2.INTER_AREA)
+
+        downscaled_image_in_brush_bbox = self._preprocess_downscaled_image_in_brush_bbox(downscaled_image_in_brush_bbox)
+        samples = smart_dab.stencil_bbox.pixels(downscaled_image_in_brush_bbox)[smart_dab.stencil]
+        if len(samples.shape) == 2:  # if there is an axis with channels (multichannel image)
+            samples = samples[:, 0]  # use only the first channel
+        return self._cluster_samples(samples)
+
+    def _cluster_superpixels(self, smart_dab: SmartBrushDab) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Cluster descriptors of superpixels under the stencil instead of pixels,
+        so the number of clustered samples does not depend on the brush radius.
+        :return: (cluster labels of stencil pixels, cluster centers) or None
+        """
+        superpixel_labels, descriptors = smart_dab.superpixel_tile_cache.superpixels(
+            smart_dab.brush_bbox, smart_dab.feature_scale_level)
+        downscaled_superpixel_labels = cv2.resize(
+            superpixel_labels, tuple(reversed(smart_dab.downscaled_brush_shape)), interpolation=cv2.INTER_NEAREST)
+        stencil_superpixel_labels = smart_dab.stencil_bbox.pixels(downscaled_superpixel_labels)[smart_dab.stencil]
+        superpixels, superpixel_indices = np.unique(stencil_superpixel_labels, return_inverse=True)
+        clustering = self._cluster_samples(descriptors[superpixels])
+        if clustering is None:
+            return None
+
+        superpixel_cluster_labels, centers = clustering
+        return superpixel_cluster_labels[superpixel_indices.ravel()], centers
+
+    def _cluster_samples(self, samples: np.ndarray) -> tuple[np.ndarray, np.ndarray] | None:
+        """:return: (cluster labels of the `samples`, cluster centers) or None, if there are too few samples"""
+        number_of_clusters = self.settings.number_of_clusters
+        if number_of_clusters > samples.size:
+            return None
+
+        # Exact histogram-based clustering of 8-bit samples is much faster than cv2.kmeans
+        clustering = kmeans_uint8(samples, number_of_clusters) if samples.dtype == np.uint8 else None
+        if clustering is None:
+            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+            ret, labels, centers = cv2.kmeans(
+                samples.astype(np.float32), number_of_clusters, None, criteria, 10, cv2.KMEANS_PP_CENTERS)
+            labels = labels.ravel()  # 2D array (one column) to 1D array without copy
+            centers = centers.ravel()
+        else:
+            labels, centers = clustering
+        return labels, centers
+
+    @staticmethod
+    def _stroke_path_pixels(
+            start: np.ndarray, end: np.ndarray, shape: Sequence[int]) -> tuple[np.ndarray, np.ndarray]:
+        """Return (rows, cols) of pixels of the segment from `start` to `end` point, which are inside the `shape`."""
+        point_count = int(np.ceil(np.abs(np.subtract(end, start)).max())) + 1
+        points = np.rint(np.linspace(start, end, point_count)).astype(int)
+        points = points[((points >= 0) & (points < shape)).all(axis=1)]
+        return points[:, 0], points[:, 1]
+
+    def _apply_smart_dab(self, smart_dab: SmartBrushDab, result: SmartBrushDabResult | None):
+        """Draw the computed dab in the tool mask and modify the mask. It is called in the GUI thread."""
+        self._erase_brush()
+        self._brush_bbox = smart_dab.brush_bbox
+        if result is None:
+            return
+
         tool_mask_foreground_class = (
-            self.settings.tool_foreground_class if self.mode is Mode.SHOW else self.settings.tool_fixed_class)
+            self.settings.tool_foreground_class if smart_dab.mode is Mode.SHOW else self.settings.tool_fixed_class)
+        tool_mask_in_brush_bbox = self.tool_mask.bboxed_pixels(self._brush_bbox)
         # Combine foreground and other classes from two resized tool masks.
-        self.tool_mask.bboxed_pixels(self._brush_bbox)[...] = np.where(
-            tool_mask_temp_foreground_pixels,
+        tool_mask_in_brush_bbox[...] = np.where(
+            result.tool_mask_foreground_pixels,
             tool_mask_foreground_class,
-            tool_mask_in_brush_bbox_without_foreground)
-
-        modifiable_mask_pixels = self.modifiable_mask_pixels(self.settings.mask_foreground_class)
+            result.tool_mask_in_brush_bbox_without_foreground)
 
-        if self.mode is Mode.SHOW:
-            fixed_mask_pixels = tool_mask_temp_foreground_pixels & ~modifiable_mask_pixels
-            self.tool_mask.bboxed_pixels(self._brush_bbox)[fixed_mask_pixels] = self.settings.tool_fixed_class
+        if smart_dab.mode is Mode.SHOW:
+            # The mask can be modified during the computation, so modifiable pixels are found here
+            modifiable_mask_pixels = self._modifiable_mask_pixels_in_bbox(
+                self._brush_bbox, smart_dab.mask_class, smart_dab.repainted_mask_class)
+            fixed_mask_pixels = result.tool_mask_foreground_pixels & ~modifiable_mask_pixels
+            tool_mask_in_brush_bbox[fixed_mask_pixels] = self.settings.tool_fixed_class
 
-        if self._mode is Mode.DRAW:
-            modified_mask_pixels = tool_mask_temp_foreground_pixels & modifiable_mask_pixels
-            if modified_mask_pixels.any():
-                command_text = f'{self._brush_stroke_text}: Draw Class {self.settings.mask_foreground_class}'
-                self._create_and_push_modify_mask_command(
-                    modified_mask_pixels, self.settings.mask_foreground_class, command_text)
+        self._modify_mask_by_smart_dab(smart_dab, result)
 
         self.tool_mask.emit_pixels_modified(self._brush_bbox)
 
+    def _modify_mask_by_smart_dab(self, smart_dab: SmartBrushDab, result: SmartBrushDabResult | None):
+        if smart_dab.mode is not Mode.DRAW or result is None:
+            return
+
+        # The mask can be modified during the computation, so modifiable pixels are found here
+        modifiable_mask_pixels = self._modifiable_mask_pixels_in_bbox(
+            smart_dab.brush_bbox, smart_dab.mask_class, smart_dab.repainted_mask_class)
+        modified_mask_pixels = result.tool_mask_foreground_pixels & modifiable_mask_pixels
+        if modified_mask_pixels.any():
+            command_text = f'Brush Stroke #{smart_dab.stroke_id}: Draw Class {smart_dab.mask_class}'
+            self._create_and_push_modify_mask_command(
+                modified_mask_pixels, smart_dab.mask_class, command_text, smart_dab.stroke_id, smart_dab.brush_bbox)
+
     def modifiable_mask_pixels(self, mask_class: int) -> npt.NDArray[bool]:
-        mask_in_brush_bbox = self.mask.bboxed_pixels(self._brush_bbox)
-        if self.settings.repainting_enabled or self._mode is Mode.ERASE:
-            if self.settings.repainting_mode is RepaintingMode.ALL or self._mode is Mode.ERASE:
-                return mask_in_brush_bbox != mask_class
+        return self._modifiable_mask_pixels_in_bbox(
+            self._brush_bbox, mask_class, self._repainted_mask_class(self._mode))
+
+    def _repainted_mask_class(self, mode: Mode) -> int | None:
+        """:return: the mask class, which can be repainted, or None, if all classes can be repainted"""
+        if self.settings.repainting_enabled or mode is Mode.ERASE:
+            if self.settings.repainting_mode is RepaintingMode.ALL or mode is Mode.ERASE:
+                return None
             elif self.settings.repainting_mode is RepaintingMode.POINTER:
                 if self._stroke_repainted_mask_class is None:
-                    repainted_class = self._mask_class_under_mouse_pointer()
-                else:
-                    repainted_class = self._stroke_repainted_mask_class
-            else:
-                repainted_class = self.settings.repainted_class
-        else:
-            repainted_class = self.settings.mask_background_class
+                    return self._mask_class_under_mouse_pointer()
+                return self._stroke_repainted_mask_class
+            return self.settings.repainted_class
+        return self.settings.mask_background_class
 
-        if mask_class == repainted_class:
-            return np.zeros_like(mask_in_brush_bbox, dtype=bool)
+    def _modifiable_mask_pixels_in_bbox(
+            self, bbox: BBox, mask_class: int, repainted_mask_class: int | None) -> npt.NDArray[bool]:
+        mask_in_bbox = self.mask.bboxed_pixels(bbox)
+        if repainted_mask_class is None:
+            return mask_in_bbox != mask_class
 
-        return mask_in_brush_bbox == repainted_class
+        if mask_class == repainted_mask_class:
+            return np.zeros_like(mask_in_bbox, dtype=bool)
+
+        return mask_in_bbox == repainted_mask_class
 
     def _create_and_push_modify_mask_command(
-            self, modified_bbox_pixels: np.ndarray, new_modified_bbox_pixels: int | np.ndarray, text: str):
+            self,
+            modified_bbox_pixels: np.ndarray,
+            new_modified_bbox_pixels: int | np.ndarray,
+            text: str,
+            stroke_id: int | None = None,
+            modified_bbox: BBox | None = None,
+    ):
+        if stroke_id is None:
+            stroke_id = self._STROKE_ID
+        if modified_bbox is None:
+            modified_bbox = self._brush_bbox
+        if self._modified_stroke_id not in (None, stroke_id):
+            # A dab of the new stroke is applied before the delayed finish of the previous stroke
+            self._finish_modified_stroke()
+
         modify_mask_command = ModifyMaskCommand(
-            self.mask, self._brush_bbox, modified_bbox_pixels, new_modified_bbox_pixels, text=text)
+            self.mask, modified_bbox, modified_bbox_pixels, new_modified_bbox_pixels, text=text)
         self._undo_manager.push(modify_mask_command)
-        self._is_mask_modified_during_stroke = True
+        self._modified_stroke_id = stroke_id
 
     def _preprocess_downscaled_image_in_brush_bbox(self, image: np.ndarray):
         return image
 
     def _start_stroke(self):
         self._is_stroke_finished = False
-        self._is_mask_modified_during_stroke = False
+        self._stroke_last_pixel_coords = None
         WsiSmartBrushTool._STROKE_ID += 1
 
         self._stroke_repainted_mask_class = self._mask_class_under_mouse_pointer()
@@ -958,13 +1551,19 @@ class WsiSmartBrushTool(LayeredDataViewerTool):
         if self._is_stroke_finished:
             return
 
-        self._stroke_central_cluster_brightness_index = None
         self._stroke_repainted_mask_class = None
+        self._stroke_last_pixel_coords = None
 
-        if self._is_mask_modified_during_stroke:
+        self._is_stroke_finished = True
+        if self._smart_dab_task is None:
+            self._finish_modified_stroke()
+        # Else the stroke is finished, when its computing dabs are applied
+
+    def _finish_modified_stroke(self):
+        if self._modified_stroke_id is not None:
             finish_stroke_command = FinishModifyMaskCommand()
             self._undo_manager.push(finish_stroke_command)
-        self._is_stroke_finished = True
+            self._modified_stroke_id = None
 
     @staticmethod
     def resize_indexed_binary_image(
@@ -1,15 +1,17 @@
 from __future__ import annotations
 
+import logging
 from collections import defaultdict
 from typing import TYPE_CHECKING
 
-from PySide6.QtCore import QObject, Qt
+from PySide6.QtCore import QObject, Qt, Signal
 from PySide6.QtGui import QUndoGroup, QUndoStack, QKeySequence
-from PySide6.QtWidgets import QUndoView, QDockWidget
+from PySide6.QtWidgets import QUndoView, QDockWidget, QLabel, QVBoxLayout, QWidget
 
 from bsmu.vision.core.plugins import Plugin
 from bsmu.vision.plugins.windows.main import EditMenu, WindowsMenu
 from bsmu.vision.undo import UndoCommand
+from bsmu.vision.undo.spill import UndoSpillFile
 
 if TYPE_CHECKING:
     from PySide6.QtGui import QAction
@@ -19,6 +21,9 @@ if TYPE_CHECKING:
     from bsmu.vision.plugins.doc_interfaces.mdi import MdiPlugin, Mdi
 
 
+_BYTES_IN_MB = 1 << 20
+
+
 class UndoPlugin(Plugin):
     _DEFAULT_DEPENDENCY_PLUGIN_FULL_NAME_BY_KEY = {
         'main_window_plugin': 'bsmu.vision.plugins.windows.main.MainWindowPlugin',
@@ -37,6 +42,7 @@ class UndoPlugin(Plugin):
         self._undo_manager: UndoManager | None = None
 
         self._undo_view = None
+        self._memory_usage_label: QLabel | None = None
         self._history_dock_widget = None
 
     @property
@@ -47,7 +53,14 @@ class UndoPlugin(Plugin):
         self._main_window = self._main_window_plugin.main_window
         self._mdi = self._mdi_plugin.mdi
 
-        self._undo_manager = UndoManager(self._mdi, self.config_value('stack_limit', 0))
+        self._undo_manager = UndoManager(
+            self._mdi,
+            self.config_value('stack_limit', 0),
+            round(self.config_value('stack_size_limit', 0) * _BYTES_IN_MB),
+            round(self.config_value('total_size_limit', 0) * _BYTES_IN_MB),
+            self.config_value('spill_to_disk', False),
+            round(self.config_value('spill_size_limit', 0) * _BYTES_IN_MB),
+        )
 
     def _enable_gui(self):
         edit_menu = self._main_window.menu(EditMenu)
@@ -74,25 +87,87 @@ class UndoPlugin(Plugin):
     def _on_history_action_triggered(self, checked: bool):
         if checked:
             self._undo_view = QUndoView(self._undo_manager.undo_group)
+            self._memory_usage_label = QLabel()
+
+            history_widget = QWidget()
+            history_layout = QVBoxLayout(history_widget)
+            history_layout.setContentsMargins(0, 0, 0, 0)
+            history_layout.addWidget(self._undo_view)
+            history_layout.addWidget(self._memory_usage_label)
+
+            self._undo_manager.memory_usage_changed.connect(self._update_memory_usage_label)
+            self._update_memory_usage_label()
 
             self._history_dock_widget = QDockWidget('History')
-            self._history_dock_widget.setWidget(self._undo_view)
+            self._history_dock_widget.setWidget(history_widget)
             self._main_window.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self._history_dock_widget)
         else:
+            self._undo_manager.memory_usage_changed.disconnect(self._update_memory_usage_label)
+
             self._main_window.removeDockWidget(self._history_dock_widget)
             self._history_dock_widget = None
 
+            self._memory_usage_label = None
             self._undo_view = None
 
+    def _update_memory_usage_label(self):
+        stack_size_text = self._size_text(self._undo_manager.stack_byte_size(), self._undo_manager.stack_size_limit)
+        total_size_text = self._size_text(self._undo_manager.total_byte_size(), self._undo_manager.total_size_limit)
+        memory_usage_text = f'Memory: {stack_size_text} (all windows: {total_size_text})'
+        if self._undo_manager.spilled_byte_size > 0:
+            memory_usage_text += f'\nDisk: {self._undo_manager.spilled_byte_size / _BYTES_IN_MB:.1f} MB'
+        self._memory_usage_label.setText(memory_usage_text)
+
+    @staticmethod
+    def _size_text(byte_size: int, size_limit: int) -> str:
+        size_text = f'{byte_size / _BYTES_IN_MB:.1f}'
+        return f'{size_text} / {size_limit / _BYTES_IN_MB:.0f} MB' if size_limit > 0 else f'{size_text} MB'
+
 
 class UndoManager(QObject):
-    def __init__(self, mdi: Mdi, stack_limit: int):
+    """
+    Keeps an undo stack for every MDI sub-window.
+    Memory of undo history is limited by byte budgets: every stack and all stacks together.
+    When a budget is exceeded, data of the oldest commands are moved into a per-session spill file (if enabled),
+    commands, which cannot be spilled, are dropped (released and set obsolete).
+    All older commands of the stack are dropped together with a command, so the history is only cut at the bottom.
+    The last pushed command is always kept, so it can be undone, even if it exceeds the budget alone.
+    While it is being merged (e.g. during a brush stroke), its size is not counted, because it is not final.
+    Commands, which are being compressed, are skipped. The limits are enforced again, when their size changes.
+    """
+
+    memory_usage_changed = Signal()
+
+    def __init__(
+            self,
+            mdi: Mdi,
+            stack_limit: int,
+            stack_size_limit: int = 0,
+            total_size_limit: int = 0,
+            spill_to_disk: bool = False,
+            spill_size_limit: int = 0,
+    ):
+        """
+        :param stack_limit: maximal number of commands in every stack
+        :param stack_size_limit: maximal size (in bytes) of commands in every stack
+        :param total_size_limit: maximal size (in bytes) of commands in all stacks
+        :param spill_size_limit: maximal size (in bytes) of the spill file
+        Use 0 for no limit.
+        """
         super().__init__()
 
         self._mdi = mdi
         self._stack_limit = stack_limit
+        self._stack_size_limit = stack_size_limit
+        self._total_size_limit = total_size_limit
+
+        self._spill_file = UndoSpillFile() if spill_to_disk else None
+        self._spill_size_limit = spill_size_limit
+
+        self._push_count = 0
 
         self._undo_group = QUndoGroup()
+        self._undo_group.activeStackChanged.connect(lambda undo_stack: self.memory_usage_changed.emit())
 
         self._undo_stack_by_sub_window: defaultdict[QMdiSubWindow, QUndoStack] = defaultdict(self._create_undo_stack)
         self._mdi.subWindowActivated.connect(self._activate_undo_stack_of_sub_window)
@@ -107,6 +182,10 @@ class UndoManager(QObject):
         self._undo_group = None
         self._mdi = None
 
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
     @property
     def undo_group(self) -> QUndoGroup:
         return self._undo_group
@@ -117,8 +196,39 @@ class UndoManager(QObject):
     def create_redo_action(self, parent: QObject, prefix: str = '') -> QAction:
         return self._undo_group.createRedoAction(parent, prefix)
 
+    @property
+    def stack_size_limit(self) -> int:
+        return self._stack_size_limit
+
+    @property
+    def total_size_limit(self) -> int:
+        return self._total_size_limit
+
+    @property
+    def spilled_byte_size(self) -> int:
+        return 0 if self._spill_file is None else self._spill_file.size
+
+    def stack_byte_size(self, undo_stack: QUndoStack | None = None) -> int:
+        """Return the size of commands in the `undo_stack` or in the active stack, if it is None."""
+        if undo_stack is None:
+            undo_stack = self._undo_group.activeStack()
+            if undo_stack is None:
+                return 0
+        return sum(command.byte_size() for command in self._stack_commands(undo_stack))
+
+    def total_byte_size(self) -> int:
+        return sum(self.stack_byte_size(undo_stack) for undo_stack in self._undo_group.stacks())
+
     def push(self, command: UndoCommand) -> None:
-        self._undo_group.activeStack().push(command)
+        self._push_count += 1
+        command.push_number = self._push_count
+        command.byte_size_changed_callback = self._on_command_byte_size_changed
+
+        undo_stack = self._undo_group.activeStack()
+        undo_stack.push(command)
+
+        self._enforce_size_limits(undo_stack)
+        self.memory_usage_changed.emit()
 
     def undo(self) -> None:
         self._undo_group.undo()
@@ -147,6 +257,80 @@ class UndoManager(QObject):
         dummy_command.setObsolete(True)
         self._undo_group.undo()
 
+    def _enforce_size_limits(self, pushed_undo_stack: QUndoStack):
+        # The pushed command could be merged into the previous one, so take the last command of the stack
+        last_command = pushed_undo_stack.command(pushed_undo_stack.count() - 1)
+        if self._stack_size_limit > 0:
+            self._free_memory_of_oldest_commands([pushed_undo_stack], self._stack_size_limit, last_command)
+        if self._total_size_limit > 0:
+            self._free_memory_of_oldest_commands(self._undo_group.stacks(), self._total_size_limit, last_command)
+
+    def _free_memory_of_oldest_commands(
+            self, undo_stacks: list[QUndoStack], size_limit: int, kept_command: UndoCommand | None):
+        stack_commands = [(undo_stack, command) for undo_stack in undo_stacks
+                          for command in self._stack_commands(undo_stack)
+                          if command.byte_size() > 0
+                          and not command.isObsolete()
+                          and not command.is_compressing
+                          and not (command is kept_command and command.is_merging)]
+        byte_size = sum(command.byte_size() for _, command in stack_commands)
+        if byte_size <= size_limit:
+            return
+
+        stack_commands.sort(key=lambda stack_command: stack_command[1].push_number)
+        for undo_stack, command in stack_commands:
+            if byte_size <= size_limit:
+                break
+
+            if command is kept_command or command.isObsolete():
+                continue
+
+            if not self._spill_command(command):
+                self._drop_command_with_older_commands(undo_stack, command)
+            byte_size = sum(command.byte_size() for _, command in stack_commands)
+
+    def _on_command_byte_size_changed(self, command: UndoCommand):
+        if self._undo_group is None:
+            return
+
+        for undo_stack in self._undo_group.stacks():
+            if any(stack_command is command for stack_command in self._stack_commands(undo_stack)):
+                self._enforce_size_limits(undo_stack)
+                break
+        self.memory_usage_changed.emit()
+
+    def _spill_command(self, command: UndoCommand) -> bool:
+        if self._spill_file is None or 0 < self._spill_size_limit <= self._spill_file.size:
+            return False
+
+        try:
+            return command.spill(self._spill_file)
+        except OSError as e:
+            logging.warning(f'Cannot spill undo command into a file: {e}')
+            return False
+
+    def _drop_command_with_older_commands(self, undo_stack: QUndoStack, command: UndoCommand):
+        """
+        Drop the `command` and all older commands of the `undo_stack`.
+        Else the older commands (e.g. spilled or without data) could be undone over effects of the dropped command,
+        which QUndoStack skips, and produce a state, which never existed.
+        """
+        for stack_command in self._stack_commands(undo_stack):
+            if stack_command.push_number <= command.push_number and not stack_command.isObsolete():
+                self._drop_command(stack_command)
+
+    @staticmethod
+    def _drop_command(command: UndoCommand):
+        command.release()
+        # QUndoStack deletes obsolete commands without calling their undo/redo methods
+        command.setObsolete(True)
+        command.setText(f'{command.text()} (dropped)')
+
+    @staticmethod
+    def _stack_commands(undo_stack: QUndoStack) -> list[UndoCommand]:
+        return [command for command in (undo_stack.command(i) for i in range(undo_stack.count()))
+                if isinstance(command, UndoCommand)]
+
     def _create_undo_stack(self) -> QUndoStack:
         undo_stack = QUndoStack(self._undo_group)
         undo_stack.setUndoLimit(self._stack_limit)
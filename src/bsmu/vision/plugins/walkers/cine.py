@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from PySide6.QtCore import QObject, Qt, QTimer, Signal
+
+from bsmu.vision.core.concurrent import ThreadPool
+from bsmu.vision.core.plugins import Plugin
+from bsmu.vision.plugins.windows.main import ViewMenu
+from bsmu.vision.widgets.mdi.windows.image.layered import VolumeSliceImageViewerSubWindow
+from bsmu.vision.widgets.viewers.image.layered.slice import VolumeSliceImageLayerView
+
+if TYPE_CHECKING:
+    from PySide6.QtGui import QImage
+
+    from bsmu.vision.core.task import Task
+    from bsmu.vision.plugins.doc_interfaces.mdi import MdiPlugin, Mdi
+    from bsmu.vision.plugins.windows.main import MainWindowPlugin, MainWindow
+    from bsmu.vision.widgets.viewers.image.layered.slice import VolumeSliceImageViewer
+
+
+class MdiCinePlayerPlugin(Plugin):
+    _DEFAULT_DEPENDENCY_PLUGIN_FULL_NAME_BY_KEY = {
+        'main_window_plugin': 'bsmu.vision.plugins.windows.main.MainWindowPlugin',
+        'mdi_plugin': 'bsmu.vision.plugins.doc_interfaces.mdi.MdiPlugin',
+    }
+
+    def __init__(self, main_window_plugin: MainWindowPlugin, mdi_plugin: MdiPlugin):
+        super().__init__()
+
+        self._main_window_plugin = main_window_plugin
+        self._main_window: MainWindow | None = None
+
+        self._mdi_plugin = mdi_plugin
+        self._mdi: Mdi | None = None
+
+        self._mdi_cine_player: MdiCinePlayer | None = None
+
+    def _enable(self):
+        self._main_window = self._main_window_plugin.main_window
+        self._mdi = self._mdi_plugin.mdi
+
+        cine_player = CinePlayer(
+            self.config_value('fps', 25),
+            self.config_value('prefetch_frame_count', 8),
+            self.config_value('loop', True),
+        )
+        self._mdi_cine_player = MdiCinePlayer(self._mdi, cine_player)
+
+        play_action = self._main_window.add_menu_action(
+            ViewMenu, 'Play Cine', self._mdi_cine_player.set_playing, Qt.CTRL | Qt.Key_Space, checkable=True)
+        cine_player.playing_changed.connect(play_action.setChecked)
+
+    def _disable(self):
+        self._mdi_cine_player.cine_player.stop()
+        self._mdi_cine_player = None
+
+        raise NotImplementedError
+
+
+class MdiCinePlayer(QObject):
+    def __init__(self, mdi: Mdi, cine_player: CinePlayer):
+        super().__init__()
+
+        self.mdi = mdi
+        self.cine_player = cine_player
+
+    def set_playing(self, playing: bool):
+        if not playing:
+            self.cine_player.stop()
+            return
+
+        active_sub_window = self.mdi.activeSubWindow()
+        if isinstance(active_sub_window, VolumeSliceImageViewerSubWindow):
+            self.cine_player.play(active_sub_window.viewer)
+        else:
+            # Uncheck the action
+            self.cine_player.playing_changed.emit(False)
+
+
+class CinePlayer(QObject):
+    """
+    Plays slices (frames) of volume layers of a viewer at the target fps.
+
+    Frames are rendered into display-ready QImages by worker threads and are kept in a prefetch ring
+    of the next `prefetch_frame_count` frames. The frame to show is chosen by the wall clock,
+    so if rendering falls behind, late frames are dropped instead of slowing down the playback.
+    At most `prefetch_frame_count` frames are rendered at once (including late frames, which cannot be canceled),
+    so the queue of the thread pool does not grow, when rendering is slower than the target fps.
+    """
+
+    playing_changed = Signal(bool)
+    achieved_fps_changed = Signal(float)
+
+    FPS_MEASUREMENT_INTERVAL = 1  # in seconds
+
+    def __init__(self, fps: float = 25, prefetch_frame_count: int = 8, loop: bool = True):
+        super().__init__()
+
+        self._fps = fps
+        self._prefetch_frame_count = max(1, prefetch_frame_count)
+        self._loop = loop
+
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.timeout.connect(self._on_timer_timeout)
+
+        self._viewer: VolumeSliceImageViewer | None = None
+        self._layer_views: list[VolumeSliceImageLayerView] = []
+        self._windows: list[tuple[float | None, float | None]] = []
+        self._frame_count = 0
+
+        self._start_time = 0.0
+        self._start_frame_number = 0
+        self._shown_frame_step = -1
+        self._target_frame_step = 0
+
+        # Rendered frames of all layer views by frame step (number of frames since the playback start).
+        # Frames are None, if their rendering failed. Such frames are skipped, and are not rendered again
+        self._rendered_frames: dict[int, list[QImage] | None] = {}
+        # Tasks, which are rendering frames, by frame step. Late tasks are kept, until they finish
+        self._render_tasks: dict[int, Task] = {}
+        # Is increased on every playback start to ignore results of tasks from the previous playback
+        self._playback_id = 0
+
+        self._measurement_start_time = 0.0
+        self._measurement_shown_frame_count = 0
+        self._dropped_frame_count = 0
+        self._achieved_fps = 0.0
+
+    @property
+    def fps(self) -> float:
+        return self._fps
+
+    @fps.setter
+    def fps(self, value: float):
+        if self._fps != value:
+            self._fps = value
+            if self.is_playing:
+                self.play(self._viewer)
+
+    @property
+    def achieved_fps(self) -> float:
+        return self._achieved_fps
+
+    @property
+    def dropped_frame_count(self) -> int:
+        return self._dropped_frame_count
+
+    @property
+    def is_playing(self) -> bool:
+        return self._timer.isActive()
+
+    def play(self, viewer: VolumeSliceImageViewer):
+        self.stop()
+
+        self._layer_views = [
+            layer_actor for layer_actor in viewer.layer_actors
+            if isinstance(layer_actor, VolumeSliceImageLayerView) and layer_actor.image is not None]
+        if not self._layer_views:
+            self.playing_changed.emit(False)
+            return
+
+        self._viewer = viewer
+        first_layer_view = self._layer_views[0]
+        self._frame_count = min(
+            layer_view.image.array.shape[layer_view.plane_axis] for layer_view in self._layer_views)
+        # Intensity window is calculated once in the GUI thread, so all frames are displayed consistently
+        self._windows = [layer_view.default_intensity_window() for layer_view in self._layer_views]
+
+        self._playback_id += 1
+        self._start_frame_number = (first_layer_view.slice_number + 1) % self._frame_count
+        self._start_time = time.perf_counter()
+        self._shown_frame_step = -1
+        self._target_frame_step = 0
+        self._measurement_start_time = self._start_time
+        self._measurement_shown_frame_count = 0
+        self._dropped_frame_count = 0
+
+        self._request_frames(0)
+        self._timer.start(max(1, round(1000 / self._fps)))
+        self.playing_changed.emit(True)
+
+    def stop(self):
+        if not self.is_playing:
+            return
+
+        self._timer.stop()
+        self._rendered_frames.clear()
+        self._render_tasks.clear()
+        self._playback_id += 1
+        self._viewer = None
+        self._layer_views = []
+        self.playing_changed.emit(False)
+
+    def _frame_number(self, frame_step: int) -> int | None:
+        frame_number = self._start_frame_number + frame_step
+        if frame_number < self._frame_count:
+            return frame_number
+        return frame_number % self._frame_count if self._loop else None
+
+    def _on_timer_timeout(self):
+        now = time.perf_counter()
+        target_frame_step = int((now - self._start_time) * self._fps)
+        if self._frame_number(target_frame_step) is None:
+            self.stop()
+            return
+
+        self._target_frame_step = target_frame_step
+        # Drop the frames, which were late. Do not wait for them
+        for frame_step in [step for step in self._rendered_frames if step < target_frame_step]:
+            del self._rendered_frames[frame_step]
+
+        if target_frame_step > self._shown_frame_step:
+            rendered_frames = self._rendered_frames.pop(target_frame_step, None)
+            if rendered_frames is not None:
+                frame_number = self._frame_number(target_frame_step)
+                for layer_view, display_qimage in zip(self._layer_views, rendered_frames):
+                    layer_view.show_rendered_slice(frame_number, display_qimage)
+                self._viewer.slice_number = frame_number
+                self._dropped_frame_count += target_frame_step - self._shown_frame_step - 1
+                self._shown_frame_step = target_frame_step
+                self._measurement_shown_frame_count += 1
+
+        self._request_frames(target_frame_step)
+        self._update_achieved_fps(now)
+
+    def _request_frames(self, first_frame_step: int):
+        """Fill the prefetch ring with render tasks of the next frames, while the number of rendered frames allows."""
+        for frame_step in range(first_frame_step, first_frame_step + self._prefetch_frame_count):
+            if len(self._render_tasks) >= self._prefetch_frame_count:
+                break
+
+            if frame_step in self._rendered_frames or frame_step in self._render_tasks:
+                continue
+
+            frame_number = self._frame_number(frame_step)
+            if frame_number is None:
+                break
+
+            task = ThreadPool.call_async(self._render_frame, self._layer_views, self._windows, frame_number)
+            self._render_tasks[frame_step] = task
+            playback_id = self._playback_id
+            task.on_finished = lambda rendered_frames, frame_step=frame_step: \
+                self._on_frame_rendered(playback_id, frame_step, rendered_frames)
+
+    @staticmethod
+    def _render_frame(
+            layer_views: list[VolumeSliceImageLayerView],
+            windows: list[tuple[float | None, float | None]],
+            frame_number: int,
+    ) -> list[QImage] | None:
+        # Catch all exceptions, else the task is not finished, and the frame blocks the prefetch ring
+        try:
+            return [layer_view.render_display_qimage(frame_number, window)
+                    for layer_view, window in zip(layer_views, windows)]
+        except Exception:
+            logging.exception(f'Cine: cannot render frame {frame_number}')
+            return None
+
+    def _on_frame_rendered(self, playback_id: int, frame_step: int, rendered_frames: list[QImage] | None):
+        if playback_id != self._playback_id or self._render_tasks.pop(frame_step, None) is None:
+            # The playback was stopped
+            return
+
+        if frame_step < self._target_frame_step:
+            # The frame was late. Render the next frames instead
+            self._request_frames(self._target_frame_step)
+            return
+
+        self._rendered_frames[frame_step] = rendered_frames
+
+    def _update_achieved_fps(self, now: float):
+        elapsed = now - self._measurement_start_time
+        if elapsed < self.FPS_MEASUREMENT_INTERVAL:
+            return
+
+        self._achieved_fps = self._measurement_shown_frame_count / elapsed
+        logging.debug(f'Cine: achieved fps: {self._achieved_fps:.1f} / {self._fps}, '
+                      f'dropped frames: {self._dropped_frame_count}')
+        self.achieved_fps_changed.emit(self._achieved_fps)
+
+        self._measurement_start_time = now
+        self._measurement_shown_frame_count = 0
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+import weakref
 from dataclasses import dataclass, field
 from typing import TYPE_CHECKING
 
@@ -8,11 +9,16 @@ from PySide6.QtCore import QObject
 
 from bsmu.vision.core.config import Config, NamesOrAll
 from bsmu.vision.core.plugins import Plugin
-from bsmu.vision.plugins.writers.image.common import CommonImageFileWriter
 
 if TYPE_CHECKING:
+    from pathlib import Path
+
+    from bsmu.vision.core.data import Data
+    from bsmu.vision.core.data.raster import Raster
     from bsmu.vision.core.image.layered import ImageLayer
     from bsmu.vision.plugins.walkers.file import MdiImageLayerFileWalker, MdiImageLayerFileWalkerPlugin
+    from bsmu.vision.plugins.writers.image.common import CommonImageFileWriter, CommonImageFileWriterPlugin
+    from bsmu.vision.plugins.writers.queue import FileWriteQueuePlugin, FileWriteQueue
     from bsmu.vision.widgets.viewers.image.layered import LayeredImageViewer
 
 
@@ -24,17 +30,24 @@ class MaskAutoSaveOnWalkConfig(Config):
 class MaskAutoSaveOnWalkPlugin(Plugin):
     _DEFAULT_DEPENDENCY_PLUGIN_FULL_NAME_BY_KEY = {
         'file_walker_plugin': 'bsmu.vision.plugins.walkers.file.MdiImageLayerFileWalkerPlugin',
+        'common_image_file_writer_plugin': 'bsmu.vision.plugins.writers.image.common.CommonImageFileWriterPlugin',
+        'file_write_queue_plugin': 'bsmu.vision.plugins.writers.queue.FileWriteQueuePlugin',
     }
 
     def __init__(
             self,
             file_walker_plugin: MdiImageLayerFileWalkerPlugin,
+            common_image_file_writer_plugin: CommonImageFileWriterPlugin,
+            file_write_queue_plugin: FileWriteQueuePlugin,
     ):
         super().__init__()
 
         self._file_walker_plugin = file_walker_plugin
         self._file_walker: MdiImageLayerFileWalker | None = None
 
+        self._common_image_file_writer_plugin = common_image_file_writer_plugin
+        self._file_write_queue_plugin = file_write_queue_plugin
+
         self._mask_auto_save_on_walk: MaskAutoSaveOnWalk | None = None
 
     @property
@@ -45,7 +58,12 @@ class MaskAutoSaveOnWalkPlugin(Plugin):
         self._file_walker = self._file_walker_plugin.mdi_image_layer_file_walker
 
         mask_auto_save_on_walk_config = MaskAutoSaveOnWalkConfig.from_dict(self.config.full_data)
-        self._mask_auto_save_on_walk = MaskAutoSaveOnWalk(mask_auto_save_on_walk_config)
+        # Use the writer of the plugin, so masks are saved with the configured writer settings (e.g. PNG compression)
+        self._mask_auto_save_on_walk = MaskAutoSaveOnWalk(
+            mask_auto_save_on_walk_config,
+            self._common_image_file_writer_plugin.file_writer,
+            self._file_write_queue_plugin.file_write_queue,
+        )
 
         self._file_walker.next_image_requested.connect(self._mask_auto_save_on_walk.save_masks)
         self._file_walker.prev_image_requested.connect(self._mask_auto_save_on_walk.save_masks)
@@ -54,16 +72,37 @@ class MaskAutoSaveOnWalkPlugin(Plugin):
         self._file_walker.next_image_requested.disconnect(self._mask_auto_save_on_walk.save_masks)
         self._file_walker.prev_image_requested.disconnect(self._mask_auto_save_on_walk.save_masks)
 
+        self._mask_auto_save_on_walk.disconnect_from_file_write_queue()
         self._mask_auto_save_on_walk = None
         self._file_walker = None
 
 
 class MaskAutoSaveOnWalk(QObject):
-    def __init__(self, config: MaskAutoSaveOnWalkConfig):
+    def __init__(
+            self, config: MaskAutoSaveOnWalkConfig, writer: CommonImageFileWriter, file_write_queue: FileWriteQueue):
         super().__init__()
 
         self._config = config
-        self._writer = CommonImageFileWriter()
+        self._writer = writer
+
+        self._file_write_queue = file_write_queue
+        self._file_write_queue.file_written.connect(self._on_file_written)
+        self._file_write_queue.file_writing_failed.connect(self._on_file_writing_failed)
+
+        # Modification generations of masks at the moment of their last saved snapshots
+        self._saved_generation_by_mask: weakref.WeakKeyDictionary[Raster, int] = weakref.WeakKeyDictionary()
+        # Modification generations of masks at the moment of their last queued snapshots
+        self._queued_generation_by_mask: weakref.WeakKeyDictionary[Raster, int] = weakref.WeakKeyDictionary()
+        # (mask, modification generation) of queued snapshots
+        self._mask_generation_by_snapshot: weakref.WeakKeyDictionary[Raster, tuple[weakref.ref[Raster], int]] = \
+            weakref.WeakKeyDictionary()
+        # Save paths of masks, which cannot be queued now, because too much data is queued already.
+        # The masks are kept alive, until they are queued, so their modifications are not lost after the walk
+        self._deferred_save_path_by_mask: dict[Raster, Path] = {}
+
+    def disconnect_from_file_write_queue(self):
+        self._file_write_queue.file_written.disconnect(self._on_file_written)
+        self._file_write_queue.file_writing_failed.disconnect(self._on_file_writing_failed)
 
     def save_masks(self, image_viewer: LayeredImageViewer):
         if self._config.layers.is_all:
@@ -78,9 +117,7 @@ class MaskAutoSaveOnWalk(QObject):
         if mask_layer.image is None:
             return
 
-        # TODO: if mask was not changed (is not dirty) then return (do nothing)
-
-        if not mask_layer.image.is_indexed:
+        if not mask_layer.image.is_indexed or not self._is_mask_modified(mask_layer.image):
             return
 
         save_path = mask_layer.image_path
@@ -105,5 +142,63 @@ class MaskAutoSaveOnWalk(QObject):
                 mask_layer.path = new_mask_layer_path
             mask_layer.image.path = save_path
 
-        logging.info(f"Save mask into {save_path}")
-        self._writer.write_to_file(mask_layer.image, save_path)
+        self._save_mask_async(mask_layer.image, save_path)
+
+    def _is_mask_modified(self, mask: Raster) -> bool:
+        saved_generation = self._saved_generation_by_mask.get(mask)
+        if saved_generation is None:
+            # Mask was never saved by us. Consider it unmodified only, if it was read from an existing file
+            return mask.modification_generation != 0 or mask.path is None or not mask.path.exists()
+        return mask.modification_generation != saved_generation
+
+    def _save_mask_async(self, mask: Raster, save_path: Path):
+        self._deferred_save_path_by_mask.pop(mask, None)
+        snapshot_generation = mask.modification_generation
+        if self._queued_generation_by_mask.get(mask) == snapshot_generation:
+            # The same pixels are being saved already
+            return
+
+        if not self._file_write_queue.can_enqueue(save_path, mask.pixels_nbytes):
+            logging.info(f'Save of mask into {save_path} is deferred, until queued writes are finished')
+            self._deferred_save_path_by_mask[mask] = save_path
+            return
+
+        # Snapshot the pixels in the GUI thread, so further painting does not affect the written file
+        mask_snapshot = mask.snapshot()
+        logging.info(f'Save mask into {save_path}')
+        self._file_write_queue.enqueue(self._writer, mask_snapshot, save_path, source=mask)
+        self._queued_generation_by_mask[mask] = snapshot_generation
+        self._mask_generation_by_snapshot[mask_snapshot] = (weakref.ref(mask), snapshot_generation)
+
+    def _save_deferred_masks(self):
+        for mask, save_path in list(self._deferred_save_path_by_mask.items()):
+            if not self._file_write_queue.can_enqueue(save_path, mask.pixels_nbytes):
+                # Keep the order of deferred saves
+                break
+            self._save_mask_async(mask, save_path)
+
+    def _on_file_written(self, path: Path, data: Data):
+        self._save_deferred_masks()
+
+        mask_generation = self._mask_generation_by_snapshot.pop(data, None)
+        if mask_generation is None:
+            # The file was not written by us
+            return
+
+        mask_ref, snapshot_generation = mask_generation
+        mask = mask_ref()
+        if mask is not None and snapshot_generation > self._saved_generation_by_mask.get(mask, -1):
+            self._saved_generation_by_mask[mask] = snapshot_generation
+
+    def _on_file_writing_failed(self, path: Path, data: Data, error_message: str):
+        self._save_deferred_masks()
+
+        mask_generation = self._mask_generation_by_snapshot.pop(data, None)
+        if mask_generation is None:
+            return
+
+        mask_ref, snapshot_generation = mask_generation
+        mask = mask_ref()
+        if mask is not None and self._queued_generation_by_mask.get(mask) == snapshot_generation:
+            # Allow to queue the same pixels again
+            del self._queued_generation_by_mask[mask]
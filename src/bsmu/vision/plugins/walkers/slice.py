@@ -5,6 +5,7 @@ from typing import TYPE_CHECKING
 from PySide6.QtCore import QObject, Qt
 
 from bsmu.vision.core.plugins import Plugin
+from bsmu.vision.core.slab import SlabMode
 from bsmu.vision.plugins.windows.main import ViewMenu
 from bsmu.vision.widgets.mdi.windows.image.layered import VolumeSliceImageViewerSubWindow
 
@@ -34,12 +35,20 @@ class MdiVolumeSliceWalkerPlugin(Plugin):
         self._main_window = self._main_window_plugin.main_window
         self._mdi = self._mdi_plugin.mdi
 
-        self._mdi_volume_slice_walker = MdiVolumeSliceWalker(self._mdi)
+        self._mdi_volume_slice_walker = MdiVolumeSliceWalker(
+            self._mdi,
+            self.config_value('slab_thickness_step', 2),
+            SlabMode(self.config_value('slab_mode', SlabMode.MAX.value)),
+        )
 
         self._main_window.add_menu_action(
             ViewMenu, 'Next Slice', self._mdi_volume_slice_walker.show_next_slice, Qt.CTRL | Qt.Key_Up)
         self._main_window.add_menu_action(
             ViewMenu, 'Previous Slice', self._mdi_volume_slice_walker.show_prev_slice, Qt.CTRL | Qt.Key_Down)
+        self._main_window.add_menu_action(
+            ViewMenu, 'Thicker Slab', self._mdi_volume_slice_walker.thicken_slab, Qt.CTRL | Qt.SHIFT | Qt.Key_Up)
+        self._main_window.add_menu_action(
+            ViewMenu, 'Thinner Slab', self._mdi_volume_slice_walker.thin_slab, Qt.CTRL | Qt.SHIFT | Qt.Key_Down)
 
     def _disable(self):
         self._mdi_volume_slice_walker = None
@@ -48,10 +57,12 @@ class MdiVolumeSliceWalkerPlugin(Plugin):
 
 
 class MdiVolumeSliceWalker(QObject):
-    def __init__(self, mdi: Mdi):
+    def __init__(self, mdi: Mdi, slab_thickness_step: int = 2, slab_mode: SlabMode = SlabMode.MAX):
         super().__init__()
 
         self.mdi = mdi
+        self.slab_thickness_step = slab_thickness_step
+        self.slab_mode = slab_mode
 
     def show_next_slice(self):
         for volume_slice_image_viewer in self._volume_slice_image_viewers():
@@ -61,6 +72,17 @@ class MdiVolumeSliceWalker(QObject):
         for volume_slice_image_viewer in self._volume_slice_image_viewers():
             volume_slice_image_viewer.show_prev_slice()
 
+    def thicken_slab(self):
+        self._change_slab_thickness(self.slab_thickness_step)
+
+    def thin_slab(self):
+        self._change_slab_thickness(-self.slab_thickness_step)
+
+    def _change_slab_thickness(self, thickness_delta: int):
+        for volume_slice_image_viewer in self._volume_slice_image_viewers():
+            volume_slice_image_viewer.set_slab(
+                volume_slice_image_viewer.slab_thickness + thickness_delta, self.slab_mode)
+
     def _volume_slice_image_viewers(self):
         active_sub_window = self.mdi.activeSubWindow()
         if isinstance(active_sub_window, VolumeSliceImageViewerSubWindow):
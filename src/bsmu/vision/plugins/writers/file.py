@@ -2,6 +2,9 @@ from __future__ import annotations
 
 import abc
 import inspect
+import os
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
 from typing import TYPE_CHECKING
 
@@ -11,7 +14,23 @@ from bsmu.vision.core.data import Data
 from bsmu.vision.core.plugins import Plugin
 
 if TYPE_CHECKING:
-    from typing import Type
+    from typing import Iterator, Type
+
+
+@contextmanager
+def replacing_temp_file_path(path: Path) -> Iterator[Path]:
+    """
+    Yield path of a temporary file in the same directory as the `path`.
+    When the context exits normally, the temporary file atomically replaces the `path`, else it is removed.
+    """
+    # Keep the suffix, because writers choose the file format using it
+    temp_path = path.with_name(f'.{path.stem}.{uuid.uuid4().hex[:8]}.tmp{path.suffix}')
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
 
 
 class FileWriterPlugin(Plugin):
@@ -40,11 +59,32 @@ class FileWriterMeta(type(QObject), abc.ABCMeta):
 class FileWriter(QObject, metaclass=FileWriterMeta):
     file_written = Signal(Path)
 
-    def write_to_file(self, data: Data, path: Path, mkdir=False, **kwargs):
+    # Writers, which update existing files in place (e.g. rewrite only modified parts of a file),
+    # keep the files valid themselves, so they do not write into a temporary file during atomic writing
+    _UPDATES_FILES_IN_PLACE = False
+
+    # Writers, which can update only modified tiles of existing files, set the size of the tiles.
+    # They accept `modified_tiles` keyword argument: boolean grid of tiles, which were modified
+    # since the previous writing into the same path, or None, if they are unknown
+    MODIFIED_TILE_SIZE: int | None = None
+
+    def can_write(self, data: Data) -> bool:
+        """Return True, if the writer supports the `data` (formats of files are checked separately)."""
+        return True
+
+    def write_to_file(self, data: Data, path: Path, mkdir=False, atomic=False, **kwargs):
+        """
+        :param atomic: write into a temporary file and then replace the `path` with it,
+        so the `path` never contains a half-written file
+        """
         if mkdir:
             path.parent.mkdir(parents=True, exist_ok=True)
 
-        self._write_to_file(data, path, **kwargs)
+        if atomic and not self._UPDATES_FILES_IN_PLACE:
+            with replacing_temp_file_path(path) as temp_path:
+                self._write_to_file(data, temp_path, **kwargs)
+        else:
+            self._write_to_file(data, path, **kwargs)
         self.file_written.emit(path)
 
     @abc.abstractmethod
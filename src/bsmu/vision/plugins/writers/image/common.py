@@ -1,33 +1,81 @@
 from __future__ import annotations
 
 import logging
+from dataclasses import dataclass, field
+from enum import Enum
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-import skimage.io
+import cv2 as cv
+import numpy as np
 from PySide6.QtGui import QKeySequence
 from PySide6.QtWidgets import QFileDialog, QMessageBox
 
+from bsmu.vision.core.config import Config
+from bsmu.vision.core.png import gray_png_to_palette_png
 from bsmu.vision.plugins.windows.main import FileMenu
 from bsmu.vision.plugins.writers.file import FileWriterPlugin, FileWriter
 from bsmu.vision.widgets.viewers.layered import LayeredDataViewerHolder
 
 if TYPE_CHECKING:
+    from bsmu.vision.core.data import Data
     from bsmu.vision.core.image import Image
     from bsmu.vision.plugins.windows.main import MainWindowPlugin, MainWindow
     from bsmu.vision.plugins.doc_interfaces.mdi import MdiPlugin, Mdi
+    from bsmu.vision.plugins.writers.queue import FileWriteQueuePlugin, FileWriteQueue
+
+
+class PngStrategy(Enum):
+    DEFAULT = cv.IMWRITE_PNG_STRATEGY_DEFAULT
+    FILTERED = cv.IMWRITE_PNG_STRATEGY_FILTERED
+    HUFFMAN_ONLY = cv.IMWRITE_PNG_STRATEGY_HUFFMAN_ONLY
+    RLE = cv.IMWRITE_PNG_STRATEGY_RLE  # Suits masks with long runs of the same values
+    FIXED = cv.IMWRITE_PNG_STRATEGY_FIXED
+
+
+class PngFilter(Enum):
+    # Values of libpng filter flags, because old OpenCV versions have no IMWRITE_PNG_FILTER_* constants
+    NONE = 8
+    SUB = 16
+    UP = 32
+    AVG = 64
+    PAETH = 128
+
+
+@dataclass
+class PngCompressionConfig(Config):
+    level: int = 1  # zlib compression level [0; 9]
+    strategy: PngStrategy = PngStrategy.RLE
+    filter: PngFilter | None = None  # If None, then the filter is selected by the encoder
+
+    def imwrite_params(self) -> list[int]:
+        params = [cv.IMWRITE_PNG_COMPRESSION, self.level, cv.IMWRITE_PNG_STRATEGY, self.strategy.value]
+        if self.filter is not None and hasattr(cv, 'IMWRITE_PNG_FILTER'):
+            params += [cv.IMWRITE_PNG_FILTER, self.filter.value]
+        return params
+
+
+@dataclass
+class CommonImageFileWriterConfig(Config):
+    # Filtering of indexed masks only slows down the encoding and does not decrease the size
+    mask_png_compression: PngCompressionConfig = field(
+        default_factory=lambda: PngCompressionConfig(1, PngStrategy.RLE, PngFilter.NONE))
+    image_png_compression: PngCompressionConfig = field(
+        default_factory=lambda: PngCompressionConfig(6, PngStrategy.DEFAULT, None))
 
 
 class CommonImageFileWriterPlugin(FileWriterPlugin):
     _DEFAULT_DEPENDENCY_PLUGIN_FULL_NAME_BY_KEY = {
         'main_window_plugin': 'bsmu.vision.plugins.windows.main.MainWindowPlugin',
         'mdi_plugin': 'bsmu.vision.plugins.doc_interfaces.mdi.MdiPlugin',
+        'file_write_queue_plugin': 'bsmu.vision.plugins.writers.queue.FileWriteQueuePlugin',
     }
 
     def __init__(
             self,
             main_window_plugin: MainWindowPlugin,
             mdi_plugin: MdiPlugin,
+            file_write_queue_plugin: FileWriteQueuePlugin,
     ):
         super().__init__(CommonImageFileWriter)
 
@@ -37,8 +85,35 @@ class CommonImageFileWriterPlugin(FileWriterPlugin):
         self._mdi_plugin = mdi_plugin
         self._mdi: Mdi | None = None
 
+        self._file_write_queue_plugin = file_write_queue_plugin
+        self._file_write_queue: FileWriteQueue | None = None
+
         self._last_saved_file_dir = None
 
+        self._writer_config: CommonImageFileWriterConfig | None = None
+        self._file_writer: CommonImageFileWriter | None = None
+        # Paths of images, which are being saved by the user, to report errors of their writing
+        self._saving_paths: set[Path] = set()
+
+    @property
+    def file_writer(self) -> CommonImageFileWriter | None:
+        return self._file_writer
+
+    def _enable(self):
+        self._writer_config = CommonImageFileWriterConfig.from_dict(self.config.full_data)
+        self._file_writer = self._file_writer_cls(self._writer_config)
+
+        self._file_write_queue = self._file_write_queue_plugin.file_write_queue
+        self._file_write_queue.file_written.connect(self._on_file_written)
+        self._file_write_queue.file_writing_failed.connect(self._on_file_writing_failed)
+
+    def _disable(self):
+        self._file_write_queue.file_written.disconnect(self._on_file_written)
+        self._file_write_queue.file_writing_failed.disconnect(self._on_file_writing_failed)
+        self._file_write_queue = None
+
+        self._file_writer = None
+
     def _enable_gui(self):
         self._main_window = self._main_window_plugin.main_window
         self._main_window.add_menu_action(
@@ -110,23 +185,69 @@ class CommonImageFileWriterPlugin(FileWriterPlugin):
             image.path = save_path
 
     def _save_image(self, image: Image, path: Path) -> bool:
-        try:
-            self._file_writer_cls().write_to_file(image, path)
-            return True
-        except Exception as e:
+        # Write a snapshot of the pixels in the background, so further editing does not affect the written file
+        image_snapshot = image.snapshot()
+        if not self._file_write_queue.enqueue(self._file_writer, image_snapshot, path, source=image):
             QMessageBox.warning(
                 self._main_window,
                 'Save Error',
-                f'Cannot save the image.\n{e}')
+                'Cannot save the image now, because previous images are still being saved. Try again later.')
             return False
 
+        self._saving_paths.add(path)
+        return True
+
+    def _on_file_written(self, path: Path, data: Data):
+        self._saving_paths.discard(path)
+
+    def _on_file_writing_failed(self, path: Path, data: Data, error_message: str):
+        if path not in self._saving_paths:
+            return
+
+        self._saving_paths.discard(path)
+        QMessageBox.warning(
+            self._main_window,
+            'Save Error',
+            f'Cannot save the image into {path}.\n{error_message}')
+
 
 class CommonImageFileWriter(FileWriter):
     _FORMATS = ('png', 'jpg', 'jpeg', 'bmp', 'tif', 'tiff')
 
+    def __init__(self, config: CommonImageFileWriterConfig | None = None):
+        super().__init__()
+
+        self._config = config or CommonImageFileWriterConfig()
+
     def _write_to_file(self, data: Image, path: Path, **kwargs):
         # TODO: move the logging into base class
         logging.info(f'Write Common Image: {path}')
 
-        # TODO: use OpenCV to save the image (compare performance and size of the resulting files)
-        skimage.io.imsave(str(path), data.pixels, check_contrast=False)
+        # Use OpenCV instead of skimage, because it encodes several times faster,
+        # and allows to choose PNG compression parameters (e.g. Z_RLE strategy for masks)
+        extension = path.suffix.lower()
+        is_png = extension == '.png'
+        params = []
+        if is_png:
+            png_compression = self._config.mask_png_compression if data.is_indexed \
+                else self._config.image_png_compression
+            params = png_compression.imwrite_params()
+
+        pixels = data.pixels
+        channel_count = pixels.shape[-1] if pixels.ndim == 3 else 1
+        match channel_count:
+            case 3:
+                pixels = cv.cvtColor(pixels, cv.COLOR_RGB2BGR)
+            case 4:
+                pixels = cv.cvtColor(pixels, cv.COLOR_RGBA2BGRA)
+
+        is_encoded, encoded_image = cv.imencode(extension, pixels, params)
+        if not is_encoded:
+            raise ValueError(f'Cannot encode the image into {extension} format')
+
+        if is_png and data.is_indexed:
+            # Store the palette in the file, so the mask can be viewed with colors in any image viewer
+            encoded_image = np.frombuffer(gray_png_to_palette_png(encoded_image.tobytes(), data.palette), np.uint8)
+
+        # Do not use cv.imwrite, because it works only with ASCII characters in file path
+        encoded_image.tofile(path)
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+import numpy as np
+import tifffile
+
+from bsmu.vision.plugins.writers.file import FileWriterPlugin, FileWriter, replacing_temp_file_path
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from bsmu.vision.core.data import Data
+    from bsmu.vision.core.data.raster import Raster
+    from bsmu.vision.plugins.writers.queue import FileWriteQueuePlugin, FileWriteQueue
+
+
+class TiledTiffMaskFileWriterPlugin(FileWriterPlugin):
+    """Makes the file write queue write masks into TIFF files using the `TiledTiffMaskFileWriter`."""
+
+    _DEFAULT_DEPENDENCY_PLUGIN_FULL_NAME_BY_KEY = {
+        'file_write_queue_plugin': 'bsmu.vision.plugins.writers.queue.FileWriteQueuePlugin',
+    }
+
+    def __init__(self, file_write_queue_plugin: FileWriteQueuePlugin):
+        super().__init__(TiledTiffMaskFileWriter)
+
+        self._file_write_queue_plugin = file_write_queue_plugin
+        self._file_write_queue: FileWriteQueue | None = None
+
+        self._file_writer: TiledTiffMaskFileWriter | None = None
+
+    def _enable(self):
+        self._file_writer = self._file_writer_cls()
+        self._file_write_queue = self._file_write_queue_plugin.file_write_queue
+        self._file_write_queue.add_preferred_writer(self._file_writer)
+
+    def _disable(self):
+        self._file_write_queue.remove_preferred_writer(self._file_writer)
+        self._file_write_queue = None
+        self._file_writer = None
+
+
+class TiledTiffMaskFileWriter(FileWriter):
+    """
+    Writes masks into tiled zlib-compressed TIFF files.
+
+    The writer keeps the tile layout of every written file, so the next writing into the same file
+    re-encodes only the tiles, which are passed as modified (e.g. tracked by the `FileWriteQueue` on the live mask,
+    when its snapshots are written).
+    They are appended to the end of the file, and then the tile offsets and byte counts are patched in place.
+    Old tile data is left in the file as garbage, and the file is fully rewritten (compacted),
+    when the garbage takes too much space.
+    """
+
+    _FORMATS = ('tif', 'tiff')
+
+    TILE_SIZE = 256  # TIFF tile sizes have to be multiples of 16
+    MODIFIED_TILE_SIZE = TILE_SIZE
+    COMPRESSION_LEVEL = 6
+    MAX_GARBAGE_RATIO = 0.5
+    # Number of recently written files, which tile layouts are kept. Older files are fully rewritten at next writing
+    MAX_FILE_STATE_COUNT = 32
+
+    # Modified tiles are appended before patching of the offsets, and all tiles are written into a temporary file,
+    # so the file stays valid, if the writing is interrupted
+    _UPDATES_FILES_IN_PLACE = True
+
+    _TIFF_LONG_DATATYPE = 4
+    _TIFF_LONG8_DATATYPE = 16
+
+    def __init__(self):
+        super().__init__()
+
+        # Writes into the same path are not performed at the same time,
+        # so states of different files can be used from different threads. The lock guards only the dictionary
+        self._file_state_by_path: OrderedDict[Path, _TiledTiffFileState] = OrderedDict()
+        self._file_state_by_path_lock = threading.Lock()
+
+    def can_write(self, data: Data) -> bool:
+        return getattr(data, 'is_indexed', False)
+
+    def _write_to_file(self, data: Raster, path: Path, modified_tiles: np.ndarray | None = None, **kwargs):
+        """
+        :param modified_tiles: boolean grid of tiles, which were modified since the previous writing into the `path`.
+        If it is None, all tiles are written
+        """
+        file_state = self._file_state(path)
+        if (file_state is not None and modified_tiles is not None
+                and self._can_write_modified_tiles(data, path, file_state, modified_tiles)):
+            self._write_modified_tiles(data, file_state, modified_tiles)
+        else:
+            self._write_all_tiles(data, path)
+
+    def _can_write_modified_tiles(
+            self, mask: Raster, path: Path, file_state: _TiledTiffFileState, modified_tiles: np.ndarray) -> bool:
+        pixels = mask.pixels
+        if (pixels.shape != file_state.pixels_shape or pixels.dtype != file_state.pixels_dtype
+                or modified_tiles.shape != file_state.tile_grid_shape or not path.exists()):
+            return False
+
+        # Check, that the file was not changed by somebody else
+        stat = path.stat()
+        if stat.st_size != file_state.file_size or stat.st_mtime_ns != file_state.file_mtime_ns:
+            return False
+
+        return file_state.garbage_size <= self.MAX_GARBAGE_RATIO * file_state.file_size
+
+    def _write_all_tiles(self, mask: Raster, path: Path):
+        logging.info(f'Write all tiles of Tiled TIFF Mask: {path}')
+
+        pixels = mask.pixels
+        write_kwargs = {}
+        if mask.is_indexed:
+            # TIFF colormap contains 16-bit RGB values
+            colormap = np.asarray(mask.palette.array[:, :3], dtype=np.uint16).T * 257
+            write_kwargs = {'photometric': 'palette', 'colormap': colormap}
+        # Write into a temporary file, so the previous file is kept, if the writing is interrupted
+        with replacing_temp_file_path(path) as temp_path:
+            tifffile.imwrite(
+                temp_path,
+                pixels,
+                # Classic TIFF can store up to 4 GB. Reserve a half for tiles appended by incremental updates
+                bigtiff=pixels.nbytes >= 1 << 31,
+                tile=(self.TILE_SIZE, self.TILE_SIZE),
+                compression='zlib',
+                compressionargs={'level': self.COMPRESSION_LEVEL},
+                **write_kwargs,
+            )
+
+        with tifffile.TiffFile(path) as tiff_file:
+            page = tiff_file.pages[0]
+            offsets_tag = page.tags['TileOffsets']
+            byte_counts_tag = page.tags['TileByteCounts']
+            offsets_dtype = np.dtype(f'{tiff_file.byteorder}u4') \
+                if offsets_tag.dtype == self._TIFF_LONG_DATATYPE else np.dtype(f'{tiff_file.byteorder}u8')
+            byte_counts_dtype = np.dtype(f'{tiff_file.byteorder}u4') \
+                if byte_counts_tag.dtype == self._TIFF_LONG_DATATYPE else np.dtype(f'{tiff_file.byteorder}u8')
+
+            file_state = self._file_state(path)
+            if file_state is None:
+                file_state = _TiledTiffFileState(self.TILE_SIZE)
+                self._add_file_state(path, file_state)
+            file_state.reset(
+                path,
+                pixels,
+                np.array(offsets_tag.value, dtype=np.uint64),
+                np.array(byte_counts_tag.value, dtype=np.uint64),
+                offsets_tag.valueoffset,
+                offsets_dtype,
+                byte_counts_tag.valueoffset,
+                byte_counts_dtype,
+            )
+
+    def _file_state(self, path: Path) -> _TiledTiffFileState | None:
+        with self._file_state_by_path_lock:
+            file_state = self._file_state_by_path.get(path)
+            if file_state is not None:
+                self._file_state_by_path.move_to_end(path)
+            return file_state
+
+    def _add_file_state(self, path: Path, file_state: _TiledTiffFileState):
+        with self._file_state_by_path_lock:
+            self._file_state_by_path[path] = file_state
+            while len(self._file_state_by_path) > self.MAX_FILE_STATE_COUNT:
+                # Drop the state of the least recently written file
+                self._file_state_by_path.popitem(last=False)
+
+    def _write_modified_tiles(self, mask: Raster, file_state: _TiledTiffFileState, modified_tiles: np.ndarray):
+        modified_tile_indices = np.flatnonzero(modified_tiles)
+        logging.info(f'Write {len(modified_tile_indices)} modified tiles of Tiled TIFF Mask: {file_state.path}')
+        if len(modified_tile_indices) == 0:
+            return
+
+        encoded_tiles = [self._encode_tile(mask.pixels, file_state, tile_index) for tile_index in modified_tile_indices]
+        end_offset = file_state.file_size
+        if end_offset + sum(map(len, encoded_tiles)) > np.iinfo(file_state.offsets_dtype).max:
+            # Offsets of the appended tiles cannot be stored in classic TIFF
+            self._write_all_tiles(mask, file_state.path)
+            return
+
+        with open(file_state.path, 'r+b') as file:
+            # Append the tiles before patching of the offsets,
+            # so the file stays valid (with old tiles), if the writing is interrupted
+            file.seek(end_offset)
+            for tile_index, encoded_tile in zip(modified_tile_indices, encoded_tiles):
+                file.write(encoded_tile)
+                file_state.garbage_size += int(file_state.byte_counts[tile_index])
+                file_state.offsets[tile_index] = end_offset
+                file_state.byte_counts[tile_index] = len(encoded_tile)
+                end_offset += len(encoded_tile)
+
+            file.seek(file_state.offsets_position)
+            file.write(file_state.offsets.astype(file_state.offsets_dtype).tobytes())
+            file.seek(file_state.byte_counts_position)
+            file.write(file_state.byte_counts.astype(file_state.byte_counts_dtype).tobytes())
+
+        file_state.update_file_stat()
+
+    def _encode_tile(self, pixels: np.ndarray, file_state: _TiledTiffFileState, tile_index: int) -> bytes:
+        tile_row, tile_col = divmod(int(tile_index), file_state.tile_grid_shape[1])
+        top = tile_row * self.TILE_SIZE
+        left = tile_col * self.TILE_SIZE
+        tile_pixels = pixels[top:top + self.TILE_SIZE, left:left + self.TILE_SIZE]
+        if tile_pixels.shape[:2] != (self.TILE_SIZE, self.TILE_SIZE):
+            # Edge tiles are padded with zeros up to the full tile size
+            padded_tile_pixels = np.zeros((self.TILE_SIZE, self.TILE_SIZE, *pixels.shape[2:]), dtype=pixels.dtype)
+            padded_tile_pixels[:tile_pixels.shape[0], :tile_pixels.shape[1]] = tile_pixels
+            tile_pixels = padded_tile_pixels
+        return zlib.compress(np.ascontiguousarray(tile_pixels).tobytes(), self.COMPRESSION_LEVEL)
+
+
+class _TiledTiffFileState:
+    def __init__(self, tile_size: int):
+        self.tile_size = tile_size
+
+        self.path: Path | None = None
+        self.pixels_shape: tuple[int, ...] | None = None
+        self.pixels_dtype: np.dtype | None = None
+        self.tile_grid_shape: tuple[int, int] | None = None
+
+        self.offsets: np.ndarray | None = None
+        self.byte_counts: np.ndarray | None = None
+        self.offsets_position = 0
+        self.offsets_dtype: np.dtype | None = None
+        self.byte_counts_position = 0
+        self.byte_counts_dtype: np.dtype | None = None
+
+        self.file_size = 0
+        self.file_mtime_ns = 0
+        # Size of unused tile data left in the file after incremental updates
+        self.garbage_size = 0
+
+    def reset(
+            self,
+            path: Path,
+            pixels: np.ndarray,
+            offsets: np.ndarray,
+            byte_counts: np.ndarray,
+            offsets_position: int,
+            offsets_dtype: np.dtype,
+            byte_counts_position: int,
+            byte_counts_dtype: np.dtype,
+    ):
+        self.path = path
+        self.pixels_shape = pixels.shape
+        self.pixels_dtype = pixels.dtype
+        self.tile_grid_shape = (
+            math.ceil(pixels.shape[0] / self.tile_size), math.ceil(pixels.shape[1] / self.tile_size))
+        self.offsets = offsets
+        self.byte_counts = byte_counts
+        self.offsets_position = offsets_position
+        self.offsets_dtype = offsets_dtype
+        self.byte_counts_position = byte_counts_position
+        self.byte_counts_dtype = byte_counts_dtype
+        self.garbage_size = 0
+        self.update_file_stat()
+
+    def update_file_stat(self):
+        stat = os.stat(self.path)
+        self.file_size = stat.st_size
+        self.file_mtime_ns = stat.st_mtime_ns
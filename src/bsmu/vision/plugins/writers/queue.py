@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import logging
+import math
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+from PySide6.QtCore import QObject, Signal
+
+from bsmu.vision.core.concurrent import ThreadPool
+from bsmu.vision.core.config import Config
+from bsmu.vision.core.plugins import Plugin
+
+if TYPE_CHECKING:
+    from typing import Any
+
+    from bsmu.vision.core.bbox import BBox
+    from bsmu.vision.core.data import Data
+    from bsmu.vision.core.data.raster import Raster
+    from bsmu.vision.plugins.writers.file import FileWriter
+
+
+_BYTES_IN_MB = 1 << 20
+
+
+@dataclass
+class FileWriteQueueConfig(Config):
+    # If queued data takes more memory (in MB), writes into other paths are rejected until the queued writes
+    # are finished. Writes into queued paths are always accepted, because there is at most one pending write per path
+    max_queued_size: float = 1024
+
+
+class FileWriteQueuePlugin(Plugin):
+    def __init__(self):
+        super().__init__()
+
+        self._file_write_queue: FileWriteQueue | None = None
+
+    @property
+    def file_write_queue(self) -> FileWriteQueue | None:
+        return self._file_write_queue
+
+    def _enable(self):
+        config = FileWriteQueueConfig.from_dict(self.config.full_data)
+        self._file_write_queue = FileWriteQueue(round(config.max_queued_size * _BYTES_IN_MB))
+
+    def _disable(self):
+        self._file_write_queue = None
+
+
+@dataclass
+class _FileWrite:
+    writer: FileWriter
+    data: Data
+    kwargs: dict[str, Any]
+    nbytes: int
+    # Tracker of modified tiles of the source raster, which the data is a snapshot of
+    modified_tile_tracker: _ModifiedTileTracker | None = None
+
+
+class _ModifiedTileTracker:
+    """Tracks tiles of a raster, which were modified since its last queued write."""
+
+    def __init__(self, raster: Raster, tile_size: int):
+        self.tile_size = tile_size
+
+        # Path of the last queued write, or None, if modified tiles are unknown
+        self._path: Path | None = None
+        self._modified_tiles: np.ndarray | None = None
+        # Expected modification generation of the raster. It differs, if pixels were replaced without the signal
+        self._generation = raster.modification_generation
+
+        raster.pixels_modified.connect(self._on_pixels_modified)
+        raster.shape_changed.connect(self._on_shape_changed)
+
+    @property
+    def path(self) -> Path | None:
+        return self._path
+
+    def take(self, raster: Raster, path: Path) -> np.ndarray | None:
+        """
+        Return tiles, which were modified since the last queued write into the `path`, or None, if they are unknown.
+        Then track modifications since this write.
+        """
+        modified_tiles = self._modified_tiles \
+            if self._path == path and self._generation == raster.modification_generation else None
+        shape = raster.shape
+        self._modified_tiles = np.zeros(
+            (math.ceil(shape[0] / self.tile_size), math.ceil(shape[1] / self.tile_size)), dtype=bool)
+        self._path = path
+        self._generation = raster.modification_generation
+        return modified_tiles
+
+    def invalidate(self):
+        self._path = None
+        self._modified_tiles = None
+
+    def _on_pixels_modified(self, bbox: BBox | None):
+        self._generation += 1
+        if self._modified_tiles is None:
+            return
+
+        if bbox is None:
+            self._modified_tiles.fill(True)
+        else:
+            self._modified_tiles[
+                max(bbox.top, 0) // self.tile_size:math.ceil(bbox.bottom / self.tile_size),
+                max(bbox.left, 0) // self.tile_size:math.ceil(bbox.right / self.tile_size),
+            ] = True
+
+    def _on_shape_changed(self, old_shape: tuple | None, new_shape: tuple | None):
+        self.invalidate()
+
+
+class FileWriteQueue(QObject):
+    """
+    Writes files in worker threads, so saving does not block editing.
+
+    Only one write per path is performed at a time. Writes requested during it are coalesced:
+    only the latest requested data is written after the current write.
+    Files are written atomically (into a temporary file, which then replaces the target file),
+    so they are never left half-written.
+    The caller must not modify the queued data (e.g. pass a snapshot of pixels).
+
+    Preferred writers (e.g. writers, which update only modified tiles of files) write their formats
+    instead of requested writers. If a snapshot is queued with its source raster, and the writer can update
+    only modified tiles, tiles of the source modified since its previous write into the path are passed to the writer.
+    """
+
+    file_written = Signal(Path, object)  # path: Path, data: Data
+    file_writing_failed = Signal(Path, object, str)  # path: Path, data: Data, error_message: str
+
+    def __init__(self, max_queued_bytes: int = 1 << 30):
+        super().__init__()
+
+        self._max_queued_bytes = max_queued_bytes
+        # Bytes of data of pending writes and writes in progress
+        self._queued_bytes = 0
+
+        self._pending_write_by_path: dict[Path, _FileWrite] = {}
+        self._writing_paths: set[Path] = set()
+
+        self._preferred_writers: list[FileWriter] = []
+        self._modified_tile_tracker_by_source: weakref.WeakKeyDictionary[Raster, _ModifiedTileTracker] = \
+            weakref.WeakKeyDictionary()
+        # Tracker of the source, which was queued last for the path
+        self._modified_tile_tracker_by_path: weakref.WeakValueDictionary[Path, _ModifiedTileTracker] = \
+            weakref.WeakValueDictionary()
+
+    @property
+    def queued_bytes(self) -> int:
+        return self._queued_bytes
+
+    def is_queued(self, path: Path) -> bool:
+        return path in self._pending_write_by_path or path in self._writing_paths
+
+    def can_enqueue(self, path: Path, nbytes: int) -> bool:
+        """Return False, if a write of `nbytes` of data into the `path` would be rejected."""
+        if self.is_queued(path):
+            # The write replaces the pending write of the path, so the queue does not grow much
+            return True
+
+        # Accept a write of any size into the empty queue, else large data could never be written
+        return self._queued_bytes == 0 or self._queued_bytes + nbytes <= self._max_queued_bytes
+
+    def add_preferred_writer(self, writer: FileWriter):
+        self._preferred_writers.append(writer)
+
+    def remove_preferred_writer(self, writer: FileWriter):
+        self._preferred_writers.remove(writer)
+
+    def enqueue(self, writer: FileWriter, data: Data, path: Path, source: Raster | None = None, **kwargs) -> bool:
+        """
+        Queue writing of the `data` into the `path` using the `writer` (or a preferred writer of the path format).
+        The `kwargs` are passed into the `writer.write_to_file` method.
+        :param source: live raster, which the `data` is a snapshot of
+        Return False, if the write is rejected, because too much data is queued already.
+        Writes into queued paths are never rejected.
+        """
+        writer = self._preferred_writer(data, path) or writer
+
+        nbytes = getattr(data, 'pixels_nbytes', 0)
+        if not self.can_enqueue(path, nbytes):
+            logging.warning(f'Cannot queue writing into {path}: '
+                            f'{self._queued_bytes / _BYTES_IN_MB:.1f} MB of data are queued already')
+            return False
+
+        replaced_write = self._pending_write_by_path.get(path)
+        other_queued_bytes = self._queued_bytes - (0 if replaced_write is None else replaced_write.nbytes)
+
+        modified_tile_tracker = None
+        # Volumes emit VolumeBBox of modified regions, so modified tiles are tracked only for 2D rasters
+        if source is not None and source.n_dims == 2 and writer.MODIFIED_TILE_SIZE is not None:
+            modified_tile_tracker = self._modified_tile_tracker(source, writer.MODIFIED_TILE_SIZE)
+            modified_tiles = modified_tile_tracker.take(source, path)
+            if replaced_write is not None:
+                # Tiles of the replaced write have to be written too
+                modified_tiles = self._united_modified_tiles(
+                    replaced_write.kwargs.get('modified_tiles'), modified_tiles)
+            kwargs['modified_tiles'] = modified_tiles
+        # Tiles tracked by other sources are relative to their own writes into the path
+        previous_path_tracker = self._modified_tile_tracker_by_path.get(path)
+        if previous_path_tracker is not None and previous_path_tracker is not modified_tile_tracker:
+            previous_path_tracker.invalidate()
+        if modified_tile_tracker is None:
+            self._modified_tile_tracker_by_path.pop(path, None)
+        else:
+            self._modified_tile_tracker_by_path[path] = modified_tile_tracker
+
+        self._queued_bytes = other_queued_bytes + nbytes
+        self._pending_write_by_path[path] = _FileWrite(writer, data, kwargs, nbytes, modified_tile_tracker)
+        self._start_pending_write(path)
+        return True
+
+    def _preferred_writer(self, data: Data, path: Path) -> FileWriter | None:
+        file_format = path.suffix.lower().lstrip('.')
+        for writer in self._preferred_writers:
+            if file_format in type(writer).formats and writer.can_write(data):
+                return writer
+        return None
+
+    def _modified_tile_tracker(self, source: Raster, tile_size: int) -> _ModifiedTileTracker:
+        tracker = self._modified_tile_tracker_by_source.get(source)
+        if tracker is None or tracker.tile_size != tile_size:
+            tracker = _ModifiedTileTracker(source, tile_size)
+            self._modified_tile_tracker_by_source[source] = tracker
+        return tracker
+
+    @staticmethod
+    def _united_modified_tiles(tiles: np.ndarray | None, other_tiles: np.ndarray | None) -> np.ndarray | None:
+        if tiles is None or other_tiles is None or tiles.shape != other_tiles.shape:
+            return None
+        return tiles | other_tiles
+
+    def _start_pending_write(self, path: Path):
+        if path in self._writing_paths:
+            # The pending write will be started, when the current write finishes
+            return
+
+        file_write = self._pending_write_by_path.pop(path, None)
+        if file_write is None:
+            return
+
+        self._writing_paths.add(path)
+        task = ThreadPool.call_async(self._write, file_write, path)
+        task.on_finished = lambda error_message: self._on_write_finished(path, file_write, error_message)
+
+    @staticmethod
+    def _write(file_write: _FileWrite, path: Path) -> str | None:
+        """Return error message, if the writing failed."""
+        try:
+            file_write.writer.write_to_file(file_write.data, path, atomic=True, **file_write.kwargs)
+        except Exception as e:
+            logging.error(f'Cannot write into {path}: {e}')
+            return str(e) or type(e).__name__
+        return None
+
+    def _on_write_finished(self, path: Path, file_write: _FileWrite, error_message: str | None):
+        self._writing_paths.discard(path)
+        self._queued_bytes -= file_write.nbytes
+
+        if error_message is None:
+            self.file_written.emit(path, file_write.data)
+        else:
+            if file_write.modified_tile_tracker is not None:
+                # Tiles of the failed write are not in the file, so the next write has to write all tiles
+                file_write.modified_tile_tracker.invalidate()
+                pending_write = self._pending_write_by_path.get(path)
+                if pending_write is not None and 'modified_tiles' in pending_write.kwargs:
+                    pending_write.kwargs['modified_tiles'] = None
+            self.file_writing_failed.emit(path, file_write.data, error_message)
+
+        self._start_pending_write(path)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.undo import UndoCommand
+
+if TYPE_CHECKING:
+    from typing import Iterable, Iterator, Sequence
+
+    import numpy as np
+
+    from bsmu.vision.core.data.raster import Raster
+    from bsmu.vision.undo.spill import SpillRecord, UndoSpillFile
+
+
+RASTER_TILE_SIZE = 128
+
+
+def iter_tile_bboxes(
+        bbox: BBox, shape: Sequence[int], tile_size: int = RASTER_TILE_SIZE) -> Iterator[tuple[tuple[int, int], BBox]]:
+    """Yield (tile index, tile bbox) of every tile of the 2D `shape`, which intersects the `bbox`."""
+    bbox = bbox.clipped_to_shape(shape)
+    if bbox.empty:
+        return
+
+    height, width = shape[:2]
+    for tile_row in range(bbox.top // tile_size, (bbox.bottom - 1) // tile_size + 1):
+        tile_top = tile_row * tile_size
+        tile_bottom = min(tile_top + tile_size, height)
+        for tile_col in range(bbox.left // tile_size, (bbox.right - 1) // tile_size + 1):
+            tile_left = tile_col * tile_size
+            yield (tile_row, tile_col), BBox(tile_left, min(tile_left + tile_size, width), tile_top, tile_bottom)
+
+
+def united_tile_row_bboxes(tile_bboxes: Iterable[BBox]) -> list[BBox]:
+    """
+    Unite adjacent tiles of every tile row. Notify about modifications of such bboxes instead of the united bbox
+    of all tiles, so subscribers (e.g. the mask journal) do not process untouched tiles of long diagonal strokes.
+    """
+    united_bboxes = []
+    for tile_bbox in sorted(tile_bboxes, key=lambda bbox: (bbox.top, bbox.left)):
+        last_bbox = united_bboxes[-1] if united_bboxes else None
+        if (last_bbox is not None and last_bbox.top == tile_bbox.top and last_bbox.bottom == tile_bbox.bottom
+                and last_bbox.right == tile_bbox.left):
+            last_bbox.unite_with(tile_bbox)
+        else:
+            united_bboxes.append(BBox(tile_bbox.left, tile_bbox.right, tile_bbox.top, tile_bbox.bottom))
+    return united_bboxes
+
+
+class ModifyRasterCommand(UndoCommand):
+    """
+    Generic undo command for modifications of 2D raster pixels (with any dtype and number of channels).
+
+    Pixels are saved copy-on-write: call `save_pixels` before every modification of a region,
+    and a tile of the region is copied only at its first modification, so memory is proportional to touched tiles.
+    Push the command after the modifications: its first redo does nothing, because the pixels are modified already.
+    Undo and redo swap the saved tiles with the raster tiles, so the command keeps pixels of the other state.
+
+    Usage:
+        command = ModifyRasterCommand(mask, 'Brush Stroke')
+        command.save_pixels(bbox)
+        bbox.pixels(mask.pixels)[...] = new_pixels
+        mask.emit_pixels_modified(bbox)
+        undo_manager.push(command)
+    """
+
+    def __init__(self, raster: Raster, text: str = 'Modify Raster', parent: UndoCommand = None):
+        super().__init__(text, parent)
+
+        self._raster = raster
+        self._saved_tile_pixels_by_index: dict[tuple[int, int], np.ndarray] = {}
+        self._tile_bbox_by_index: dict[tuple[int, int], BBox] = {}
+
+        self._byte_size = 0
+        self._is_redone = True
+
+        self._spill_file: UndoSpillFile | None = None
+        self._spill_record: SpillRecord | None = None
+
+    @property
+    def is_empty(self) -> bool:
+        return not self._tile_bbox_by_index
+
+    def save_pixels(self, bbox: BBox):
+        """Save pixels of not saved yet tiles, which intersect the `bbox`. Call it before the pixels modification."""
+        pixels = self._raster.pixels
+        for tile_index, tile_bbox in iter_tile_bboxes(bbox, pixels.shape):
+            if tile_index in self._tile_bbox_by_index:
+                continue
+
+            tile_pixels = tile_bbox.pixels(pixels).copy()
+            self._saved_tile_pixels_by_index[tile_index] = tile_pixels
+            self._tile_bbox_by_index[tile_index] = tile_bbox
+            self._byte_size += tile_pixels.nbytes
+
+    def byte_size(self) -> int:
+        return self._byte_size
+
+    def spill(self, spill_file: UndoSpillFile) -> bool:
+        if self._spill_record is not None or self.is_empty:
+            return False
+
+        self._spill_record = spill_file.write(self._saved_tile_pixels_by_index)
+        self._spill_file = spill_file
+        self._saved_tile_pixels_by_index = {}
+        self._byte_size = 0
+        return True
+
+    def release(self):
+        self._raster = None
+        self._saved_tile_pixels_by_index = {}
+        self._tile_bbox_by_index = {}
+        self._byte_size = 0
+        self._spill_file = None
+        self._spill_record = None
+
+    def redo(self):
+        if self._is_redone:
+            # The pixels were modified before the command was pushed
+            return
+
+        self._swap_tiles()
+        self._is_redone = True
+
+    def undo(self):
+        self._swap_tiles()
+        self._is_redone = False
+
+    def _swap_tiles(self):
+        if self.is_empty:
+            return
+
+        is_spilled = self._spill_record is not None
+        # Spilled tiles are read back only for the swap
+        saved_tile_pixels_by_index = self._spill_file.read(self._spill_record) if is_spilled \
+            else self._saved_tile_pixels_by_index
+
+        pixels = self._raster.pixels
+        for tile_index, tile_bbox in self._tile_bbox_by_index.items():
+            raster_tile_pixels = tile_bbox.pixels(pixels)
+            saved_tile_pixels = saved_tile_pixels_by_index[tile_index]
+            saved_tile_pixels_by_index[tile_index] = raster_tile_pixels.copy()
+            raster_tile_pixels[...] = saved_tile_pixels
+
+        if is_spilled:
+            # Tiles of the other state are spilled again, so the command keeps taking no memory
+            self._spill_record = self._spill_file.write(saved_tile_pixels_by_index)
+        for modified_bbox in united_tile_row_bboxes(self._tile_bbox_by_index.values()):
+            self._raster.emit_pixels_modified(modified_bbox)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import pickle
+import tempfile
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from typing import Any
+
+
+@dataclass(frozen=True)
+class SpillRecord:
+    offset: int
+    size: int
+
+
+class UndoSpillFile:
+    """
+    Append-only temporary file, which keeps data of undo commands moved out of memory.
+    Space of dropped records is not reused. The file is deleted, when it is closed (or the application exits).
+    """
+
+    def __init__(self, directory: Path | None = None):
+        self._directory = directory
+        self._file = None
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def write(self, data: Any) -> SpillRecord:
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix='bsmu-vision-undo-', suffix='.spill', dir=self._directory)
+
+        serialized_data = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        self._file.seek(self._size)
+        self._file.write(serialized_data)
+        record = SpillRecord(self._size, len(serialized_data))
+        self._size += record.size
+        return record
+
+    def read(self, record: SpillRecord) -> Any:
+        self._file.seek(record.offset)
+        return pickle.loads(self._file.read(record.size))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._size = 0
@@ -1,7 +1,14 @@
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
+
 from PySide6.QtGui import QUndoCommand
 
+if TYPE_CHECKING:
+    from typing import Callable
+
+    from bsmu.vision.undo.spill import UndoSpillFile
+
 
 class UndoCommand(QUndoCommand):
     _type_id: int = 0
@@ -18,6 +25,48 @@ class UndoCommand(QUndoCommand):
 
         # print(f'{self.__class__.__name__} id={self._type_id}')
 
+        # Sequence number of the push into an undo stack. It is used to find the oldest commands
+        self.push_number = 0
+        # Is called, when the size of the command data changes after the push (e.g. after a background compression)
+        self.byte_size_changed_callback: Callable[[UndoCommand], None] | None = None
+
     @classmethod
     def command_type_id(cls) -> int:
         return cls._type_id
+
+    def byte_size(self) -> int:
+        """Return the number of bytes, which the command data (including child commands) take in memory."""
+        return sum(child.byte_size() for child in self._children())
+
+    @property
+    def is_merging(self) -> bool:
+        """Return True, if next commands can be merged into this one, so its data are not final yet."""
+        return False
+
+    @property
+    def is_compressing(self) -> bool:
+        """Return True, if the command data are being compressed, so they can be spilled or dropped only after that."""
+        return False
+
+    def spill(self, spill_file: UndoSpillFile) -> bool:
+        """
+        Move the command data into the `spill_file`, so only small descriptors are kept in memory.
+        The data have to be read back on demand by undo/redo.
+        Return False, if the command cannot be spilled (then it can be dropped instead).
+        """
+        return False
+
+    def release(self):
+        """
+        Release the command data, when the command is dropped from the undo history.
+        The command will be never undone or redone after that.
+        """
+        for child in self._children():
+            child.release()
+
+    def _notify_byte_size_changed(self):
+        if self.byte_size_changed_callback is not None:
+            self.byte_size_changed_callback(self)
+
+    def _children(self) -> list[UndoCommand]:
+        return [child for child in (self.child(i) for i in range(self.childCount())) if isinstance(child, UndoCommand)]
@@ -4,9 +4,13 @@ import math
 from typing import TYPE_CHECKING
 
 import numpy as np
+from PySide6.QtGui import QImage
 
+from bsmu.vision.actors.layer.layer import IntensityWindowing, create_display_qimage
+from bsmu.vision.core.bbox import VolumeBBox
 from bsmu.vision.core.constants import PlaneAxis
 from bsmu.vision.core.image import FlatImage, SpatialAttrs, VolumeImage
+from bsmu.vision.core.slab import SlabMode, SlabProjector
 from bsmu.vision.widgets.viewers.image.layered import LayeredImageViewer, ImageLayerView
 from bsmu.vision.widgets.viewers.image.layered.flat import FlatImageLayerView
 
@@ -14,6 +18,7 @@ if TYPE_CHECKING:
     from PySide6.QtWidgets import QWidget
 
     from bsmu.vision.core.bbox import BBox
+    from bsmu.vision.core.data.raster import Raster
     from bsmu.vision.core.image import Image
     from bsmu.vision.core.image.layered import ImageLayer, LayeredImage
     from bsmu.vision.core.selection import SelectionManager
@@ -29,6 +34,10 @@ class VolumeSliceImageLayerView(ImageLayerView):
 
         self._flat_image_cache = None
 
+        self._slab_thickness = 1
+        self._slab_mode = SlabMode.MAX
+        self._slab_projector: SlabProjector | None = None
+
         self._update_image_view()
 
     @property
@@ -48,6 +57,50 @@ class VolumeSliceImageLayerView(ImageLayerView):
     def show_prev_slice(self):
         self.slice_number = max(0, self.slice_number - 1)
 
+    @property
+    def slab_thickness(self) -> int:
+        return self._slab_thickness
+
+    @property
+    def slab_mode(self) -> SlabMode:
+        return self._slab_mode
+
+    def set_slab(self, thickness: int, mode: SlabMode = SlabMode.MAX):
+        """Show projection of `thickness` slices around the current one. Thickness 1 shows a single slice."""
+        thickness = max(1, thickness)
+        if self._slab_thickness == thickness and self._slab_mode == mode:
+            return
+
+        self._slab_thickness = thickness
+        self._slab_mode = mode
+        if self._slab_projector is not None:
+            self._slab_projector.thickness = thickness
+            self._slab_projector.mode = mode
+        self._update_image_view()
+
+    def render_display_qimage(
+            self, slice_number: int, window: tuple[float | None, float | None] = (None, None)) -> QImage:
+        """
+        Render the slice into display-ready QImage without changing the view,
+        so it can be called from a worker thread (e.g. to prefetch cine frames).
+        Slab projection is not applied, because the projector can be updated only sequentially.
+        :param window: (window_width, window_level) of intensity windowing
+        """
+        pixels = self.image.slice_pixels(self.plane_axis, slice_number)
+        palette = self.image_palette
+        if palette is None and pixels.ndim == 2:
+            pixels = IntensityWindowing(pixels, *window).windowing_applied()
+        _, display_qimage = create_display_qimage(pixels, palette)
+        # Conversion copies the pixels, so the QImage does not depend on the lifetime of the numpy array.
+        # Premultiplied ARGB32 is the native QPixmap format, so the QImage will be quickly converted into QPixmap
+        return display_qimage.convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+
+    def show_rendered_slice(self, slice_number: int, display_qimage: QImage):
+        """Show the slice rendered by the `render_display_qimage`."""
+        self._slice_number = slice_number
+        self._flat_image_cache = None
+        self.show_display_qimage(display_qimage)
+
     @property
     def flat_image(self) -> FlatImage:
         if self._flat_image_cache is None and self.image is not None:
@@ -67,23 +120,67 @@ class VolumeSliceImageLayerView(ImageLayerView):
                                                path=self.image_path, spatial=slice_spatial)
             # |flat_image| contains pixel array view (not a copy),
             # so if we change its pixels, the pixels of image will be changed too
-            self._flat_image_cache.pixels_modified.connect(self.image.pixels_modified)
+            self._flat_image_cache.pixels_modified.connect(self._on_flat_image_pixels_modified)
         return self._flat_image_cache
 
+    @property
+    def current_slice(self) -> Raster | None:
+        return self.flat_image
+
     def _create_image_view(self) -> FlatImage:
         return self.flat_image
 
     def _on_layer_image_updated(self, image: Image):
         if self.image is not None:
             self._slice_number = self.image.center_slice_number(self.plane_axis)
+        self._slab_projector = None
         super()._on_layer_image_updated(image)
 
+    def _on_flat_image_pixels_modified(self, bbox: BBox = None):
+        # Translate the modified region into volume coordinates, so views of other planes
+        # can skip the update, if their slices do not intersect the region
+        volume_bbox = VolumeBBox.from_slice(self.image.shape, self.plane_axis, self.slice_number) if bbox is None \
+            else VolumeBBox.from_slice_bbox(bbox, self.plane_axis, self.slice_number)
+        self.image.emit_pixels_modified(volume_bbox)
+
+    def _on_image_pixels_modified(self, bbox: BBox | VolumeBBox = None):
+        if isinstance(bbox, VolumeBBox):
+            if self._slab_thickness == 1:
+                displayed_slices_range = (self.slice_number, self.slice_number + 1)
+            else:
+                slab_projector = self._slab_projector \
+                    or SlabProjector(self.image, self.plane_axis, self._slab_thickness, self._slab_mode)
+                displayed_slices_range = slab_projector.slab_range(self.slice_number)
+            if not bbox.intersects_slices(self.plane_axis, *displayed_slices_range):
+                return
+
+            # Only the row or column band of the displayed slice is modified
+            bbox = bbox.slice_bbox(self.plane_axis)
+
+        if self._slab_thickness > 1:
+            # Projection is a copy of the volume pixels, so it has to be recalculated
+            self._slab_projector = None
+            self._flat_image_cache = None
+        super()._on_image_pixels_modified(bbox)
+
+    def release_display_buffers(self):
+        # Flat image and slab projector contain views of the volume pixels
+        self._flat_image_cache = None
+        self._slab_projector = None
+        super().release_display_buffers()
+
     def _update_image_view(self, bbox: BBox = None):
         self._flat_image_cache = None
         super()._update_image_view()
 
     def slice_pixels(self) -> np.ndarray:
-        return self.image.slice_pixels(self.plane_axis, self.slice_number)
+        if self._slab_thickness == 1:
+            return self.image.slice_pixels(self.plane_axis, self.slice_number)
+
+        if self._slab_projector is None:
+            self._slab_projector = SlabProjector(self.image, self.plane_axis, self._slab_thickness, self._slab_mode)
+        # Projector reuses its arrays, and flat image pixels can be modified, so copy the projection
+        return self._slab_projector.project(self.slice_number).copy()
 
 
 class VolumeSliceImageViewer(LayeredImageViewer):
@@ -131,3 +228,17 @@ class VolumeSliceImageViewer(LayeredImageViewer):
         for layer_view in self.layer_views:
             if isinstance(layer_view, VolumeSliceImageLayerView):
                 layer_view.show_prev_slice()
+
+    @property
+    def slab_thickness(self) -> int:
+        return next((layer_view.slab_thickness for layer_view in self._slab_layer_views()), 1)
+
+    def set_slab(self, thickness: int, mode: SlabMode = SlabMode.MAX):
+        for layer_view in self._slab_layer_views():
+            layer_view.set_slab(thickness, mode)
+
+    def _slab_layer_views(self) -> list[VolumeSliceImageLayerView]:
+        # Projections of indexed images (masks) have no sense, so they are shown as single slices
+        return [layer_view for layer_view in self.layer_views
+                if isinstance(layer_view, VolumeSliceImageLayerView)
+                and layer_view.image is not None and not layer_view.image.is_indexed]
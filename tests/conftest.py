@@ -0,0 +1,26 @@
+import time
+
+import pytest
+from PySide6.QtCore import QCoreApplication
+
+from bsmu.vision.core.concurrent import ThreadPool
+
+
+@pytest.fixture(scope='session')
+def thread_pool() -> QCoreApplication:
+    """Application with the thread pool, which processes finished tasks in its event loop."""
+    app = QCoreApplication.instance() or QCoreApplication([])
+    ThreadPool.create_instance()
+    return app
+
+
+@pytest.fixture
+def wait_until(thread_pool):
+    """Return a function, which processes events until the condition is true, and asserts it."""
+    def wait(condition, timeout: float = 10):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            thread_pool.processEvents()
+            time.sleep(0.001)
+        assert condition()
+    return wait
@@ -0,0 +1,19 @@
+from bsmu.vision.core.bbox import BBox, VolumeBBox
+
+
+def test_volume_bbox_from_slice_bbox():
+    bbox = BBox(left=2, right=5, top=1, bottom=3)
+    volume_bbox = VolumeBBox.from_slice_bbox(bbox, plane_axis=1, slice_number=7)
+    assert volume_bbox.starts == (1, 7, 2)
+    assert volume_bbox.stops == (3, 8, 5)
+    assert volume_bbox.contains_slice(1, 7)
+    assert not volume_bbox.contains_slice(1, 8)
+
+
+def test_volume_bbox_band_in_orthogonal_slices():
+    volume_bbox = VolumeBBox.from_slice_bbox(BBox(2, 5, 1, 3), plane_axis=0, slice_number=4)
+    # Axial edit intersects coronal slices 1 and 2 only in the row of the slice 4
+    assert volume_bbox.contains_slice(1, 2)
+    assert not volume_bbox.contains_slice(1, 3)
+    band = volume_bbox.slice_bbox(1)
+    assert (band.top, band.bottom, band.left, band.right) == (4, 5, 2, 5)
@@ -0,0 +1,37 @@
+import itertools
+
+import cv2
+import numpy as np
+
+from bsmu.vision.core.clustering import kmeans_uint8
+
+
+def _sum_of_squared_distances(samples: np.ndarray, labels: np.ndarray) -> float:
+    samples = samples.astype(np.float64)
+    return sum(((samples[labels == label] - samples[labels == label].mean()) ** 2).sum()
+               for label in np.unique(labels))
+
+
+def test_uint8_kmeans_is_optimal():
+    rng = np.random.default_rng(0)
+    for cluster_count in (2, 3, 4):
+        samples = np.concatenate([rng.normal(rng.uniform(0, 255), rng.uniform(3, 30), 500)
+                                  for _ in range(cluster_count)]).clip(0, 255).astype(np.uint8)
+        labels, centers = kmeans_uint8(samples, cluster_count)
+        assert np.all(np.diff(centers) > 0)
+
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+        _, cv_labels, _ = cv2.kmeans(
+            samples.astype(np.float32), cluster_count, None, criteria, 10, cv2.KMEANS_PP_CENTERS)
+        assert (_sum_of_squared_distances(samples, labels)
+                <= _sum_of_squared_distances(samples, cv_labels.ravel()) + 1e-6)
+
+    # Compare with all possible partitions of sorted distinct values
+    samples = rng.integers(0, 256, 12).astype(np.uint8)
+    labels, _ = kmeans_uint8(samples, 3)
+    best_cost = min(
+        _sum_of_squared_distances(samples, np.searchsorted(np.array(thresholds), samples, side='right'))
+        for thresholds in itertools.combinations(np.unique(samples)[1:], 2))
+    assert np.isclose(_sum_of_squared_distances(samples, labels), best_cost)
+
+    assert kmeans_uint8(np.full(10, 7, dtype=np.uint8), 2) is None
@@ -0,0 +1,26 @@
+import numpy as np
+import skimage.measure
+
+from bsmu.vision.core.components import SeededComponentFiller
+
+
+def test_seeded_component_filler_matches_skimage_label():
+    rng = np.random.default_rng(0)
+    filler = SeededComponentFiller()
+    for shape in ((40, 50), (13, 7), (40, 50)):
+        image = rng.integers(0, 3, size=shape, dtype=np.uint8)
+        labels = skimage.measure.label(image, background=0)
+        seed_rows = rng.integers(0, shape[0], 5)
+        seed_cols = rng.integers(0, shape[1], 5)
+
+        filled_pixels = filler.fill(image, 1, seed_rows, seed_cols)
+        seed_labels = labels[seed_rows, seed_cols][image[seed_rows, seed_cols] == 1]
+        assert np.array_equal(filled_pixels, np.isin(labels, seed_labels))
+
+
+def test_seeded_component_filler_accepts_views():
+    image = np.zeros((20, 20), dtype=np.uint8)
+    image[5:8, 2:15] = 1
+    filled_pixels = SeededComponentFiller().fill(image[4:10, 3:12], 1, [1], [0])
+    assert filled_pixels.shape == (6, 9)
+    assert np.count_nonzero(filled_pixels) == 3 * 9
@@ -0,0 +1,36 @@
+import numpy as np
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.image.features import ImageFeature, ImageFeatureTileCache, calculate_image_feature
+
+
+def test_feature_tile_cache_gathers_tiles():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (700, 600, 3), dtype=np.uint8)
+    cache = ImageFeatureTileCache(image, ImageFeature.SATURATION, size_limit=2 * 256 * 256)
+
+    bbox = BBox(100, 550, 200, 650)
+    assert np.array_equal(
+        cache.features(bbox, level=0), calculate_image_feature(bbox.pixels(image), ImageFeature.SATURATION))
+    # Least recently used tiles are evicted
+    assert 0 < sum(tile.nbytes for tile in cache._tile_by_key.values()) <= 2 * 256 * 256
+
+    level_features = cache.features(bbox, level=1)
+    assert level_features.shape == (225, 225)
+    assert cache.level_shape(1) == (350, 300)
+
+
+def test_feature_scale_level():
+    assert ImageFeatureTileCache.scale_level(1) == 0
+    assert ImageFeatureTileCache.scale_level(0.5) == 1
+    assert ImageFeatureTileCache.scale_level(0.3) == 1
+    assert ImageFeatureTileCache.scale_level(0.05) == 4
+
+
+def test_hematoxylin_feature_is_darker_for_eosin_pixels():
+    # Typical colors of hematoxylin (nuclei) and eosin (cytoplasm) stained pixels
+    image = np.array([[[70, 50, 140], [230, 140, 190]]], dtype=np.uint8)
+    hematoxylin = calculate_image_feature(image, ImageFeature.HEMATOXYLIN, stain_max=0.2)
+    eosin = calculate_image_feature(image, ImageFeature.EOSIN, stain_max=0.2)
+    assert hematoxylin[0, 0] > hematoxylin[0, 1]
+    assert eosin[0, 1] > 0
@@ -0,0 +1,49 @@
+import numpy as np
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.journal import MaskJournal
+
+
+def test_journal_replay_and_truncate(tmp_path, wait_until):
+    saved_pixels = np.zeros((300, 200), dtype=np.uint8)
+    pixels = saved_pixels.copy()
+    journal = MaskJournal(MaskJournal.path_for_mask(tmp_path / 'mask.png'), pixels.shape)
+
+    for generation, (bbox, value) in enumerate([
+            (BBox(10, 50, 20, 80), 1), (BBox(40, 120, 60, 70), 2), (BBox(0, 200, 290, 300), 3)], start=1):
+        bbox.pixels(pixels)[...] = value
+        journal.append(generation, bbox, pixels)
+    wait_until(lambda: not journal.is_flushing)
+
+    replayed_pixels = saved_pixels.copy()
+    assert MaskJournal.replay(journal.path, replayed_pixels) == 3
+    assert np.array_equal(replayed_pixels, pixels)
+
+    # Torn record at the end of the file is ignored
+    with open(journal.path, 'ab') as file:
+        file.write(b'\x01\x02\x03')
+    assert MaskJournal.replay(journal.path, saved_pixels.copy()) == 3
+
+    journal.truncate(2)
+    wait_until(lambda: not journal.is_flushing)
+    _, records, _ = MaskJournal.read_records(journal.path)
+    assert [record.generation for record in records] == [3]
+
+    journal.truncate(3)
+    wait_until(lambda: not journal.is_flushing)
+    assert not journal.path.exists()
+
+
+def test_discarded_journal_is_removed_after_scheduled_records(tmp_path, wait_until):
+    journal = MaskJournal(MaskJournal.path_for_mask(tmp_path / 'mask.png'), (100, 100))
+    journal.append(1, BBox(0, 10, 0, 10), np.ones((100, 100), dtype=np.uint8))
+    journal.discard()
+    wait_until(lambda: not journal.is_flushing)
+    assert not journal.path.exists()
+
+    # The failed operation does not stop the flushing
+    journal._schedule(lambda: 1 / 0)
+    journal.append(3, BBox(0, 10, 0, 10), np.ones((100, 100), dtype=np.uint8))
+    wait_until(lambda: not journal.is_flushing)
+    _, records, _ = MaskJournal.read_records(journal.path)
+    assert [record.generation for record in records] == [3]
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.data.raster import VolumeImage
+from bsmu.vision.core.mpr import MprResampler, ObliquePlane
+
+
+def _volume() -> VolumeImage:
+    return VolumeImage(np.arange(4 * 5 * 6, dtype=np.float32).reshape(4, 5, 6))
+
+
+def test_axis_aligned_plane_equals_slice():
+    volume = _volume()
+    resampler = MprResampler(volume, (5, 6))
+    plane = ObliquePlane(center=(2, 2, 2.5), row_axis=(0, 1, 0), col_axis=(0, 0, 1))
+    assert np.allclose(resampler.resample(plane), volume.pixels[2])
+    assert np.allclose(resampler.resample(plane.moved(1)), volume.pixels[3])
+
+
+def test_trilinear_interpolation_between_slices():
+    volume = _volume()
+    resampler = MprResampler(volume, (5, 6))
+    plane = ObliquePlane(center=(1.5, 2, 2.5), row_axis=(0, 1, 0), col_axis=(0, 0, 1))
+    assert np.allclose(resampler.resample(plane), volume.pixels[1:3].mean(axis=0))
+
+
+def test_region_and_step():
+    volume = _volume()
+    resampler = MprResampler(volume, (5, 6))
+    plane = ObliquePlane(center=(2, 2, 2.5), row_axis=(0, 1, 0), col_axis=(0, 0, 1))
+    resampled = resampler.resample(plane, region=BBox(1, 6, 0, 4), step=2)
+    assert np.allclose(resampled, volume.pixels[2, 0:4:2, 1:6:2])
+
+
+def test_samples_outside_volume_are_filled():
+    volume = _volume()
+    resampler = MprResampler(volume, (5, 6), fill_value=-1)
+    plane = ObliquePlane(center=(10, 2, 2.5), row_axis=(0, 1, 0), col_axis=(0, 0, 1))
+    assert (resampler.resample(plane) == -1).all()
+
+
+def test_oblique_plane_equals_trilinear_reference():
+    ndimage = pytest.importorskip('scipy.ndimage')
+    volume = VolumeImage(np.random.default_rng(0).random((20, 24, 28), dtype=np.float32))
+    output_shape = (16, 20)
+    resampler = MprResampler(volume, output_shape)
+    # The plane is rotated by 45 degrees around the column axis
+    plane = ObliquePlane(center=(9.5, 11.5, 13.5), row_axis=(1, 1, 0), col_axis=(0, 0, 1))
+
+    rows, cols = np.meshgrid(
+        np.arange(output_shape[0]) - (output_shape[0] - 1) / 2,
+        np.arange(output_shape[1]) - (output_shape[1] - 1) / 2,
+        indexing='ij')
+    coords = (plane.center[:, np.newaxis, np.newaxis]
+              + plane.row_axis[:, np.newaxis, np.newaxis] * rows
+              + plane.col_axis[:, np.newaxis, np.newaxis] * cols)
+    reference = ndimage.map_coordinates(volume.pixels, coords, order=1)
+    assert np.allclose(resampler.resample(plane), reference, atol=1e-4)
@@ -0,0 +1,26 @@
+import cv2 as cv
+import numpy as np
+
+from bsmu.vision.core.palette import Palette
+from bsmu.vision.core.png import gray_png_to_palette_png, palette_png_to_gray_png
+
+
+def test_palette_png_round_trip():
+    pixels = np.zeros((20, 30), dtype=np.uint8)
+    pixels[5:10, 3:25] = 1
+    _, gray_png = cv.imencode('.png', pixels)
+
+    palette = Palette.default_binary()
+    palette_png = gray_png_to_palette_png(gray_png.tobytes(), palette)
+    # OpenCV expands palette PNG into color image
+    colored_pixels = cv.imdecode(np.frombuffer(palette_png, dtype=np.uint8), cv.IMREAD_UNCHANGED)
+    assert colored_pixels.ndim == 3
+    assert (colored_pixels[7, 10][:3] == palette.array[1][2::-1]).all()
+
+    indices = cv.imdecode(np.frombuffer(palette_png_to_gray_png(palette_png), dtype=np.uint8), cv.IMREAD_UNCHANGED)
+    assert np.array_equal(indices, pixels)
+
+
+def test_gray_png_is_not_converted_back():
+    _, gray_png = cv.imencode('.png', np.zeros((4, 4), dtype=np.uint8))
+    assert palette_png_to_gray_png(gray_png.tobytes()) is None
@@ -0,0 +1,34 @@
+import numpy as np
+
+from bsmu.vision.core.data.raster import Raster
+from bsmu.vision.core.palette import Palette
+
+
+def test_compressed_pixels_are_decompressed_on_access():
+    pixels = np.zeros((3000, 2000), dtype=np.uint8)
+    pixels[100:2500, 300:1700] = 1
+    mask = Raster(pixels.copy(), Palette.default_binary())
+    modification_generation = mask.modification_generation
+
+    assert mask.compress_pixels()
+    assert mask.is_pixels_compressed
+    assert mask.pixels_nbytes < pixels.nbytes / 100
+    assert mask.shape == pixels.shape
+    # Compression does not modify pixels
+    assert mask.modification_generation == modification_generation
+
+    assert np.array_equal(mask.pixels, pixels)
+    assert not mask.is_pixels_compressed
+    # Decompressed pixels are writable
+    mask.pixels[0, 0] = 1
+
+
+def test_snapshot_has_no_parent():
+    parent = Raster(np.zeros((2, 2), dtype=np.uint8))
+    mask = Raster(np.zeros((10, 10), dtype=np.uint8), Palette.default_binary(), parent=parent)
+    mask.emit_pixels_modified()
+
+    snapshot = mask.snapshot()
+    assert snapshot.parent() is None
+    assert snapshot.modification_generation == mask.modification_generation
+    assert np.array_equal(snapshot.pixels, mask.pixels) and snapshot.pixels is not mask.pixels
@@ -0,0 +1,41 @@
+import numpy as np
+
+from bsmu.vision.core.rle import RowRuns, decode_rle, encode_rle
+
+
+def _random_mask(shape: tuple, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (rng.random(shape) < 0.4).astype(np.uint8) * rng.integers(1, 3, shape, dtype=np.uint8)
+
+
+def test_rle_round_trip():
+    mask = _random_mask((4, 30, 50), seed=0)
+    values, run_lengths = encode_rle(mask)
+    assert np.array_equal(decode_rle(values, run_lengths, shape=mask.shape), mask)
+    assert decode_rle(*encode_rle(np.empty(0, np.uint8))).size == 0
+
+
+def test_row_runs_round_trip():
+    mask = _random_mask((3, 20, 40), seed=1)
+    row_runs = RowRuns.from_mask(mask, 2)
+    assert row_runs.pixel_count == np.count_nonzero(mask == 2)
+    assert np.array_equal(row_runs.to_mask(), mask == 2)
+    # Large runs use coverage instead of pixel indices
+    full_runs = RowRuns.from_mask(np.ones((10, 10), np.uint8))
+    assert full_runs.run_count == 10
+    assert full_runs.to_mask(value=3).min() == 3
+    drawn_mask = np.zeros((10, 10), np.uint8)
+    assert full_runs.to_mask(value=3, out=drawn_mask) is drawn_mask and drawn_mask.min() == 3
+    small_runs = RowRuns.from_mask(np.eye(20, dtype=np.uint8))
+    assert np.array_equal(small_runs.to_mask(out=np.zeros((20, 20), np.uint8)), np.eye(20))
+
+
+def test_row_runs_set_operations():
+    first = _random_mask((30, 25), seed=2) != 0
+    second = _random_mask((30, 25), seed=3) != 0
+    first_runs = RowRuns.from_mask(first)
+    second_runs = RowRuns.from_mask(second)
+    assert (first_runs | second_runs) == RowRuns.from_mask(first | second)
+    assert (first_runs & second_runs) == RowRuns.from_mask(first & second)
+    assert (first_runs - second_runs) == RowRuns.from_mask(first & ~second)
+    assert (first_runs - first_runs) == RowRuns.empty(first.shape)
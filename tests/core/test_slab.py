@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from bsmu.vision.core.constants import PlaneAxis
+from bsmu.vision.core.data.raster import VolumeImage
+from bsmu.vision.core.slab import SlabMode, SlabProjector
+
+_REDUCTION_BY_MODE = {
+    SlabMode.MAX: np.max,
+    SlabMode.MIN: np.min,
+    SlabMode.MEAN: np.mean,
+}
+
+
+@pytest.mark.parametrize('mode', list(SlabMode))
+@pytest.mark.parametrize('plane_axis', list(PlaneAxis))
+def test_incremental_projection_equals_full_recomputation(mode, plane_axis):
+    rng = np.random.default_rng(0)
+    volume = VolumeImage(rng.integers(0, 1000, size=(20, 16, 12), dtype=np.uint16))
+    projector = SlabProjector(volume, plane_axis, thickness=5, mode=mode)
+    slice_count = volume.array.shape[plane_axis]
+    # Forward and backward scrolling, direction changes, jumps and volume borders
+    slice_numbers = [*range(slice_count), *range(slice_count - 1, -1, -1), 3, 4, 3, 9, 10, 2, 0, 1]
+    for slice_number in slice_numbers:
+        start, stop = projector.slab_range(slice_number)
+        slab = np.take(volume.array, range(start, stop), axis=plane_axis)
+        expected = _REDUCTION_BY_MODE[mode](slab, axis=plane_axis)
+        assert np.allclose(projector.project(slice_number), expected)
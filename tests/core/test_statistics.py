@@ -0,0 +1,41 @@
+import numpy as np
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.statistics import ClassPixelCountsTask, IntensityStatisticsTask
+
+
+def test_integer_percentiles_are_exact():
+    pixels = np.random.default_rng(0).integers(-1000, 3000, size=(40, 30, 20), dtype=np.int16)
+    task = IntensityStatisticsTask(pixels)
+    task.CHUNK_ELEMENT_COUNT = 1000  # Several chunks
+    task.run()
+    statistics = task.result
+    assert statistics.min_value == pixels.min()
+    assert statistics.max_value == pixels.max()
+    for q in (0.5, 25, 50, 99.5):
+        assert statistics.percentile(q) == np.percentile(pixels, q, method='inverted_cdf')
+    assert task.progress == 100
+
+
+def test_float_statistics_with_unit_bin_width():
+    for pixels in (np.zeros((4, 5, 6), np.float32), np.linspace(0, 4096, 120).reshape(4, 5, 6)):
+        task = IntensityStatisticsTask(pixels)
+        task.run()
+        statistics = task.result
+        assert statistics.pixel_count == pixels.size
+        assert statistics.min_value == pixels.min()
+        assert pixels.max() - statistics.bin_width <= statistics.percentile(100) <= pixels.max()
+
+
+def test_class_pixel_counts_are_updated_in_modified_bbox():
+    mask = np.random.default_rng(0).integers(0, 4, size=(700, 600), dtype=np.uint8)
+    task = ClassPixelCountsTask(mask)
+    task.run()
+    counts = task.result
+    assert np.array_equal(counts.counts, np.bincount(mask.ravel(), minlength=256))
+
+    bbox = BBox(250, 530, 100, 400)
+    bbox.pixels(mask)[...] = 7
+    counts.recount(mask, bbox)
+    assert np.array_equal(counts.counts, np.bincount(mask.ravel(), minlength=256))
+    assert counts.areas(np.array([0.5, 0.5]))[7] == counts.counts[7] * 0.25
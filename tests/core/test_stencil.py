@@ -0,0 +1,61 @@
+import numpy as np
+import skimage.draw
+
+from bsmu.vision.core.stencil import capsule_stencil, ellipse_stencil, stencil_pixel_index
+
+
+def test_ellipse_stencil_matches_skimage_ellipse():
+    shape = (50, 40)
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        # Use values on the quantization grid of stencils
+        center_row, center_col = rng.integers(-20, 240, 2) / 4
+        row_radius, col_radius = rng.integers(1, 80, 2) / 4
+
+        expected = np.zeros(shape, dtype=bool)
+        rr, cc = skimage.draw.ellipse(center_row, center_col, row_radius, col_radius, shape=shape)
+        expected[rr, cc] = True
+
+        stencil_bbox, stencil = ellipse_stencil(center_row, center_col, row_radius, col_radius, shape)
+        assert stencil.shape == stencil_bbox.shape
+        actual = np.zeros(shape, dtype=bool)
+        stencil_bbox.pixels(actual)[stencil] = True
+        assert np.array_equal(actual, expected)
+
+
+def test_ellipse_stencil_is_cached():
+    _, stencil = ellipse_stencil(10.3, 20.6, 5, 7, (100, 100))
+    _, moved_stencil = ellipse_stencil(30.3, 40.6, 5, 7, (100, 100))
+    assert np.shares_memory(stencil, moved_stencil)
+    assert not stencil.flags.writeable
+
+
+def test_stencil_pixel_index():
+    stencil = np.array([[False, True, True],
+                        [True, False, True]])
+    values = np.arange(stencil.size).reshape(stencil.shape)
+    assert values[stencil][stencil_pixel_index(stencil, 1, 2)] == values[1, 2]
+    assert stencil_pixel_index(stencil, 1, 1) is None
+    assert stencil_pixel_index(stencil, 2, 0) is None
+
+
+def test_capsule_stencil_covers_ellipses_along_the_segment():
+    shape = (80, 90)
+    row_radius, col_radius = 6.5, 4.25
+    start, end = (10.25, -3.5), (60.75, 70.5)
+    capsule = np.zeros(shape, dtype=bool)
+    capsule_bbox, stencil = capsule_stencil(*start, *end, row_radius, col_radius, shape)
+    capsule_bbox.pixels(capsule)[stencil] = True
+
+    union = np.zeros(shape, dtype=bool)
+    for t in np.linspace(0, 1, 200):
+        rr, cc = skimage.draw.ellipse(*(np.array(start) + t * (np.array(end) - start)), row_radius, col_radius,
+                                      shape=shape)
+        union[rr, cc] = True
+    # Ellipses at dense positions almost cover the capsule
+    assert not (union & ~capsule).any()
+    assert np.count_nonzero(capsule & ~union) < 0.01 * np.count_nonzero(capsule)
+
+    _, point_stencil = capsule_stencil(*start, *start, row_radius, col_radius, shape)
+    _, ellipse = ellipse_stencil(*start, row_radius, col_radius, shape)
+    assert np.count_nonzero(point_stencil) == np.count_nonzero(ellipse)
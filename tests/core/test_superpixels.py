@@ -0,0 +1,21 @@
+import numpy as np
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.image.superpixels import SuperpixelTileCache
+
+
+def test_superpixels_follow_image_regions_and_tiles():
+    image = np.full((300, 400), 50, dtype=np.uint8)
+    image[:, 180:] = 200
+    cache = SuperpixelTileCache(image, size_limit=10 * 1024 * 1024, superpixel_size=16, compactness=0.1)
+
+    bbox = BBox(100, 300, 50, 290)
+    labels, descriptors = cache.superpixels(bbox, 0)
+    assert labels.shape == bbox.shape
+    # Superpixels do not cross the edge, and are described by the mean value
+    assert np.array_equal(descriptors[labels], bbox.pixels(image))
+    # Superpixels of different tiles (the tile border is at the row 256) are different
+    assert not np.isin(labels[256 - 50:], labels[:256 - 50]).any()
+
+    level_labels, _ = cache.superpixels(bbox, 1)
+    assert level_labels.shape == (120, 100)
@@ -0,0 +1,35 @@
+import gc
+
+import numpy as np
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.data.raster import Raster
+from bsmu.vision.core.journal import MaskJournal
+from bsmu.vision.core.palette import Palette
+from bsmu.vision.plugins.storages.mask_journal import MaskJournaling
+from bsmu.vision.plugins.writers.queue import FileWriteQueue
+from tests.plugins.writers.test_queue import _BlockingTextFileWriter
+
+
+def test_journal_of_released_mask_is_truncated_after_its_queued_save(tmp_path, wait_until):
+    file_write_queue = FileWriteQueue()
+    mask_journaling = MaskJournaling(file_write_queue)
+    file_write_queue.file_written.connect(mask_journaling.on_file_written)
+    mask_path = tmp_path / 'mask.txt'
+    journal_path = MaskJournal.path_for_mask(mask_path)
+
+    mask = Raster(np.zeros((100, 100), dtype=np.uint8), Palette.default_binary(), path=mask_path)
+    mask_journaling._track_mask(mask)
+    mask.pixels[10:20, 10:20] = 1
+    mask.emit_pixels_modified(BBox(10, 20, 10, 20))
+    wait_until(lambda: journal_path.exists())
+
+    blocking_writer = _BlockingTextFileWriter()
+    assert file_write_queue.enqueue(blocking_writer, mask.snapshot(), mask_path)
+    # The walker releases the mask before its save is written
+    del mask
+    gc.collect()
+
+    blocking_writer.writing_allowed.set()
+    wait_until(lambda: not file_write_queue.is_queued(mask_path) and not journal_path.exists())
+    assert mask_journaling._released_journals_by_mask_path == {}
@@ -0,0 +1,85 @@
+import pytest
+from PySide6.QtCore import QObject, Signal
+
+from bsmu.vision.plugins.undo import UndoManager
+from bsmu.vision.undo import UndoCommand
+
+
+class _Mdi(QObject):
+    subWindowActivated = Signal(object)
+
+    def activeSubWindow(self):
+        return None
+
+
+class _SizedCommand(UndoCommand):
+    def __init__(self, size: int):
+        super().__init__(f'{size} bytes')
+
+        self.size = size
+        self.compressing = False
+
+    def byte_size(self) -> int:
+        return self.size
+
+    @property
+    def is_compressing(self) -> bool:
+        return self.compressing
+
+    def release(self):
+        self.size = 0
+
+
+@pytest.fixture
+def undo_manager():
+    mdi = _Mdi()
+    undo_manager = UndoManager(mdi, 0, stack_size_limit=100)
+    sub_window = QObject()
+    undo_manager._activate_undo_stack_of_sub_window(sub_window)
+    yield undo_manager
+    undo_manager.clean()
+
+
+def test_oldest_commands_are_dropped_over_size_limit(undo_manager):
+    commands = [_SizedCommand(40) for _ in range(3)]
+    for command in commands:
+        undo_manager.push(command)
+    assert commands[0].isObsolete() and commands[0].size == 0
+    assert not any(command.isObsolete() for command in commands[1:])
+    assert undo_manager.stack_byte_size() == 80
+
+    # The last command is kept, even if it exceeds the limit alone
+    large_command = _SizedCommand(500)
+    undo_manager.push(large_command)
+    assert not large_command.isObsolete()
+    assert undo_manager.stack_byte_size() == 500
+
+
+def test_older_commands_are_dropped_with_a_dropped_command(undo_manager):
+    # Commands without data (e.g. spilled) are not dropped for memory, but they must not be undone
+    # over effects of a newer dropped command
+    empty_command = _SizedCommand(0)
+    undo_manager.push(empty_command)
+    commands = [_SizedCommand(60) for _ in range(2)]
+    for command in commands:
+        undo_manager.push(command)
+    assert commands[0].isObsolete()
+    assert empty_command.isObsolete()
+    assert not commands[1].isObsolete()
+
+
+def test_compressing_commands_are_not_dropped(undo_manager):
+    compressing_command = _SizedCommand(90)
+    compressing_command.compressing = True
+    undo_manager.push(compressing_command)
+    undo_manager.push(_SizedCommand(60))
+    assert not compressing_command.isObsolete()
+
+    memory_usage_changes = []
+    undo_manager.memory_usage_changed.connect(lambda: memory_usage_changes.append(True))
+    # Compression finished, but the command is still too large
+    compressing_command.compressing = False
+    compressing_command.size = 50
+    compressing_command.byte_size_changed_callback(compressing_command)
+    assert compressing_command.isObsolete()
+    assert memory_usage_changes
@@ -0,0 +1,152 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+from PySide6.QtGui import QUndoStack
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.data.raster import Raster
+from bsmu.vision.core.palette import Palette
+from bsmu.vision.plugins.tools.wsi_smart_brush import (
+    FinishModifyMaskCommand, Mode, ModifyMaskCommand, SimpleBrushDab, SmartBrushDab, WsiSmartBrushTool)
+from bsmu.vision.undo.spill import UndoSpillFile
+
+
+def test_merged_brush_stroke_is_undone_and_redone(wait_until):
+    mask = Raster(np.random.default_rng(0).integers(0, 3, size=(900, 1000), dtype=np.uint8), Palette.default_binary())
+    pixels_before_stroke = mask.pixels.copy()
+
+    undo_stack = QUndoStack()
+    for center in range(40, 900, 30):
+        dab_bbox = BBox(center - 40, center + 40, center - 40, center + 40).clipped_to_shape(mask.shape)
+        undo_stack.push(ModifyMaskCommand(mask, dab_bbox, dab_bbox.pixels(mask.pixels) == 0, 1))
+    undo_stack.push(FinishModifyMaskCommand())
+    pixels_after_stroke = mask.pixels.copy()
+    assert undo_stack.count() == 1
+
+    # Uncompressed data are used, while the compression is in progress
+    undo_stack.undo()
+    assert np.array_equal(mask.pixels, pixels_before_stroke)
+    undo_stack.redo()
+    assert np.array_equal(mask.pixels, pixels_after_stroke)
+
+    command = undo_stack.command(0)
+    wait_until(lambda: not command.is_compressing)
+
+    spill_file = UndoSpillFile()
+    assert command.spill(spill_file)
+    assert command.byte_size() == 0 and spill_file.size > 0
+    undo_stack.undo()
+    assert np.array_equal(mask.pixels, pixels_before_stroke)
+    undo_stack.redo()
+    assert np.array_equal(mask.pixels, pixels_after_stroke)
+    spill_file.close()
+
+
+class _SmartDabRecorder:
+    """Replaces computation and application of smart dabs, and records them in order."""
+
+    def __init__(self, tool: WsiSmartBrushTool):
+        self.events = []
+        self.computation_allowed = threading.Event()
+
+        tool._compute_smart_dab = self._compute_smart_dab
+        tool._apply_smart_dab = lambda smart_dab, result: self.events.append(('apply', smart_dab.pixel_coords))
+        tool._modify_mask_by_smart_dab = \
+            lambda smart_dab, result: self.events.append(('modify', smart_dab.pixel_coords))
+        tool._finish_modified_stroke = lambda: self.events.append(('finish',))
+        tool._draw_simple_brush = lambda simple_dab: self.events.append((simple_dab.mode.name.lower(),))
+
+    def _compute_smart_dab(self, smart_dab: SmartBrushDab):
+        self.computation_allowed.wait(10)
+        if smart_dab.pixel_coords == (-1, -1):
+            raise ValueError('Invalid dab')
+        return None
+
+
+def _create_tool() -> WsiSmartBrushTool:
+    settings = SimpleNamespace(min_radius=2, max_radius=100, radius_zoom_factor=1)
+    tool = WsiSmartBrushTool(None, None, settings)
+    # Masks of the activated tool
+    tool._tool_mask_layer = object()
+    return tool
+
+
+def _smart_dab(tool: WsiSmartBrushTool, mode: Mode, row: float) -> SmartBrushDab:
+    return SmartBrushDab(
+        tool._smart_dab_generation, mode, tool._STROKE_ID, (row, row), BBox(0, 1, 0, 1), None, None, None, 0,
+        None, None, None, None, None, None, 1, None)
+
+
+def test_latest_pending_smart_dab_is_computed(wait_until):
+    tool = _create_tool()
+    recorder = _SmartDabRecorder(tool)
+    for row in range(4):
+        tool._request_smart_dab(_smart_dab(tool, Mode.SHOW, row))
+    recorder.computation_allowed.set()
+
+    wait_until(lambda: tool._smart_dab_task is None)
+    assert recorder.events == [('apply', (0, 0)), ('apply', (3, 3)), ('finish',)]
+
+
+def test_draw_smart_dabs_are_applied_in_order_after_cancellation(wait_until):
+    tool = _create_tool()
+    recorder = _SmartDabRecorder(tool)
+    tool._request_smart_dab(_smart_dab(tool, Mode.DRAW, 0))
+    tool._request_smart_dab(_smart_dab(tool, Mode.DRAW, 1))
+    # SHOW dab does not replace the pending DRAW dab
+    tool._request_smart_dab(_smart_dab(tool, Mode.SHOW, 2))
+    # E.g. the mouse pointer leaves the viewport
+    tool._cancel_smart_dabs()
+    tool._request_smart_dab(_smart_dab(tool, Mode.SHOW, 3))
+    recorder.computation_allowed.set()
+
+    wait_until(lambda: tool._smart_dab_task is None)
+    assert recorder.events == [('modify', (0, 0)), ('modify', (1, 1)), ('apply', (3, 3)), ('finish',)]
+
+
+def test_stroke_is_finished_after_its_last_smart_dab_is_applied(wait_until):
+    tool = _create_tool()
+    recorder = _SmartDabRecorder(tool)
+    tool._start_stroke = lambda: setattr(tool, '_is_stroke_finished', False)
+    tool.mode = Mode.DRAW
+    tool._request_smart_dab(_smart_dab(tool, Mode.DRAW, 0))
+    tool._request_smart_dab(_smart_dab(tool, Mode.DRAW, 1))
+    tool.mode = Mode.SHOW
+    assert recorder.events == []
+    recorder.computation_allowed.set()
+
+    wait_until(lambda: tool._smart_dab_task is None)
+    assert recorder.events == [('apply', (0, 0)), ('apply', (1, 1)), ('finish',)]
+
+
+def test_failed_smart_dab_computation_does_not_block_next_dabs(wait_until):
+    tool = _create_tool()
+    recorder = _SmartDabRecorder(tool)
+    tool._request_smart_dab(_smart_dab(tool, Mode.SHOW, -1))
+    tool._request_smart_dab(_smart_dab(tool, Mode.SHOW, 1))
+    recorder.computation_allowed.set()
+
+    wait_until(lambda: tool._smart_dab_task is None)
+    assert recorder.events == [('apply', (-1, -1)), ('apply', (1, 1)), ('finish',)]
+
+
+def test_simple_dabs_modify_mask_after_computing_smart_dabs(wait_until):
+    tool = _create_tool()
+    recorder = _SmartDabRecorder(tool)
+    mask = np.zeros((10, 10), dtype=np.uint8)
+    # DRAW dab paints the mask, ERASE dab erases it
+    tool._modify_mask_by_smart_dab = lambda smart_dab, result: mask.fill(1)
+    tool._draw_simple_brush = lambda simple_dab: mask.fill(0)
+
+    tool._request_smart_dab(_smart_dab(tool, Mode.DRAW, 0))
+    tool._request_smart_dab(_smart_dab(tool, Mode.DRAW, 1))
+    # E.g. the right mouse button is pressed
+    tool._cancel_smart_dabs()
+    erase_dab = SimpleBrushDab(Mode.ERASE, tool._STROKE_ID + 1, BBox(0, 1, 0, 1), None, None, None, 1, None)
+    tool._request_simple_dab(erase_dab)
+    assert not mask.any()
+    recorder.computation_allowed.set()
+
+    wait_until(lambda: tool._smart_dab_task is None)
+    assert not mask.any()
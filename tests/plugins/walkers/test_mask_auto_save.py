@@ -0,0 +1,28 @@
+import gc
+
+import numpy as np
+
+from bsmu.vision.core.data.raster import Raster
+from bsmu.vision.core.palette import Palette
+from bsmu.vision.plugins.walkers.mask_auto_save import MaskAutoSaveOnWalk, MaskAutoSaveOnWalkConfig
+from bsmu.vision.plugins.writers.image.common import CommonImageFileWriter
+from bsmu.vision.plugins.writers.queue import FileWriteQueue
+from tests.plugins.writers.test_queue import _BlockingTextFileWriter, _raster
+
+
+def test_rejected_mask_save_is_deferred_until_queued_writes_are_finished(tmp_path, wait_until):
+    file_write_queue = FileWriteQueue(max_queued_bytes=1000)
+    mask_auto_save_on_walk = MaskAutoSaveOnWalk(MaskAutoSaveOnWalkConfig(), CommonImageFileWriter(), file_write_queue)
+    blocking_writer = _BlockingTextFileWriter()
+    assert file_write_queue.enqueue(blocking_writer, _raster(1, nbytes=2000), tmp_path / 'other.txt')
+
+    mask_path = tmp_path / 'mask.png'
+    mask = Raster(np.ones((100, 100), dtype=np.uint8), Palette.default_binary())
+    mask_auto_save_on_walk._save_mask_async(mask, mask_path)
+    assert not file_write_queue.is_queued(mask_path)
+    # The walker releases the mask
+    del mask
+    gc.collect()
+
+    blocking_writer.writing_allowed.set()
+    wait_until(lambda: mask_path.exists() and not file_write_queue.is_queued(mask_path))
@@ -0,0 +1,32 @@
+import pytest
+
+from bsmu.vision.core.data import Data
+from bsmu.vision.plugins.writers.file import FileWriter
+
+
+class _TextFileWriter(FileWriter):
+    _FORMATS = ('txt',)
+
+    def __init__(self, text: str, fail: bool = False):
+        super().__init__()
+
+        self._text = text
+        self._fail = fail
+
+    def _write_to_file(self, data: Data, path, **kwargs):
+        path.write_text(self._text[:len(self._text) // 2])
+        if self._fail:
+            raise OSError('Disk is full')
+        path.write_text(self._text)
+
+
+def test_interrupted_atomic_write_keeps_previous_file(tmp_path):
+    path = tmp_path / 'data.txt'
+    _TextFileWriter('previous').write_to_file(Data(), path, atomic=True)
+    assert path.read_text() == 'previous'
+
+    with pytest.raises(OSError):
+        _TextFileWriter('new text', fail=True).write_to_file(Data(), path, atomic=True)
+    assert path.read_text() == 'previous'
+    # Temporary file is removed
+    assert [file.name for file in tmp_path.iterdir()] == ['data.txt']
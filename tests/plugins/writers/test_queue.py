@@ -0,0 +1,93 @@
+import threading
+
+import numpy as np
+
+from bsmu.vision.core.data.raster import Raster
+from bsmu.vision.plugins.writers.file import FileWriter
+from bsmu.vision.plugins.writers.queue import FileWriteQueue
+
+
+class _BlockingTextFileWriter(FileWriter):
+    """Writes the first pixel of rasters as text. Waits for the permission before every write."""
+
+    _FORMATS = ('txt',)
+
+    def __init__(self):
+        super().__init__()
+
+        self.writing_allowed = threading.Event()
+        self.written_values = []
+
+    def _write_to_file(self, data: Raster, path, **kwargs):
+        self.writing_allowed.wait(10)
+        value = int(data.pixels[0, 0])
+        if value < 0:
+            raise OSError('Disk is full')
+        path.write_text(str(value))
+        self.written_values.append(value)
+
+
+def _raster(value: int, nbytes: int = 100) -> Raster:
+    return Raster(np.full((1, nbytes // 8), value, dtype=np.int64))
+
+
+def _connect_recorders(file_write_queue: FileWriteQueue) -> tuple[list, list]:
+    written, failed = [], []
+    file_write_queue.file_written.connect(lambda path, data: written.append((path.name, int(data.pixels[0, 0]))))
+    file_write_queue.file_writing_failed.connect(
+        lambda path, data, error_message: failed.append((path.name, int(data.pixels[0, 0]), error_message)))
+    return written, failed
+
+
+def test_pending_writes_of_path_are_coalesced(tmp_path, wait_until):
+    path = tmp_path / 'data.txt'
+    file_write_queue = FileWriteQueue()
+    written, failed = _connect_recorders(file_write_queue)
+    writer = _BlockingTextFileWriter()
+
+    for value in range(4):
+        assert file_write_queue.enqueue(writer, _raster(value), path)
+    writer.writing_allowed.set()
+
+    wait_until(lambda: not file_write_queue.is_queued(path))
+    # The first write was in progress, and only the latest of the next writes is performed
+    assert writer.written_values == [0, 3]
+    assert written == [('data.txt', 0), ('data.txt', 3)]
+    assert failed == []
+    assert path.read_text() == '3'
+    assert file_write_queue.queued_bytes == 0
+
+
+def test_writes_into_other_paths_are_rejected_over_the_size_limit(tmp_path, wait_until):
+    file_write_queue = FileWriteQueue(max_queued_bytes=250)
+    written, _ = _connect_recorders(file_write_queue)
+    writer = _BlockingTextFileWriter()
+
+    # Any write is accepted into the empty queue
+    assert file_write_queue.enqueue(writer, _raster(1, nbytes=400), tmp_path / 'a.txt')
+    assert not file_write_queue.can_enqueue(tmp_path / 'b.txt', 100)
+    assert not file_write_queue.enqueue(writer, _raster(2), tmp_path / 'b.txt')
+    # Writes into the queued path are accepted
+    assert file_write_queue.enqueue(writer, _raster(3, nbytes=400), tmp_path / 'a.txt')
+    assert file_write_queue.enqueue(writer, _raster(4, nbytes=400), tmp_path / 'a.txt')
+    writer.writing_allowed.set()
+
+    wait_until(lambda: not file_write_queue.is_queued(tmp_path / 'a.txt'))
+    assert written == [('a.txt', 1), ('a.txt', 4)]
+    assert file_write_queue.can_enqueue(tmp_path / 'b.txt', 100)
+
+
+def test_failed_write_is_reported_and_next_write_of_path_is_performed(tmp_path, wait_until):
+    path = tmp_path / 'data.txt'
+    file_write_queue = FileWriteQueue()
+    written, failed = _connect_recorders(file_write_queue)
+    writer = _BlockingTextFileWriter()
+
+    assert file_write_queue.enqueue(writer, _raster(-1), path)
+    assert file_write_queue.enqueue(writer, _raster(5), path)
+    writer.writing_allowed.set()
+
+    wait_until(lambda: not file_write_queue.is_queued(path))
+    assert failed == [('data.txt', -1, 'Disk is full')]
+    assert written == [('data.txt', 5)]
+    assert path.read_text() == '5'
@@ -0,0 +1,83 @@
+import logging
+
+import numpy as np
+import pytest
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.data.raster import Raster
+from bsmu.vision.core.palette import Palette
+from bsmu.vision.plugins.writers.image.common import CommonImageFileWriter
+from bsmu.vision.plugins.writers.queue import FileWriteQueue
+
+tifffile = pytest.importorskip('tifffile')
+
+from bsmu.vision.plugins.writers.image.tiled_mask import TiledTiffMaskFileWriter  # noqa: E402
+
+
+def test_only_modified_tiles_are_appended(tmp_path):
+    path = tmp_path / 'mask.tif'
+    mask = Raster(np.zeros((1000, 700), dtype=np.uint8), Palette.default_binary())
+    writer = TiledTiffMaskFileWriter()
+    writer.write_to_file(mask, path)
+    full_file_size = path.stat().st_size
+
+    mask.pixels[950:1000, 600:700] = 1
+    modified_tiles = np.zeros((4, 3), dtype=bool)
+    modified_tiles[3, 2] = True
+    writer.write_to_file(mask, path, modified_tiles=modified_tiles)
+
+    assert np.array_equal(tifffile.imread(path), mask.pixels)
+    # Only one (edge) tile was appended
+    assert path.stat().st_size - full_file_size < 1000
+
+    mask.pixels[0:10, 0:10] = 1
+    modified_tiles.fill(False)
+    modified_tiles[0, 0] = True
+    writer.write_to_file(mask, path, modified_tiles=modified_tiles)
+    assert np.array_equal(tifffile.imread(path), mask.pixels)
+
+
+def test_write_queue_passes_modified_tiles_of_snapshot_sources(tmp_path, wait_until, caplog):
+    caplog.set_level(logging.INFO)
+    path = tmp_path / 'mask.tif'
+    mask = Raster(np.zeros((1000, 700), dtype=np.uint8), Palette.default_binary())
+    file_write_queue = FileWriteQueue()
+    file_write_queue.add_preferred_writer(TiledTiffMaskFileWriter())
+
+    def save_snapshot():
+        assert file_write_queue.enqueue(CommonImageFileWriter(), mask.snapshot(), path, source=mask)
+        wait_until(lambda: not file_write_queue.is_queued(path))
+
+    save_snapshot()
+    full_file_size = path.stat().st_size
+    assert np.array_equal(tifffile.imread(path), mask.pixels)
+
+    bbox = BBox(left=600, right=700, top=950, bottom=1000)
+    bbox.pixels(mask.pixels)[...] = 1
+    mask.emit_pixels_modified(bbox)
+    caplog.clear()
+    save_snapshot()
+    assert np.array_equal(tifffile.imread(path), mask.pixels)
+    assert 'Write 1 modified tiles' in caplog.text
+    # Only one (edge) tile was appended
+    assert path.stat().st_size - full_file_size < 1000
+
+    # Pixels replaced without the signal are written fully
+    mask.pixels = np.ones_like(mask.pixels)
+    caplog.clear()
+    save_snapshot()
+    assert np.array_equal(tifffile.imread(path), mask.pixels)
+    assert 'Write all tiles' in caplog.text
+
+
+def test_layouts_only_of_recently_written_files_are_kept(tmp_path):
+    mask = Raster(np.zeros((300, 300), dtype=np.uint8), Palette.default_binary())
+    writer = TiledTiffMaskFileWriter()
+    writer.MAX_FILE_STATE_COUNT = 2
+    paths = [tmp_path / f'mask{i}.tif' for i in range(3)]
+    for path in paths:
+        writer.write_to_file(mask, path)
+
+    assert writer._file_state(paths[0]) is None
+    assert writer._file_state(paths[1]) is not None
+    assert writer._file_state(paths[2]) is not None
@@ -0,0 +1,35 @@
+import numpy as np
+from PySide6.QtGui import QUndoStack
+
+from bsmu.vision.core.bbox import BBox
+from bsmu.vision.core.data.raster import Raster
+from bsmu.vision.undo.data.raster import ModifyRasterCommand
+from bsmu.vision.undo.spill import UndoSpillFile
+
+
+def test_only_touched_tiles_are_saved_and_swapped():
+    raster = Raster(np.random.default_rng(0).integers(0, 255, size=(1000, 700, 3), dtype=np.uint8))
+    pixels_before = raster.pixels.copy()
+
+    command = ModifyRasterCommand(raster)
+    for bbox in (BBox(10, 60, 10, 60), BBox(30, 90, 40, 300), BBox(650, 700, 950, 1000)):
+        command.save_pixels(bbox)
+        bbox.pixels(raster.pixels)[...] = 7
+    pixels_after = raster.pixels.copy()
+    # Tiles (0, 0), (1, 0), (2, 0) and (7, 5)
+    assert command.byte_size() == 3 * 128 * 128 * 3 + 104 * 60 * 3
+
+    undo_stack = QUndoStack()
+    undo_stack.push(command)
+    assert np.array_equal(raster.pixels, pixels_after)
+
+    spill_file = UndoSpillFile()
+    assert command.spill(spill_file)
+    for _ in range(2):
+        undo_stack.undo()
+        assert np.array_equal(raster.pixels, pixels_before)
+        undo_stack.redo()
+        assert np.array_equal(raster.pixels, pixels_after)
+        # Spilled tiles are not kept in memory after the swap
+        assert command.byte_size() == 0
+    spill_file.close()